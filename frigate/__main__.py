@@ -1,10 +1,21 @@
+import os
+import sys
+import tempfile
+
 from frigate.utils.datasets import save_dataframe
 from frigate.utils.kowalski import get_candidates_from_kowalski
-from frigate.utils.parsers import main_parser_args
+from frigate.utils.iobench import (
+    benchmark_output_options,
+    recommend_output_options,
+    sample_dataframe,
+    save_io_recommendation,
+)
+from frigate.utils.parsers import bench_io_parser_args, main_parser_args
 from frigate.utils.skyportal import (
     get_candids_per_filter_from_skyportal,
     get_source_metadata_from_skyportal,
 )
+from frigate.utils.summary import compute_night_summary, save_night_summary
 
 
 def str_to_bool(value):
@@ -17,35 +28,7 @@ def str_to_bool(value):
     raise ValueError(f"{value} is not a valid boolean value")
 
 
-def process_candidates(args):
-    # GET CANDIDATES FROM KOWALSKI
-    candidates, err = get_candidates_from_kowalski(
-        args.start,
-        args.end,
-        args.programids,
-        n_threads=args.n_threads,
-        low_memory=args.low_memory,
-        low_memory_format=args.output_format,
-        low_memory_dir=args.output_directory,
-        format=args.output_format,
-        verbose=args.verbose,
-    )
-    if err or candidates is None:
-        print(err)
-        exit(1)
-
-    candids_per_filter, err = get_candids_per_filter_from_skyportal(
-        args.start,
-        args.end,
-        args.groupids,
-        args.filterids,
-        saved=False,
-        verbose=args.verbose,
-    )
-    if err or candids_per_filter is None:
-        print(err)
-        exit(1)
-
+def add_passed_filters(candidates, candids_per_filter):
     # candids_per_filter is a dictionary with keys being filterIDs and values being the corresponding candidates
     # candid value, that we find in the candidates dataframe.
     # add a "passed_filters" column to the candidates dataframe, which is a list of filterIDs that the candidate passed
@@ -64,18 +47,10 @@ def process_candidates(args):
         except KeyError:
             print(f"Candid {candids} not found in candidates dataframe, skipping...")
             continue
+    return candidates
 
-    # for each source that passed at least one filter, get metadata from SkyPortal
-    if args.verbose:
-        print("Getting source metadata from SkyPortal...")
-    object_ids = candidates[candidates["passed_filters"].apply(len) > 0][
-        "objectId"
-    ].unique()
-    source_metadata, err = get_source_metadata_from_skyportal(object_ids)
-    if err or source_metadata is None:
-        print(err)
-        exit(1)
 
+def add_source_metadata(candidates, source_metadata):
     # ADD SOURCE METADATA TO CANDIDATES
     candidates["groups"] = [[] for _ in range(len(candidates))]
     candidates["classifications"] = [[] for _ in range(len(candidates))]
@@ -98,6 +73,59 @@ def process_candidates(args):
         except KeyError:
             print(f"ObjectID {objectId} not found in candidates dataframe, skipping...")
             continue
+    return candidates
+
+
+def process_candidates(args):
+    # GET CANDIDATES FROM KOWALSKI
+    candidates, err = get_candidates_from_kowalski(
+        args.start,
+        args.end,
+        args.programids,
+        n_threads=args.n_threads,
+        low_memory=args.low_memory,
+        low_memory_format=args.output_format,
+        low_memory_dir=args.output_directory,
+        format=args.output_format,
+        verbose=args.verbose,
+    )
+    if err or candidates is None:
+        print(err)
+        exit(1)
+
+    candids_per_filter, err = get_candids_per_filter_from_skyportal(
+        args.start,
+        args.end,
+        args.groupids,
+        args.filterids,
+        saved=False,
+        verbose=args.verbose,
+    )
+    if err or candids_per_filter is None:
+        print(err)
+        exit(1)
+
+    candidates = add_passed_filters(candidates, candids_per_filter)
+
+    # for each source that passed at least one filter, get metadata from SkyPortal
+    if args.verbose:
+        print("Getting source metadata from SkyPortal...")
+    object_ids = candidates[candidates["passed_filters"].apply(len) > 0][
+        "objectId"
+    ].unique()
+    source_metadata, err = get_source_metadata_from_skyportal(object_ids)
+    if err or source_metadata is None:
+        print(err)
+        exit(1)
+
+    candidates = add_source_metadata(candidates, source_metadata)
+
+    # CLUSTER THE ALERTS SPATIALLY
+    # with a healpix pixel column, sorted by it, row groups cover small regions of the sky
+    if args.healpix_nside:
+        from frigate.utils.spatial import sort_by_healpix
+
+        candidates = sort_by_healpix(candidates, args.healpix_nside)
 
     # SAVE CANDIDATES TO DISK
     # filename: <start>_<end>_<programids>.<output_format> (ext added by save_dataframe function)
@@ -109,12 +137,82 @@ def process_candidates(args):
         output_compression=args.output_compression,
         output_compression_level=args.output_compression_level,
         output_directory=args.output_directory,
+        row_group_size=args.row_group_size,
     )
 
     if args.verbose:
         print(f"Saved candidates to {filepath}")
 
+    # INDEX THE OBJECTIDS AND CANDIDS OF THE NIGHT
+    if args.index:
+        from frigate.utils.alert_index import ALERT_INDEX_DIRECTORY, AlertIndex
+
+        AlertIndex(os.path.join(args.output_directory, ALERT_INDEX_DIRECTORY)).add(
+            filepath
+        )
+
+    # APPEND TO THE LIGHT CURVE STORE
+    # one segment per night, named like the night file so that re-runs replace it
+    if args.lightcurves:
+        from frigate.utils.lightcurves import LightCurveStore
+
+        LightCurveStore(args.lightcurves_directory).append(candidates, filename)
+        if args.verbose:
+            print(f"Appended light curves to {args.lightcurves_directory}")
+
+    # SAVE NIGHT SUMMARY TO DISK
+    # small artifact with the aggregates downstream scripts would otherwise recompute
+    if args.summary:
+        summary = compute_night_summary(candidates, histograms=args.summary_columns)
+        summary_filepath = save_night_summary(summary, filepath)
+        if args.verbose:
+            print(f"Saved night summary to {summary_filepath}")
+
+
+def bench_io(args):
+    # SAMPLE A NIGHT
+    if args.dataset_path is not None:
+        df = sample_dataframe(args.dataset_path, args.sample_size)
+    else:
+        from frigate.utils.synthetic import SyntheticAlerts
+
+        df = SyntheticAlerts(nb_alerts=args.sample_size).dataframe()
+    if args.verbose:
+        source = args.dataset_path or "synthetic alerts"
+        print(f"Benchmarking output options on {len(df)} alerts from {source}")
+
+    # MEASURE EACH FORMAT/COMPRESSION/LEVEL
+    os.makedirs(args.output_directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=args.output_directory) as directory:
+        results = benchmark_output_options(
+            df,
+            directory,
+            formats=args.formats,
+            repeat=args.repeat,
+            verbose=args.verbose,
+        )
+
+    recommendation, err = recommend_output_options(results, args.objective)
+    if err:
+        print(err)
+        exit(1)
+    print(
+        f"Recommended ({args.objective}): --output_format {recommendation['output_format']} "
+        f"--output_compression {recommendation['output_compression']} "
+        f"--output_compression_level {recommendation['output_compression_level']}"
+    )
+
+    if args.save:
+        filepath = save_io_recommendation(recommendation, args.recommendation_path)
+        if args.verbose:
+            print(
+                f"Saved recommendation to {filepath}, use it with --output_format auto"
+            )
+
 
 if __name__ == "__main__":
-    args = main_parser_args()
-    process_candidates(args)
+    if len(sys.argv) > 1 and sys.argv[1] == "bench-io":
+        bench_io(bench_io_parser_args(sys.argv[2:]))
+    else:
+        args = main_parser_args()
+        process_candidates(args)
@@ -0,0 +1,311 @@
+import hashlib
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from frigate.utils.datasets import infer_format
+from frigate.utils.files import atomic_path
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+ALERT_INDEX_DIRECTORY = ".alert_index"
+
+# small row groups in the index files, so that a lookup only reads the few
+# row groups whose objectId statistics can contain what we look for
+INDEX_ROW_GROUP_SIZE = 16384
+
+# name of the index merging the index files of all the datasets
+COMPACTED_INDEX = "compacted"
+
+# each index file has a copy sorted by candid in this subdirectory, so that
+# lookups by candid can prune row groups too
+CANDID_INDEX_DIRECTORY = "by_candid"
+
+
+def _row_groups(filepath: str, format: str) -> np.ndarray:
+    # number of rows in each row group (parquet) or record batch (feather)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if format == "parquet":
+        metadata = pq.ParquetFile(filepath).metadata
+        return np.array(
+            [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)],
+            dtype=np.int64,
+        )
+    elif format == "feather":
+        with pa.memory_map(filepath) as source:
+            reader = pa.ipc.open_file(source)
+            return np.array(
+                [
+                    reader.get_batch(i).num_rows
+                    for i in range(reader.num_record_batches)
+                ],
+                dtype=np.int64,
+            )
+    return None
+
+
+def _read_columns(filepath: str, format: str, columns: list) -> "pd.DataFrame":
+    import pandas as pd
+
+    if format == "parquet":
+        return pd.read_parquet(filepath, columns=columns)
+    elif format == "feather":
+        return pd.read_feather(filepath, columns=columns)
+    from frigate.utils.datasets import csv_compression
+
+    return pd.read_csv(filepath, usecols=columns, compression=csv_compression(filepath))
+
+
+def build_file_index(filepath: str, format=None) -> "pd.DataFrame":
+    # location of each alert of a dataset: objectId, candid, row group and row in
+    # that group.
+    # csv files have no row groups, their rows are all in "row group" 0
+    import pandas as pd
+
+    format = format or infer_format(filepath)
+    data = _read_columns(filepath, format, ["objectId", "candid"])
+    rows = np.arange(len(data), dtype=np.int64)
+    sizes = _row_groups(filepath, format)
+    if sizes is None or len(sizes) == 0:
+        row_group = np.zeros(len(data), dtype=np.int32)
+        row = rows
+    else:
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        row_group = (np.searchsorted(starts, rows, side="right") - 1).astype(np.int32)
+        row = rows - starts[row_group]
+    index = pd.DataFrame(
+        {
+            "objectId": data["objectId"].astype(str).to_numpy(),
+            "candid": data["candid"].to_numpy(dtype=np.int64),
+            "row_group": row_group,
+            "row": row.astype(np.int64),
+        }
+    )
+    return index.sort_values("objectId", kind="stable", ignore_index=True)
+
+
+def _take(table, locations: "pd.DataFrame", row_groups, sizes) -> "pd.DataFrame":
+    # rows of the matches in the concatenation of the row groups we read
+    starts = dict(zip(row_groups, np.concatenate([[0], np.cumsum(sizes)[:-1]])))
+    rows = np.sort(
+        locations["row"].to_numpy() + locations["row_group"].map(starts).to_numpy()
+    )
+    return table.take(rows).to_pandas()
+
+
+def _segments(directory: str) -> list:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(directory)
+        if name.endswith(".parquet") and not name.startswith(".tmp_")
+    )
+
+
+def _write_sorted(index: "pd.DataFrame", directory: str, name: str) -> str:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = os.path.join(directory, f"{name}.parquet")
+    table = pa.Table.from_pandas(index, preserve_index=False)
+    with atomic_path(path) as tmp_path:
+        pq.write_table(
+            table,
+            tmp_path,
+            row_group_size=INDEX_ROW_GROUP_SIZE,
+            use_dictionary=["file"] if "file" in index.columns else False,
+        )
+    return path
+
+
+class AlertIndex:
+    # maps objectIds and candids to the file, row group and row they are stored at,
+    # so that the alerts of a few objects are read from a few row groups instead of
+    # scanning every night. One index file per dataset, named after it and a hash
+    # of its path, sorted by objectId (with a copy sorted by candid), can be merged
+    # into a single one with compact()
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.candid_directory = os.path.join(directory, CANDID_INDEX_DIRECTORY)
+
+    @property
+    def segments(self) -> list:
+        return _segments(self.directory)
+
+    def _write(self, index: "pd.DataFrame", name: str) -> str:
+        # the candid-sorted copy is written first, the objectId-sorted file being
+        # the one listed in segments
+        _write_sorted(
+            index.sort_values("candid", kind="stable", ignore_index=True),
+            self.candid_directory,
+            name,
+        )
+        return _write_sorted(index, self.directory, name)
+
+    def _segment_path(self, name: str, by_candid=False) -> str:
+        # indexes written before the candid-sorted copies existed only have the
+        # objectId-sorted file
+        if by_candid:
+            path = os.path.join(self.candid_directory, name)
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.directory, name)
+
+    def _file(self, filepath: str) -> str:
+        # paths are relative to the index directory, so that the data and its
+        # index can be moved together
+        return os.path.relpath(
+            os.path.abspath(filepath), os.path.abspath(self.directory)
+        )
+
+    def segment_name(self, filepath: str) -> str:
+        # datasets with the same file name in different directories (e.g. the same
+        # night in two output directories) get their own index file
+        digest = hashlib.sha256(self._file(filepath).encode()).hexdigest()[:12]
+        return f"{os.path.basename(filepath)}.{digest}"
+
+    def add(self, filepath: str, format=None) -> str:
+        # (re)index a dataset, to be called whenever it is saved
+        index = build_file_index(filepath, format)
+        file = self._file(filepath)
+        index["file"] = file
+        # the locations of a previous version of this dataset merged in a
+        # compacted index, or in an index file named after its basename only (as
+        # they were before), are stale
+        self._drop_from_compacted(file)
+        self._drop_legacy_segment(filepath, file)
+        return self._write(index, self.segment_name(filepath))
+
+    def _drop_from_compacted(self, file: str):
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        for name in self.segments:
+            if not name.startswith(COMPACTED_INDEX):
+                continue
+            path = os.path.join(self.directory, name)
+            files = pq.read_table(path, columns=["file"])["file"]
+            if not pc.any(pc.equal(files.cast("string"), file)).as_py():
+                continue
+            index = pq.read_table(path).to_pandas()
+            index["file"] = index["file"].astype(str)
+            self._write(index[index["file"] != file], name[: -len(".parquet")])
+
+    def _drop_legacy_segment(self, filepath: str, file: str):
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        name = os.path.basename(filepath)
+        path = os.path.join(self.directory, f"{name}.parquet")
+        if not os.path.exists(path):
+            return
+        files = pq.read_table(path, columns=["file"])["file"]
+        if pc.all(pc.equal(files.cast("string"), file)).as_py():
+            self._remove_segment(name)
+
+    def _remove_segment(self, name: str):
+        for directory in [self.candid_directory, self.directory]:
+            path = os.path.join(directory, f"{name}.parquet")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def remove(self, filepath: str):
+        self._drop_legacy_segment(filepath, self._file(filepath))
+        self._remove_segment(self.segment_name(filepath))
+
+    def locate(self, objectIds=None, candids=None) -> "pd.DataFrame":
+        # locations of the alerts matching the objectIds AND the candids (when both
+        # are given, an alert must match both to be returned)
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        if objectIds is None and candids is None:
+            raise ValueError("objectIds or candids are required")
+        filters = []
+        if objectIds is not None:
+            filters.append(("objectId", "in", [str(o) for o in objectIds]))
+        if candids is not None:
+            filters.append(("candid", "in", [int(c) for c in candids]))
+
+        locations = []
+        for name in self.segments:
+            # row groups are pruned with their min/max statistics, read from the
+            # copy sorted by the column we look up
+            path = self._segment_path(name, by_candid=objectIds is None)
+            table = pq.read_table(path, filters=filters)
+            if table.num_rows > 0:
+                locations.append(table.to_pandas())
+        if len(locations) == 0:
+            return pd.DataFrame(
+                columns=["objectId", "candid", "row_group", "row", "file"]
+            )
+        locations = pd.concat(locations, ignore_index=True)
+        locations["file"] = locations["file"].astype(str)
+        return locations
+
+    def load(self, objectIds=None, candids=None, columns=None) -> "pd.DataFrame":
+        # the alerts of these objectIds and candids (see locate), only reading the
+        # row groups they are in
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        locations = self.locate(objectIds, candids)
+        frames = []
+        for file, group in locations.groupby("file", sort=True):
+            filepath = os.path.normpath(os.path.join(self.directory, file))
+            format = infer_format(filepath)
+            row_groups = np.unique(group["row_group"].to_numpy())
+            if format == "parquet":
+                parquet_file = pq.ParquetFile(filepath)
+                metadata = parquet_file.metadata
+                sizes = [metadata.row_group(int(i)).num_rows for i in row_groups]
+                table = parquet_file.read_row_groups(
+                    row_groups.tolist(), columns=columns
+                )
+                frames.append(_take(table, group, row_groups, sizes))
+            elif format == "feather":
+                with pa.memory_map(filepath) as source:
+                    reader = pa.ipc.open_file(source)
+                    batches = [reader.get_batch(int(i)) for i in row_groups]
+                    table = pa.Table.from_batches(batches)
+                    if columns is not None:
+                        table = table.select(columns)
+                    sizes = [batch.num_rows for batch in batches]
+                    # copied out of the memory map before it is closed
+                    frames.append(_take(table, group, row_groups, sizes))
+            else:
+                from frigate.utils.datasets import load_dataframe
+
+                data = load_dataframe(filepath, format)
+                data = data.iloc[np.sort(group["row"].to_numpy())]
+                frames.append(data[columns] if columns is not None else data)
+        if len(frames) == 0:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def compact(self, name=COMPACTED_INDEX) -> str:
+        # merge all the index files into one sorted by objectId, so that a lookup
+        # reads a single file
+        import pandas as pd
+
+        names = self.segments
+        if len(names) <= 1:
+            return os.path.join(self.directory, names[0]) if names else None
+        index = pd.concat(
+            [pd.read_parquet(os.path.join(self.directory, n)) for n in names],
+            ignore_index=True,
+        )
+        index["file"] = index["file"].astype(str)
+        index = index.drop_duplicates(["file", "candid"], keep="last")
+        index = index.sort_values("objectId", kind="stable", ignore_index=True)
+        path = self._write(index, name)
+        for n in names:
+            if n != f"{name}.parquet":
+                self._remove_segment(n[: -len(".parquet")])
+        return path
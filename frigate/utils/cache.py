@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from frigate.utils.dates import jd_now
+
+# the cache is configured through the environment, so that the pool workers
+# running the queries see the same configuration as the main process.
+# it is disabled unless a directory is set
+QUERY_CACHE_DIR_ENV = "FRIGATE_QUERY_CACHE_DIR"
+QUERY_CACHE_MAX_SIZE_ENV = "FRIGATE_QUERY_CACHE_MAX_SIZE"
+QUERY_CACHE_TTL_ENV = "FRIGATE_QUERY_CACHE_TTL"
+
+DEFAULT_QUERY_CACHE_MAX_SIZE = 10 * 1024**3  # bytes
+# the eviction frees the cache down to this fraction of its max size, so that it
+# doesn't have to run again on the next write
+EVICTION_TARGET = 0.9
+# each process keeps a running estimate of the cache size, and counts it again
+# every this many writes to see those of the other processes
+RECOUNT_EVERY = 1000
+DEFAULT_QUERY_CACHE_TTL = 600  # seconds, for queries on nights that are not closed
+# a night is closed (no new alerts will be ingested) a day after it ended
+CLOSED_NIGHT_DELAY = 1.0  # days
+
+# fields holding the time of an alert, which tell us if a query covers closed nights only
+JD_FIELDS = ["candidate.jd"]
+
+CACHE_SUFFIX = ".json.gz"
+
+# directory -> (estimated size of the cache in bytes, writes since it was counted)
+_cache_sizes = {}
+
+
+def query_cache_dir():
+    return os.getenv(QUERY_CACHE_DIR_ENV) or None
+
+
+def query_key(query: dict, host=None, token=None) -> str:
+    # canonical hash of the query document, of the instance it is sent to and of the
+    # account sending it (accounts with different programid access get different
+    # results), only a hash of the token goes in the key
+    if host is None:
+        host = os.getenv("KOWALSKI_HOST", "kowalski.caltech.edu")
+        host = f"{host}:{os.getenv('KOWALSKI_PORT', 443)}"
+    if token is None:
+        token = os.getenv("KOWALSKI_TOKEN", "")
+    account = hashlib.sha256(token.encode()).hexdigest()
+    canonical = json.dumps(
+        {"host": host, "account": account, "query": query},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _jd_upper_bounds(value, bounds):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in JD_FIELDS and isinstance(item, dict):
+                for op in ["$lt", "$lte"]:
+                    if isinstance(item.get(op), (int, float)):
+                        bounds.append(float(item[op]))
+            else:
+                _jd_upper_bounds(item, bounds)
+    elif isinstance(value, list):
+        for item in value:
+            _jd_upper_bounds(item, bounds)
+    return bounds
+
+
+def query_ttl(query: dict):
+    # None if the query only covers closed nights (its results can't change anymore),
+    # otherwise the time to live of its results in seconds
+    bounds = _jd_upper_bounds(query, [])
+    if len(bounds) > 0 and max(bounds) + CLOSED_NIGHT_DELAY <= jd_now():
+        return None
+    return float(os.getenv(QUERY_CACHE_TTL_ENV, DEFAULT_QUERY_CACHE_TTL))
+
+
+def _entry_path(directory, key):
+    return os.path.join(directory, key[:2], f"{key}{CACHE_SUFFIX}")
+
+
+def get_cached_response(query: dict):
+    directory = query_cache_dir()
+    if directory is None:
+        return None
+    path = _entry_path(directory, query_key(query))
+    try:
+        with gzip.open(path, "rt") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # corrupted entry, e.g. a process killed while writing it without the rename
+        _remove(path)
+        return None
+    expires = entry.get("expires")
+    if expires is not None and expires < time.time():
+        _remove(path)
+        return None
+    # the modification time is what the LRU eviction goes by
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return entry.get("response")
+
+
+def put_cached_response(query: dict, response) -> bool:
+    directory = query_cache_dir()
+    if directory is None:
+        return False
+    # we only cache successful responses, errors should be retried
+    if not isinstance(response, dict) or response.get("status") != "success":
+        return False
+    ttl = query_ttl(query)
+    path = _entry_path(directory, query_key(query))
+    entry = {
+        "query": query,
+        "created": time.time(),
+        "expires": None if ttl is None else time.time() + ttl,
+        "response": response,
+    }
+    # write to a temporary file first, so that other processes never read a partial entry
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(tmp_path, "wt", compresslevel=3) as f:
+            json.dump(entry, f, default=str)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Failed to cache query response: {e}")
+        _remove(tmp_path)
+        return False
+    _track_size(directory, size)
+    return True
+
+
+def _max_size():
+    return int(os.getenv(QUERY_CACHE_MAX_SIZE_ENV, DEFAULT_QUERY_CACHE_MAX_SIZE))
+
+
+def _track_size(directory, size):
+    # the cache is only listed when this process' estimate of its size goes over
+    # the max size (or every RECOUNT_EVERY writes), not on every write
+    estimate, writes = _cache_sizes.get(directory, (None, 0))
+    if estimate is None or writes >= RECOUNT_EVERY:
+        estimate, writes = sum(size for _, size, _ in _entries(directory)), 0
+    else:
+        estimate, writes = estimate + size, writes + 1
+    max_size = _max_size()
+    if estimate > max_size:
+        _, estimate = _evict(directory, int(max_size * EVICTION_TARGET))
+    _cache_sizes[directory] = (estimate, writes)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _entries(directory):
+    entries = []
+    for subdirectory in os.scandir(directory):
+        if not subdirectory.is_dir():
+            continue
+        for entry in os.scandir(subdirectory.path):
+            if entry.name.endswith(CACHE_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # removed by another process in the meantime
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def evict_query_cache(directory=None, max_size=None) -> int:
+    # remove the least recently used entries until the cache fits in max_size bytes
+    directory = directory or query_cache_dir()
+    if directory is None or not os.path.isdir(directory):
+        return 0
+    if max_size is None:
+        max_size = _max_size()
+    removed, total = _evict(directory, max_size)
+    _cache_sizes[directory] = (total, 0)
+    return removed
+
+
+def _evict(directory, max_size) -> (int, int):
+    # number of entries removed, and size of the cache left
+    entries = _entries(directory)
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        _remove(path)
+        total -= size
+        removed += 1
+    return removed, total
+
+
+def clear_query_cache(directory=None) -> int:
+    directory = directory or query_cache_dir()
+    if directory is None or not os.path.isdir(directory):
+        return 0
+    entries = _entries(directory)
+    for _, _, path in entries:
+        _remove(path)
+    _cache_sizes.pop(directory, None)
+    return len(entries)
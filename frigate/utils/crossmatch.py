@@ -0,0 +1,138 @@
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from frigate.utils.healpix import unit_vectors
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+ARCSEC = 1 / 3600
+
+
+def _chord(radius_arcsec: float) -> float:
+    # distance between unit vectors separated by an angle of radius_arcsec
+    return 2 * np.sin(np.radians(radius_arcsec * ARCSEC) / 2)
+
+
+def _angle(chord) -> np.ndarray:
+    # inverse of _chord, in arcsec
+    return np.degrees(2 * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))) / ARCSEC
+
+
+class ReferenceCatalog:
+    # a reference catalog (e.g. an exported subset of Gaia, PS1, CLU or SIMBAD) held
+    # in memory with a KD-tree on the unit vectors of its positions, so that a whole
+    # night of alerts is crossmatched in one vectorized pass
+    def __init__(self, name: str, ra, dec, columns=None):
+        self.name = name
+        self.ra = np.asarray(ra, dtype=np.float64)
+        self.dec = np.asarray(dec, dtype=np.float64)
+        self.columns = {
+            key: np.asarray(values) for key, values in (columns or {}).items()
+        }
+        self._tree = None
+
+    def __len__(self):
+        return len(self.ra)
+
+    @property
+    def tree(self):
+        from scipy.spatial import cKDTree
+
+        if self._tree is None:
+            self._tree = cKDTree(unit_vectors(self.ra, self.dec))
+        return self._tree
+
+    @classmethod
+    def from_dataframe(cls, name, df: "pd.DataFrame", ra_column="ra", dec_column="dec"):
+        columns = {
+            c: df[c].to_numpy() for c in df.columns if c not in (ra_column, dec_column)
+        }
+        return cls(name, df[ra_column].to_numpy(), df[dec_column].to_numpy(), columns)
+
+    @classmethod
+    def from_file(
+        cls, filepath: str, name=None, ra_column="ra", dec_column="dec", columns=None
+    ):
+        # parquet, feather or csv export of a catalog
+        from frigate.utils.datasets import load_dataframe
+
+        df = load_dataframe(filepath)
+        if columns is not None:
+            df = df[list(dict.fromkeys([ra_column, dec_column, *columns]))]
+        name = name or os.path.basename(filepath).rsplit(".", 1)[0]
+        return cls.from_dataframe(name, df, ra_column, dec_column)
+
+    def nearest(self, ra, dec, radius=3.0, n_workers=-1) -> (np.ndarray, np.ndarray):
+        # index of the nearest source within radius (arcsec) of each position, -1 if
+        # there is none, and its separation in arcsec (nan if there is none)
+        if len(self) == 0:
+            return np.full(len(ra), -1, dtype=np.int64), np.full(len(ra), np.nan)
+        distances, indexes = self.tree.query(
+            unit_vectors(ra, dec),
+            k=1,
+            distance_upper_bound=_chord(radius),
+            workers=n_workers,
+        )
+        matched = np.isfinite(distances)
+        indexes = np.where(matched, indexes, -1).astype(np.int64)
+        separations = np.where(matched, _angle(np.where(matched, distances, 0)), np.nan)
+        return indexes, separations
+
+    def within(
+        self, ra, dec, radius=3.0, n_workers=-1
+    ) -> (np.ndarray, np.ndarray, np.ndarray):
+        # all the (position, source) pairs closer than radius (arcsec), as flat arrays of
+        # position indexes, source indexes and separations in arcsec, sorted by position
+        vectors = unit_vectors(ra, dec)
+        if len(self) == 0 or len(vectors) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0)
+        matches = self.tree.query_ball_point(vectors, _chord(radius), workers=n_workers)
+        counts = np.fromiter(
+            (len(m) for m in matches), dtype=np.int64, count=len(matches)
+        )
+        positions = np.repeat(np.arange(len(matches)), counts)
+        if counts.sum() == 0:
+            return positions, np.empty(0, dtype=np.int64), np.empty(0)
+        sources = np.concatenate([m for m in matches if m]).astype(np.int64)
+        chords = np.linalg.norm(vectors[positions] - self.tree.data[sources], axis=1)
+        return positions, sources, _angle(chords)
+
+
+def crossmatch(
+    catalog: ReferenceCatalog, ra, dec, radius=3.0, how="nearest", columns=None
+) -> "pd.DataFrame":
+    # one row per position with how="nearest" (the nearest source, if any), or one row
+    # per (position, source) pair with how="all", with the requested catalog columns
+    import pandas as pd
+
+    columns = list(catalog.columns) if columns is None else columns
+    if how == "nearest":
+        indexes, separations = catalog.nearest(ra, dec, radius)
+        matched = indexes >= 0
+        result = {
+            "position": np.arange(len(indexes)),
+            "match": matched,
+            "separation": separations,
+        }
+        for column in columns:
+            values = catalog.columns[column]
+            if len(values) == 0:
+                result[column] = np.full(len(indexes), None, dtype=object)
+                continue
+            result[column] = (
+                pd.Series(values[np.maximum(indexes, 0)])
+                .where(matched, None)
+                .to_numpy()
+            )
+        return pd.DataFrame(result)
+    elif how == "all":
+        positions, sources, separations = catalog.within(ra, dec, radius)
+        result = {"position": positions, "source": sources, "separation": separations}
+        for column in columns:
+            result[column] = catalog.columns[column][sources]
+        return pd.DataFrame(result)
+    raise ValueError(f"Invalid how: {how}, must be one of ['nearest', 'all']")
@@ -1,8 +1,28 @@
 import os
+from typing import TYPE_CHECKING
 
-import pandas as pd
+if TYPE_CHECKING:
+    import pandas as pd
 
-def validate_output_options(output_format, output_compression, output_compression_level, output_directory=None):
+# compressions for which a compression level can be given
+COMPRESSIONS_WITH_LEVEL = {
+    "parquet": ["gzip", "brotli"],
+    "feather": ["lz4", "zstd"],
+    "csv": ["gzip", "bz2", "xz"],
+}
+
+# first bytes of the files written by each csv compression
+CSV_MAGIC_NUMBERS = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"PK\x03\x04": "zip",
+    b"\xfd7zXZ\x00": "xz",
+}
+
+
+def validate_output_options(
+    output_format, output_compression, output_compression_level, output_directory=None
+):
     if output_format not in ["parquet", "feather", "csv"]:
         raise ValueError(
             f"Invalid output format: {output_format}, must be one of ['parquet', 'feather', 'csv']"
@@ -38,8 +58,15 @@ def validate_output_options(output_format, output_compression, output_compressio
             f"Invalid output compression with feather: {output_compression}, must be one of [None, 'lz4', 'zstd', 'uncompressed']"
         )
 
-    if output_compression_level is not None and output_format not in ["feather"]:
-        print(f"Compression level is only supported with feather, not {output_format}. Argument will be ignored")
+    if (
+        output_compression_level is not None
+        and output_compression not in COMPRESSIONS_WITH_LEVEL.get(output_format, [])
+    ):
+        print(
+            f"Compression level is not supported with {output_format} and "
+            f"{output_compression} compression, only with {COMPRESSIONS_WITH_LEVEL}. "
+            "Argument will be ignored"
+        )
 
     if output_directory is not None and not os.path.exists(output_directory):
         try:
@@ -47,9 +74,22 @@ def validate_output_options(output_format, output_compression, output_compressio
         except Exception as e:
             raise ValueError(f"Failed to create output directory: {e}")
 
-def save_dataframe(df, filename, output_format, output_compression, output_compression_level, output_directory=None):
+
+def save_dataframe(
+    df,
+    filename,
+    output_format,
+    output_compression,
+    output_compression_level,
+    output_directory=None,
+    row_group_size=None,
+):
+    # row_group_size is the number of rows per parquet row group / feather record batch,
+    # the unit the alert index reads files by
     # validate the output options
-    validate_output_options(output_format, output_compression, output_compression_level, output_directory)
+    validate_output_options(
+        output_format, output_compression, output_compression_level, output_directory
+    )
 
     # if the filename already have the extension, remove it
     if any(filename.endswith(ext) for ext in [".parquet", ".feather", ".csv"]):
@@ -59,20 +99,45 @@ def save_dataframe(df, filename, output_format, output_compression, output_compr
     if output_directory is not None and not filename.startswith(output_directory):
         filename = os.path.join(output_directory, filename)
 
+    if output_compression not in COMPRESSIONS_WITH_LEVEL.get(output_format, []):
+        output_compression_level = None
+
     # save the dataframe
     if output_format == "parquet":
         filename = filename + ".parquet"
-        df.to_parquet(filename, index=False, compression=output_compression)
+        df.to_parquet(
+            filename,
+            index=False,
+            compression=output_compression,
+            compression_level=output_compression_level,
+            row_group_size=row_group_size,
+        )
     elif output_format == "feather":
         filename = filename + ".feather"
-        df.to_feather(filename, compression=output_compression)
+        df.to_feather(
+            filename,
+            compression=output_compression,
+            compression_level=output_compression_level,
+            chunksize=row_group_size,
+        )
     elif output_format == "csv":
         filename = filename + ".csv"
-        df.to_csv(filename, index=False, compression=output_compression)
+        compression = output_compression
+        if output_compression_level is not None:
+            level_key = "preset" if output_compression == "xz" else "compresslevel"
+            compression = {
+                "method": output_compression,
+                level_key: output_compression_level,
+            }
+        df.to_csv(filename, index=False, compression=compression)
 
     # return the filename that includes the output dir and the extension
     return filename
+
+
 def load_dataframe(filename, format=None, directory=None):
+    import pandas as pd
+
     if directory is not None and not filename.startswith(directory):
         filename = os.path.join(directory, filename)
 
@@ -91,9 +156,125 @@ def load_dataframe(filename, format=None, directory=None):
     elif format == "feather":
         return pd.read_feather(filename)
     elif format == "csv":
-        return pd.read_csv(filename)
+        return pd.read_csv(filename, compression=csv_compression(filename))
     else:
-        raise ValueError(f"Invalid output format: {format}, must be one of ['parquet', 'feather', 'csv']")
+        raise ValueError(
+            f"Invalid output format: {format}, must be one of ['parquet', 'feather', 'csv']"
+        )
+
+
+def csv_compression(filename):
+    # compressed csv files keep the .csv extension, so we look at their first bytes
+    with open(filename, "rb") as f:
+        header = f.read(6)
+    for magic, compression in CSV_MAGIC_NUMBERS.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def open_csv(filename):
+    import bz2
+    import gzip
+    import lzma
+    import zipfile
+
+    compression = csv_compression(filename)
+    if compression == "gzip":
+        return gzip.open(filename, "rb")
+    elif compression == "bz2":
+        return bz2.open(filename, "rb")
+    elif compression == "xz":
+        return lzma.open(filename, "rb")
+    elif compression == "zip":
+        archive = zipfile.ZipFile(filename)
+        return archive.open(archive.namelist()[0])
+    return open(filename, "rb")
+
+
+def infer_format(filename):
+    for format in ["parquet", "feather", "csv"]:
+        if filename.endswith(f".{format}"):
+            return format
+    raise ValueError(f"Could not infer output format from filename: {filename}")
+
+
+def iter_record_batches(
+    filename, columns=None, format=None, directory=None, batch_size=65536
+):
+    # stream a stored dataset as pyarrow record batches, so we never hold more than
+    # one batch of a (potentially very large) file in memory
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    if directory is not None and not filename.startswith(directory):
+        filename = os.path.join(directory, filename)
+    if format is None:
+        format = infer_format(filename)
+
+    if format == "parquet":
+        parquet_file = pq.ParquetFile(filename)
+        if columns is not None:
+            columns = [
+                column
+                for column in columns
+                if column in parquet_file.schema_arrow.names
+            ]
+        yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+    elif format == "feather":
+        with pa.memory_map(filename) as source:
+            reader = pa.ipc.open_file(source)
+            names = reader.schema.names
+            if columns is not None:
+                columns = [column for column in columns if column in names]
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for offset in range(0, len(batch), batch_size):
+                    yield batch.slice(offset, batch_size)
+    elif format == "csv":
+        # peek at the header to only convert the columns that exist in the file
+        with open_csv(filename) as f:
+            names = f.readline().decode().strip().split(",")
+        convert_options = pa_csv.ConvertOptions(
+            include_columns=[column for column in columns if column in names]
+            if columns is not None
+            else None
+        )
+        with open_csv(filename) as f:
+            reader = pa_csv.open_csv(
+                f,
+                read_options=pa_csv.ReadOptions(block_size=1 << 24),
+                convert_options=convert_options,
+            )
+            yield from reader
+    else:
+        raise ValueError(
+            f"Invalid output format: {format}, must be one of ['parquet', 'feather', 'csv']"
+        )
+
+
+def list_datasets(paths):
+    # files, or the datasets in directories (except the temporary files of low memory mode)
+    filenames = []
+    for path in paths:
+        if not os.path.exists(path):
+            raise ValueError(f"Invalid dataset path: {path}")
+        if os.path.isdir(path):
+            filenames.extend(
+                sorted(
+                    os.path.join(path, filename)
+                    for filename in os.listdir(path)
+                    if filename.endswith((".parquet", ".feather", ".csv"))
+                    and not filename.startswith("tmp_")
+                )
+            )
+        else:
+            filenames.append(path)
+    return filenames
+
 
 def remove_file(filename, directory=None):
     if directory is not None and not filename.startswith(directory):
@@ -103,7 +284,19 @@ def remove_file(filename, directory=None):
     except Exception as e:
         raise ValueError(f"Failed to remove file: {e}")
 
-def compute_column_stats(df: pd.DataFrame, column: str) -> dict:
-    # compute the statistics
-    stats = df[column].describe().to_dict()
-    return stats
+
+def dataset_columns(filename, format=None) -> list:
+    # names of the columns of a stored dataset, from its schema (or csv header),
+    # without reading its rows
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if format is None:
+        format = infer_format(filename)
+    if format == "parquet":
+        return pq.ParquetFile(filename).schema_arrow.names
+    elif format == "feather":
+        with pa.memory_map(filename) as source:
+            return pa.ipc.open_file(source).schema.names
+    with open_csv(filename) as f:
+        return f.readline().decode().strip().split(",")
@@ -0,0 +1,43 @@
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+# julian date of the unix epoch (1970-01-01T00:00:00 UTC)
+JD_UNIX_EPOCH = 2440587.5
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# these conversions are plain arithmetic on UTC timestamps (like astropy's utc scale
+# away from leap seconds), so that we don't need to import astropy to parse arguments
+
+
+def jd_now() -> float:
+    return time.time() / 86400.0 + JD_UNIX_EPOCH
+
+
+def night_start_jd(days_ago=1) -> float:
+    # start (0h UTC) of the night days_ago days ago
+    return math.floor(jd_now() - days_ago) + 0.5
+
+
+def iso_to_jd(value: str) -> float:
+    try:
+        dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        # fallback for the formats only astropy knows about
+        from astropy.time import Time
+
+        return Time(value).jd
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - UNIX_EPOCH).total_seconds() / 86400.0 + JD_UNIX_EPOCH
+
+
+def jd_to_datetime(jd: float) -> datetime:
+    milliseconds = round((float(jd) - JD_UNIX_EPOCH) * 86400000)
+    return UNIX_EPOCH + timedelta(milliseconds=milliseconds)
+
+
+def jd_to_iso(jd: float) -> str:
+    # same format as astropy's Time(jd, format="jd").iso
+    dt = jd_to_datetime(jd)
+    return f"{dt:%Y-%m-%d %H:%M:%S}.{dt.microsecond // 1000:03d}"
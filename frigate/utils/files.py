@@ -0,0 +1,31 @@
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+@contextmanager
+def atomic_path(path: str):
+    # temporary path (in the same directory) to write a file or a directory to, moved
+    # in place of path once written, so that readers never see a partial file. Its
+    # name starts with ".tmp_", for listings to skip it. Nothing is moved, and the
+    # temporary file is removed, if writing it fails
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".tmp_{uuid.uuid4().hex}")
+    try:
+        yield tmp_path
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    # a directory can only replace an empty one
+    if os.path.isdir(tmp_path) and os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,249 @@
+import numpy as np
+
+# HEALPix (Gorski et al. 2005) pixel indices in the NESTED scheme, in numpy, so that
+# we don't depend on healpy. In the nested scheme, the pixel of a position at nside/2
+# is its pixel at nside >> 2, so pixels close on the sky tend to have close indices
+# and a sort by pixel clusters the alerts spatially
+
+HEALPIX_COLUMN_PREFIX = "healpix_"
+DEFAULT_HEALPIX_NSIDE = 64
+
+MAX_SAMPLED_POINTS = 2_000_000
+
+
+def nside_to_order(nside: int) -> int:
+    order = int(nside).bit_length() - 1
+    if nside <= 0 or 1 << order != nside or order > 29:
+        raise ValueError(f"Invalid nside: {nside}, must be a power of 2 up to 2**29")
+    return order
+
+
+def healpix_column(nside: int) -> str:
+    return f"{HEALPIX_COLUMN_PREFIX}{nside}"
+
+
+def nside_from_column(column: str) -> int:
+    return int(column[len(HEALPIX_COLUMN_PREFIX) :])
+
+
+def _spread_bits(values) -> np.ndarray:
+    # interleave zeros between the bits of 32 bits integers: abcd -> 0a0b0c0d
+    x = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in [
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ]:
+        x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+    return x
+
+
+def ang2pix_nest(nside: int, ra, dec) -> np.ndarray:
+    # nested pixel index of positions given in degrees
+    order = nside_to_order(nside)
+    ra = np.asarray(ra, dtype=np.float64)
+    dec = np.asarray(dec, dtype=np.float64)
+    z = np.sin(np.radians(dec))
+    za = np.abs(z)
+    tt = np.mod(np.radians(ra), 2 * np.pi) * (2 / np.pi)  # in [0, 4)
+    tt = np.where(tt >= 4, 0.0, tt)
+
+    face = np.empty(z.shape, dtype=np.int64)
+    ix = np.empty(z.shape, dtype=np.int64)
+    iy = np.empty(z.shape, dtype=np.int64)
+
+    # equatorial region
+    equatorial = za <= 2 / 3
+    temp1 = nside * (0.5 + tt[equatorial])
+    temp2 = nside * z[equatorial] * 0.75
+    jp = (temp1 - temp2).astype(np.int64)  # index of the ascending edge line
+    jm = (temp1 + temp2).astype(np.int64)  # index of the descending edge line
+    ifp = jp >> order
+    ifm = jm >> order
+    face[equatorial] = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix[equatorial] = jm & (nside - 1)
+    iy[equatorial] = nside - (jp & (nside - 1)) - 1
+
+    # polar caps
+    polar = ~equatorial
+    ntt = np.minimum(tt[polar].astype(np.int64), 3)
+    tp = tt[polar] - ntt
+    tmp = nside * np.sqrt(3 * (1 - za[polar]))
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z[polar] >= 0
+    face[polar] = np.where(north, ntt, ntt + 8)
+    ix[polar] = np.where(north, nside - jm - 1, jp)
+    iy[polar] = np.where(north, nside - jp - 1, jm)
+
+    pixels = (
+        (face.astype(np.uint64) << np.uint64(2 * order))
+        | _spread_bits(ix)
+        | (_spread_bits(iy) << np.uint64(1))
+    )
+    return pixels.astype(np.int64)
+
+
+def resolution(nside: int) -> float:
+    # typical size of a pixel, in degrees
+    return np.degrees(np.sqrt(4 * np.pi / (12 * nside**2)))
+
+
+def unit_vectors(ra, dec) -> np.ndarray:
+    ra = np.radians(np.asarray(ra, dtype=np.float64))
+    dec = np.radians(np.asarray(dec, dtype=np.float64))
+    return np.stack(
+        [np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1
+    )
+
+
+def vectors_to_radec(vectors) -> (np.ndarray, np.ndarray):
+    vectors = np.asarray(vectors, dtype=np.float64)
+    ra = np.degrees(np.arctan2(vectors[..., 1], vectors[..., 0])) % 360
+    dec = np.degrees(np.arcsin(np.clip(vectors[..., 2], -1, 1)))
+    return ra, dec
+
+
+def angular_distance(ra1, dec1, ra2, dec2) -> np.ndarray:
+    # in degrees, haversine formula (accurate at small separations)
+    ra1, dec1, ra2, dec2 = (
+        np.radians(np.asarray(v, dtype=np.float64)) for v in (ra1, dec1, ra2, dec2)
+    )
+    a = (
+        np.sin((dec2 - dec1) / 2) ** 2
+        + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    )
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+
+
+def _cap_points(ra, dec, radius, step) -> (np.ndarray, np.ndarray):
+    # points covering a spherical cap with a spacing of about step (degrees):
+    # rings around the pole, rotated to the center of the cap
+    radius = np.radians(radius)
+    step = np.radians(step)
+    thetas = np.arange(step, radius + step, step)
+    thetas = np.minimum(thetas, radius)
+    counts = np.maximum(np.ceil(2 * np.pi * np.sin(thetas) / step).astype(np.int64), 1)
+    theta = np.concatenate([[0.0], np.repeat(thetas, counts)])
+    ring_start = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    position = np.arange(counts.sum()) - np.repeat(ring_start, counts)
+    phi = np.concatenate([[0.0], 2 * np.pi * position / np.repeat(counts, counts)])
+    local = np.stack(
+        [np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)],
+        axis=-1,
+    )
+    # rotation taking the pole to (ra, dec)
+    a, d = np.radians(ra), np.radians(dec)
+    east = np.array([-np.sin(a), np.cos(a), 0.0])
+    north = np.array([-np.sin(d) * np.cos(a), -np.sin(d) * np.sin(a), np.cos(d)])
+    center = np.array([np.cos(d) * np.cos(a), np.cos(d) * np.sin(a), np.sin(d)])
+    vectors = local @ np.stack([east, north, center])
+    return vectors_to_radec(vectors)
+
+
+def cap_pixel_ranges(nside: int, ra, dec, radius):
+    # ranges [start, stop) of nested pixels at nside covering (a superset of) the pixels
+    # overlapping a cap, by sampling the cap widened by a pixel size, at a coarser nside
+    # if the cap is large. None if the cap covers most of the sky
+    if radius >= 60:
+        return None
+    order = nside_to_order(nside)
+    query_order = order
+    while query_order > 0:
+        step = resolution(1 << query_order) / 4
+        area = (
+            2
+            * np.pi
+            * (1 - np.cos(np.radians(radius + 2 * resolution(1 << query_order))))
+        )
+        if area / np.radians(step) ** 2 <= MAX_SAMPLED_POINTS:
+            break
+        query_order -= 1
+    query_nside = 1 << query_order
+    ras, decs = _cap_points(
+        ra, dec, radius + 2 * resolution(query_nside), resolution(query_nside) / 4
+    )
+    pixels = np.unique(ang2pix_nest(query_nside, ras, decs))
+    shift = 2 * (order - query_order)
+    starts = pixels << shift
+    stops = (pixels + 1) << shift
+    # merge contiguous ranges
+    breaks = np.flatnonzero(starts[1:] != stops[:-1]) + 1
+    return np.stack(
+        [
+            starts[np.concatenate([[0], breaks])],
+            stops[np.concatenate([breaks - 1, [len(stops) - 1]])],
+        ],
+        axis=-1,
+    )
+
+
+def in_polygon(ra, dec, vertices) -> np.ndarray:
+    # whether positions are inside a spherical polygon with great circle edges (smaller
+    # than a hemisphere), tested in the gnomonic projection centered on the polygon,
+    # where great circles are straight lines
+    vertices = np.asarray(vertices, dtype=np.float64)
+    center = unit_vectors(vertices[:, 0], vertices[:, 1]).sum(axis=0)
+    center /= np.linalg.norm(center)
+    c_ra, c_dec = vectors_to_radec(center)
+    a, d = np.radians(c_ra), np.radians(c_dec)
+    east = np.array([-np.sin(a), np.cos(a), 0.0])
+    north = np.array([-np.sin(d) * np.cos(a), -np.sin(d) * np.sin(a), np.cos(d)])
+
+    def project(r, de):
+        v = unit_vectors(r, de)
+        cos_c = v @ center
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return v @ east / cos_c, v @ north / cos_c, cos_c
+
+    px, py, cos_c = project(np.asarray(ra), np.asarray(dec))
+    vx, vy, _ = project(vertices[:, 0], vertices[:, 1])
+    inside = np.zeros(px.shape, dtype=bool)
+    # ray casting
+    for i in range(len(vx)):
+        x1, y1, x2, y2 = vx[i], vy[i], vx[i - 1], vy[i - 1]
+        crosses = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+        inside ^= crosses & (px < x_cross)
+    return inside & (cos_c > 0)
+
+
+def in_box(ra, dec, ra_min, ra_max, dec_min, dec_max) -> np.ndarray:
+    # ra_min > ra_max for boxes across ra = 0
+    ra = np.mod(ra, 360)
+    if ra_min <= ra_max:
+        in_ra = (ra >= ra_min) & (ra <= ra_max)
+    else:
+        in_ra = (ra >= ra_min) | (ra <= ra_max)
+    return in_ra & (dec >= dec_min) & (dec <= dec_max)
+
+
+def box_bounding_cap(ra_min, ra_max, dec_min, dec_max) -> (float, float, float):
+    width = (ra_max - ra_min) % 360 if ra_min != ra_max else 360
+    ra_center = (ra_min + width / 2) % 360
+    # sample the edges of the box to find how far from the center it goes
+    ras = (ra_min + np.linspace(0, width, 181)) % 360
+    decs = np.linspace(dec_min, dec_max, 181)
+    edge_ra = np.concatenate([ras, ras, np.full(181, ra_min), np.full(181, ra_max)])
+    edge_dec = np.concatenate(
+        [np.full(181, dec_min), np.full(181, dec_max), decs, decs]
+    )
+    best = None
+    for dec_center in np.linspace(dec_min, dec_max, 19):
+        radius = angular_distance(ra_center, dec_center, edge_ra, edge_dec).max()
+        if best is None or radius < best[2]:
+            best = (ra_center, dec_center, radius)
+    ra_center, dec_center, radius = best
+    # the edges were sampled, leave some room for what is between the samples
+    return ra_center, dec_center, radius + width / 180 + (dec_max - dec_min) / 180
+
+
+def polygon_bounding_cap(vertices) -> (float, float, float):
+    vertices = np.asarray(vertices, dtype=np.float64)
+    center = unit_vectors(vertices[:, 0], vertices[:, 1]).sum(axis=0)
+    ra, dec = vectors_to_radec(center / np.linalg.norm(center))
+    radius = angular_distance(ra, dec, vertices[:, 0], vertices[:, 1]).max()
+    return float(ra), float(dec), float(radius)
@@ -0,0 +1,239 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from frigate.utils.datasets import (
+    infer_format,
+    iter_record_batches,
+    load_dataframe,
+    remove_file,
+    save_dataframe,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+IO_RECOMMENDATION_FILENAME = "io_recommendation.json"
+
+# (format, compression, level) combinations accepted by save_dataframe
+IO_OPTIONS = {
+    "parquet": [
+        (None, None),
+        ("snappy", None),
+        ("gzip", 1),
+        ("gzip", 6),
+        ("gzip", 9),
+        ("brotli", 1),
+        ("brotli", 5),
+        ("brotli", 9),
+    ],
+    "feather": [
+        ("uncompressed", None),
+        ("lz4", None),
+        ("zstd", 1),
+        ("zstd", 3),
+        ("zstd", 9),
+    ],
+    "csv": [
+        (None, None),
+        ("gzip", 1),
+        ("gzip", 6),
+        ("bz2", 9),
+        ("xz", 1),
+    ],
+}
+
+# columns most of the downstream scripts scan
+SCAN_COLUMNS = ["objectId", "candidate.jd", "candidate.magpsf", "candidate.drb"]
+
+OBJECTIVES = ["balanced", "size", "write", "read", "scan"]
+
+# with the balanced objective, the fastest option at most this much larger than
+# the smallest one is recommended
+BALANCED_SIZE_TOLERANCE = 1.25
+
+
+def _read_row_groups(filename: str, sample_size, rng):
+    # random row groups (parquet) / record batches (feather) of a file, with at least
+    # sample_size rows, read in their original order, so the night isn't loaded whole
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    format = infer_format(filename)
+    if format == "parquet":
+        source = pq.ParquetFile(filename)
+        sizes = [
+            source.metadata.row_group(i).num_rows for i in range(source.num_row_groups)
+        ]
+
+        def read(groups):
+            return source.read_row_groups(groups)
+
+    else:
+        source = pa.ipc.open_file(pa.memory_map(filename))
+        sizes = [source.get_batch(i).num_rows for i in range(source.num_record_batches)]
+
+        def read(groups):
+            return pa.Table.from_batches(
+                [source.get_batch(i) for i in groups], schema=source.schema
+            )
+
+    groups = rng.permutation(len(sizes))
+    if sample_size is not None:
+        cumulative = np.cumsum(np.asarray(sizes)[groups])
+        groups = groups[: np.searchsorted(cumulative, sample_size) + 1]
+    return read(sorted(groups.tolist())).to_pandas()
+
+
+def sample_dataframe(filename: str, sample_size=100000, seed=0) -> "pd.DataFrame":
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    if infer_format(filename) in ["parquet", "feather"]:
+        df = _read_row_groups(filename, sample_size, rng)
+    else:
+        # csv has no row groups to pick from
+        df = load_dataframe(filename)
+    if sample_size is not None and len(df) > sample_size:
+        # keep the original order, which matters for compression
+        df = df.sample(n=sample_size, random_state=seed).sort_index()
+    return df.reset_index(drop=True)
+
+
+def _best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_output_options(
+    df: "pd.DataFrame",
+    directory: str,
+    formats=("parquet", "feather", "csv"),
+    scan_columns=None,
+    repeat=3,
+    verbose=True,
+):
+    scan_columns = [c for c in (scan_columns or SCAN_COLUMNS) if c in df.columns]
+    results = []
+    for format in formats:
+        for compression, level in IO_OPTIONS[format]:
+            filename = f"bench_io_{compression}_{level}"
+            filepath = f"{os.path.join(directory, filename)}.{format}"
+
+            def write_file(filename=filename, format=format, c=compression, lvl=level):
+                save_dataframe(df, filename, format, c, lvl, directory)
+
+            def read_file(filepath=filepath, format=format):
+                load_dataframe(filepath, format)
+
+            def scan_file(filepath=filepath, format=format):
+                for _ in iter_record_batches(
+                    filepath, columns=scan_columns, format=format
+                ):
+                    pass
+
+            try:
+                write = _best_of(write_file, repeat)
+                read = _best_of(read_file, repeat)
+                scan = _best_of(scan_file, repeat)
+                size = os.path.getsize(filepath)
+            except Exception as e:
+                if verbose:
+                    print(f"Skipping {format}/{compression}/{level}: {e}")
+                continue
+            finally:
+                if os.path.exists(filepath):
+                    remove_file(filepath)
+            result = {
+                "format": format,
+                "compression": compression,
+                "level": level,
+                "write": write,
+                "read": read,
+                "scan": scan,
+                "size": size,
+            }
+            results.append(result)
+            if verbose:
+                print(
+                    f"{format:<8} {str(compression):<13} {str(level):<5} "
+                    f"write {write:8.3f}s  read {read:8.3f}s  scan {scan:8.3f}s  "
+                    f"size {size / 1024**2:9.2f} MB"
+                )
+    return results
+
+
+def recommend_output_options(results: list, objective="balanced") -> (dict, str):
+    if len(results) == 0:
+        return None, "No results to recommend output options from"
+    if objective not in OBJECTIVES:
+        return None, f"Invalid objective: {objective}, must be one of {OBJECTIVES}"
+
+    if objective == "balanced":
+        # only the options close to the smallest size are considered, so that
+        # faster options can't double the disk usage of every night
+        smallest = min(r["size"] for r in results)
+        candidates = [
+            r for r in results if r["size"] <= BALANCED_SIZE_TOLERANCE * smallest
+        ]
+    else:
+        candidates = results
+
+    # timings under a millisecond are mostly noise, we don't let them decide
+    floors = {"write": 1e-3, "read": 1e-3, "scan": 1e-3}
+    best = {
+        metric: max(min(r[metric] for r in candidates), floor)
+        for metric, floor in floors.items()
+    }
+
+    def score(result):
+        if objective != "balanced":
+            return result[objective]
+        # geometric mean of how far each timing is from the best option
+        product = 1.0
+        for metric, floor in floors.items():
+            product *= max(result[metric], floor) / best[metric]
+        return product ** (1 / len(floors))
+
+    result = min(candidates, key=score)
+    return {
+        "output_format": result["format"],
+        "output_compression": result["compression"],
+        "output_compression_level": result["level"],
+        "objective": objective,
+        "results": results,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }, None
+
+
+def save_io_recommendation(recommendation: dict, filepath: str) -> str:
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(filepath, "w") as f:
+        json.dump(recommendation, f, indent=2)
+    return filepath
+
+
+def load_io_recommendation(filepath: str) -> (dict, str):
+    if not os.path.exists(filepath):
+        return (
+            None,
+            f"No output options recommendation at {filepath}, run `frigate bench-io`",
+        )
+    try:
+        with open(filepath) as f:
+            recommendation = json.load(f)
+    except Exception as e:
+        return (
+            None,
+            f"Failed to load output options recommendation from {filepath}: {e}",
+        )
+    return recommendation, None
@@ -1,20 +1,39 @@
+import math
 import multiprocessing
 import os
 import uuid
 
 from contextlib import closing
+from typing import TYPE_CHECKING
 
-
-import numpy as np
-import pandas as pd
-
-from penquins import Kowalski
-from tqdm import tqdm
-
+from frigate.utils.cache import get_cached_response, put_cached_response
 from frigate.utils.datasets import save_dataframe, load_dataframe, remove_file
 
+if TYPE_CHECKING:
+    # pandas, penquins and tqdm are only imported when a query actually runs,
+    # to keep the startup of the CLI (and of the pool workers) fast
+    import pandas as pd
+    from penquins import Kowalski
+
 ZTF_ALERTS_CATALOG = "ZTF_alerts"
 
+# max number of objectIds sent in a single query
+OBJECTIDS_CHUNK_SIZE = 1000
+
+# we include everything except the following fields
+CANDIDATES_PROJECTION = {
+    "_id": 0,
+    "schemavsn": 0,
+    "publisher": 0,
+    "candidate.pdiffimfilename": 0,
+    "candidate.programpi": 0,
+    "candidate.candid": 0,
+    "cutoutScience": 0,
+    "cutoutTemplate": 0,
+    "cutoutDifference": 0,
+    "coordinates": 0,
+}
+
 STRING_FIELDS = [
     "rbversion",
     "drbversion",
@@ -28,19 +47,42 @@ STRING_FIELDS = [
 ]
 
 
-def shorten_string_fields(data: pd.DataFrame) -> pd.DataFrame:
+def shorten_string_fields(data: "pd.DataFrame") -> "pd.DataFrame":
     for field in STRING_FIELDS:
         if field in data.columns:
             data[field] = data[field].str.replace("_", "")
     return data
 
 
-def connect_to_kowalski() -> Kowalski:
+def flatten_candidates_page(data: list) -> "pd.DataFrame":
+    import pandas as pd
+
+    # wa want to flatten the candidate object
+    data = pd.json_normalize(data)
+    # we want to remove unnecessary chars from string fields to save space
+    data = shorten_string_fields(data)
+    return data
+
+
+def concat_candidates(pages: list) -> "pd.DataFrame":
+    import pandas as pd
+
+    if len(pages) == 0:
+        return pd.DataFrame()
+    candidates = pd.concat(pages, ignore_index=True)
+    # sort by jd from oldest to newest (lowest to highest)
+    candidates = candidates.sort_values(by="candidate.jd", ascending=True)
+    return candidates
+
+
+def connect_to_kowalski() -> "Kowalski":
+    from penquins import Kowalski
+
     try:
         k = Kowalski(
-            protocol="https",
-            host="kowalski.caltech.edu",
-            port=443,
+            protocol=os.getenv("KOWALSKI_PROTOCOL", "https"),
+            host=os.getenv("KOWALSKI_HOST", "kowalski.caltech.edu"),
+            port=int(os.getenv("KOWALSKI_PORT", 443)),
             token=os.getenv("KOWALSKI_TOKEN"),
             verbose=False,
             timeout=6000,
@@ -56,37 +98,76 @@ def validate_kowalski_connection() -> bool:
 
 
 def _run_query(query):
+    # identical queries (e.g. replaying a past night) are served from the cache, if enabled
+    response = get_cached_response(query)
+    if response is not None:
+        return response
     # connect to Kowalski
     try:
-        k: Kowalski = connect_to_kowalski()
-        return k.query(query=query).get("default")
+        k = connect_to_kowalski()
+        response = k.query(query=query).get("default")
     except Exception as e:
         print(f"Failed to connect to Kowalski: {e}")
         exit(1)
+    put_cached_response(query, response)
+    return response
+
+
+def _candidates_filter(
+    t_i, t_f, programids, objectIds=None, full_history=False
+) -> dict:
+    query_filter = {"candidate.programid": {"$in": programids}}
+    if not (full_history and objectIds is not None):
+        query_filter["candidate.jd"] = {"$gte": t_i, "$lt": t_f}
+    if objectIds is not None:
+        query_filter["objectId"] = {"$in": objectIds}
+    return query_filter
 
 
-def candidates_count_from_kowalski(t_i, t_f, programids, objectIds=None) -> (int, str):
+def _objectIds_chunks(objectIds, chunk_size=OBJECTIDS_CHUNK_SIZE) -> list:
+    # deduplicated (keeping the order) and split in bounded chunks, so that
+    # each query document stays small and can run on its own
+    objectIds = list(dict.fromkeys(objectIds))
+    return [objectIds[i : i + chunk_size] for i in range(0, len(objectIds), chunk_size)]
+
+
+def candidates_count_from_kowalski(
+    t_i,
+    t_f,
+    programids,
+    objectIds=None,
+    full_history=False,
+    objectIds_chunk_size=OBJECTIDS_CHUNK_SIZE,
+) -> (int, str):
     # run a count query to get the number of candidates we are to expect
-    k = connect_to_kowalski()
-    query = {
-        "query_type": "count_documents",
-        "query": {
-            "catalog": ZTF_ALERTS_CATALOG,
-            "filter": {
-                "candidate.jd": {"$gte": t_i, "$lt": t_f},
-                "candidate.programid": {"$in": programids},
+    # (one per chunk of objectIds, if any)
+    if objectIds is None:
+        chunks = [None]
+    else:
+        chunks = _objectIds_chunks(objectIds, objectIds_chunk_size)
+
+    k = None
+    count = 0
+    for chunk in chunks:
+        query = {
+            "query_type": "count_documents",
+            "query": {
+                "catalog": ZTF_ALERTS_CATALOG,
+                "filter": _candidates_filter(t_i, t_f, programids, chunk, full_history),
             },
-        },
-    }
-    if objectIds is not None:
-        query["query"]["filter"]["objectId"] = {"$in": objectIds}
-
-    response = k.query(query=query).get("default")
-    if response.get("status") != "success":
-        return None, str(response.get("message"))[:1000]
-    count = response.get("data", None)
-    if count is None:
-        return None, "Failed to get count of candidates"
+        }
+        response = get_cached_response(query)
+        if response is None:
+            if k is None:
+                k = connect_to_kowalski()
+            response = k.query(query=query).get("default")
+            put_cached_response(query, response)
+        if response.get("status") != "success":
+            return None, str(response.get("message"))[:1000]
+        chunk_count = response.get("data", None)
+        if chunk_count is None:
+            return None, "Failed to get count of candidates"
+        count += chunk_count
     return count, None
 
 
@@ -101,26 +182,46 @@ def get_candidates_from_kowalski(
     low_memory_dir=None,
     format="parquet",
     verbose=True,
+    full_history=False,
+    objectIds_chunk_size=OBJECTIDS_CHUNK_SIZE,
 ):
+    # with objectIds, the alerts of these objects are fetched in chunks of objectIds_chunk_size
+    # objects, between t_i and t_f, or over their full history if full_history is True
+    from tqdm import tqdm
+
     if low_memory is True and low_memory_format not in ["parquet", "csv", "feather"]:
         return None, f"Invalid low_memory_format: {low_memory_format}"
     if low_memory is True and low_memory_dir is None:
         return None, "low_memory_dir is required when low_memory is True"
 
-    total, err = candidates_count_from_kowalski(t_i, t_f, programids, objectIds)
+    total, err = candidates_count_from_kowalski(
+        t_i, t_f, programids, objectIds, full_history, objectIds_chunk_size
+    )
     if err:
         return None, err
 
     if verbose:
-        print(
-            f"Expecting {total} candidates between {t_i} and {t_f} for programids {programids} (n_threads: {n_threads}, low_memory: {low_memory})"
-        )
+        if objectIds is not None:
+            period = "(full history)" if full_history else f"between {t_i} and {t_f}"
+            print(
+                f"Expecting {total} candidates for {len(objectIds)} objects {period} "
+                f"for programids {programids} "
+                f"(n_threads: {n_threads}, low_memory: {low_memory})"
+            )
+        else:
+            print(
+                f"Expecting {total} candidates between {t_i} and {t_f} for programids "
+                f"{programids} (n_threads: {n_threads}, low_memory: {low_memory})"
+            )
 
-    filename = f"{t_i}_{t_f}_{'_'.join(map(str, programids))}.{format}"
     # look in the low memory dir (which is identical to the dir), if the file exists
     # if it does, load it and verify that it has the expected number of candidates
+    # (the files saved by frigate hold whole nights, not subsets of objects)
+    filename = f"{t_i}_{t_f}_{'_'.join(map(str, programids))}.{format}"
     try:
-        existing_data = load_dataframe(filename, None, low_memory_dir)
+        existing_data = None
+        if objectIds is None:
+            existing_data = load_dataframe(filename, None, low_memory_dir)
         if existing_data is not None and len(existing_data) == total:
             if verbose:
                 print(
@@ -131,40 +232,43 @@ def get_candidates_from_kowalski(
         if verbose:
             print(f"Failed to load existing data for {filename}: {e}, continuing")
 
-    numPerPage = 10000
-    batches = int(np.ceil(total / numPerPage))
-    if objectIds is not None:
-        batches = int(np.ceil(len(objectIds) / numPerPage))
-
     queries = []
-    for i in range(batches):
-        query = {
-            "query_type": "find",
-            "query": {
-                "catalog": ZTF_ALERTS_CATALOG,
-                "filter": {
-                    "candidate.jd": {"$gte": t_i, "$lt": t_f},
-                    "candidate.programid": {"$in": programids},
+    if objectIds is None:
+        # pages are sorted by candid, so that a page holds the same alerts whatever
+        # the order the server (or replica) scans them in, and cached pages can be
+        # stitched to freshly fetched ones without duplicates or gaps
+        numPerPage = 10000
+        batches = math.ceil(total / numPerPage)
+        for i in range(batches):
+            query = {
+                "query_type": "find",
+                "query": {
+                    "catalog": ZTF_ALERTS_CATALOG,
+                    "filter": _candidates_filter(t_i, t_f, programids),
+                    "projection": CANDIDATES_PROJECTION,
                 },
-                "projection": {
-                    # we include everything except the following fields
-                    "_id": 0,
-                    "schemavsn": 0,
-                    "publisher": 0,
-                    "candidate.pdiffimfilename": 0,
-                    "candidate.programpi": 0,
-                    "candidate.candid": 0,
-                    "cutoutScience": 0,
-                    "cutoutTemplate": 0,
-                    "cutoutDifference": 0,
-                    "coordinates": 0,
+                "kwargs": {
+                    "sort": [["candid", 1]],
+                    "limit": numPerPage,
+                    "skip": i * numPerPage,
                 },
-            },
-            "kwargs": {"limit": numPerPage, "skip": i * numPerPage},
-        }
-        if objectIds is not None:
-            query["query"]["filter"]["objectId"] = {"$in": objectIds}
-        queries.append(query)
+            }
+            queries.append(query)
+    else:
+        # one independent query per chunk of objectIds, without skip/limit,
+        # so no chunk depends on the order in which the server returns documents
+        for chunk in _objectIds_chunks(objectIds, objectIds_chunk_size):
+            query = {
+                "query_type": "find",
+                "query": {
+                    "catalog": ZTF_ALERTS_CATALOG,
+                    "filter": _candidates_filter(
+                        t_i, t_f, programids, chunk, full_history
+                    ),
+                    "projection": CANDIDATES_PROJECTION,
+                },
+            }
+            queries.append(query)
 
     candidates = []  # list of dataframes to concatenate later
     low_memory_pointers = []  # to use with low_memory=True
@@ -178,11 +282,7 @@ def get_candidates_from_kowalski(
                     return None, f"Failed to get candidates from Kowalski: {response}"
                 if response.get("status") != "success":
                     return None, str(response.get("message"))[:1000]
-                data = response.get("data", [])
-                # wa want to flatten the candidate object
-                data = pd.json_normalize(data)
-                # we want to remove unnecessary chars from string fields to save space
-                data = shorten_string_fields(data)
+                data = flatten_candidates_page(response.get("data", []))
 
                 if low_memory:
                     # if running in low memory mode, we directly store the partial dataframe
@@ -214,10 +314,7 @@ def get_candidates_from_kowalski(
             candidates.append(data)
             remove_file(filename, directory=low_memory_dir)
 
-    candidates = pd.concat(candidates, ignore_index=True)
-
-    # sort by jd from oldest to newest (lowest to highest)
-    candidates = candidates.sort_values(by="candidate.jd", ascending=True)
+    candidates = concat_candidates(candidates)
 
     if verbose:
         print(f"Got a total of {len(candidates)} candidates between {t_i} and {t_f}")
@@ -0,0 +1,234 @@
+import os
+import shutil
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from frigate.utils.files import atomic_path
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# light curve fields, and the alert columns they are built from
+LIGHTCURVE_COLUMNS = {
+    "jd": ("candidate.jd", np.float64),
+    "magpsf": ("candidate.magpsf", np.float32),
+    "sigmapsf": ("candidate.sigmapsf", np.float32),
+    "fid": ("candidate.fid", np.int8),
+    "programid": ("candidate.programid", np.int8),
+    "candid": ("candid", np.int64),
+}
+
+
+def build_lightcurves(candidates: "pd.DataFrame") -> dict:
+    # group the alerts by objectId into ragged arrays: the alerts of objects[i]
+    # are at offsets[i]:offsets[i + 1] of each field, sorted by jd
+    objects, inverse = np.unique(
+        candidates["objectId"].to_numpy(dtype=str), return_inverse=True
+    )
+    jd = candidates["candidate.jd"].to_numpy(dtype=np.float64)
+    order = np.lexsort((jd, inverse))
+    offsets = np.zeros(len(objects) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inverse, minlength=len(objects)), out=offsets[1:])
+
+    lightcurves = {"objects": objects, "offsets": offsets}
+    for field, (column, dtype) in LIGHTCURVE_COLUMNS.items():
+        if column in candidates.columns:
+            values = candidates[column].to_numpy()
+        else:
+            values = np.full(len(candidates), -1)
+        lightcurves[field] = values[order].astype(dtype)
+    return lightcurves
+
+
+# the store merges its segments into one once it has more than this many, so that a
+# lookup stays a few binary searches however many nights were appended
+DEFAULT_MAX_SEGMENTS = 16
+
+COMPACTED_SEGMENT = "compacted"
+
+
+class LightCurveStore:
+    # light curves on disk, one segment (directory of .npy arrays, memory mapped
+    # on read) per night appended. A lookup binary searches the objects of each
+    # segment and only reads the slice of the arrays holding that object's alerts.
+    # Each segment also records the night (sources) each of its alerts (source)
+    # comes from, so that a night appended again replaces its alerts everywhere
+    def __init__(self, directory: str, max_segments=DEFAULT_MAX_SEGMENTS):
+        self.directory = directory
+        self.max_segments = max_segments
+        self._segments = {}
+
+    @property
+    def segments(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.directory)
+            if os.path.isfile(os.path.join(self.directory, name, "offsets.npy"))
+        )
+
+    def _segment(self, name: str) -> dict:
+        path = os.path.join(self.directory, name)
+        mtime = os.path.getmtime(os.path.join(path, "offsets.npy"))
+        cached = self._segments.get(name)
+        if cached is None or cached[0] != mtime:
+            arrays = {
+                field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode="r")
+                for field in ["objects", "offsets", *LIGHTCURVE_COLUMNS]
+            }
+            if os.path.isfile(os.path.join(path, "source.npy")):
+                arrays["sources"] = np.load(os.path.join(path, "sources.npy"))
+                arrays["source"] = np.load(
+                    os.path.join(path, "source.npy"), mmap_mode="r"
+                )
+            else:
+                # segments written before the sources were recorded: a night
+                arrays["sources"] = np.array([name])
+                arrays["source"] = np.zeros(len(arrays["jd"]), dtype=np.int32)
+            self._segments[name] = (mtime, arrays)
+        return self._segments[name][1]
+
+    def append(self, candidates: "pd.DataFrame", name: str) -> str:
+        # adds (or replaces, if it was already appended) a night of alerts
+        lightcurves = build_lightcurves(candidates)
+        lightcurves["sources"] = np.array([name])
+        lightcurves["source"] = np.zeros(len(lightcurves["jd"]), dtype=np.int32)
+        # the alerts of that night already merged into other segments are replaced
+        for other in self.segments:
+            if other != name:
+                self._drop_source(other, name)
+        path = self.write_segment(lightcurves, name)
+        if self.max_segments and len(self.segments) > self.max_segments:
+            path = self.compact()
+        return path
+
+    def _drop_source(self, name: str, source: str):
+        segment = self._segment(name)
+        codes = np.flatnonzero(segment["sources"] == source)
+        if len(codes) == 0:
+            return
+        if len(segment["sources"]) == 1:
+            self.remove(name)
+            return
+        keep = ~np.isin(np.asarray(segment["source"]), codes)
+        counts = np.diff(np.asarray(segment["offsets"]))
+        alert_objects = np.repeat(np.arange(len(counts)), counts)[keep]
+        counts = np.bincount(alert_objects, minlength=len(counts))
+        nonempty = counts > 0
+        offsets = np.zeros(int(nonempty.sum()) + 1, dtype=np.int64)
+        np.cumsum(counts[nonempty], out=offsets[1:])
+        # the name stays in sources, so that the codes of the other nights don't change
+        sources = np.where(segment["sources"] == source, "", segment["sources"])
+        lightcurves = {
+            "objects": np.asarray(segment["objects"])[nonempty],
+            "offsets": offsets,
+            "sources": sources,
+            "source": np.asarray(segment["source"])[keep],
+        }
+        for field in LIGHTCURVE_COLUMNS:
+            lightcurves[field] = np.asarray(segment[field])[keep]
+        self.write_segment(lightcurves, name)
+
+    def write_segment(self, lightcurves: dict, name: str) -> str:
+        path = os.path.join(self.directory, name)
+        # write to a temporary directory first, so that readers never see a partial segment
+        with atomic_path(path) as tmp_path:
+            os.makedirs(tmp_path)
+            for field, values in lightcurves.items():
+                np.save(os.path.join(tmp_path, f"{field}.npy"), values)
+        self._segments.pop(name, None)
+        return path
+
+    def remove(self, name: str):
+        shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        self._segments.pop(name, None)
+
+    def lightcurve(self, objectId: str) -> dict:
+        # full history of an object across the segments, sorted by jd
+        parts = {field: [] for field in LIGHTCURVE_COLUMNS}
+        for name in self.segments:
+            segment = self._segment(name)
+            objects = segment["objects"]
+            i = np.searchsorted(objects, objectId)
+            if i == len(objects) or objects[i] != objectId:
+                continue
+            start, end = segment["offsets"][i], segment["offsets"][i + 1]
+            for field in LIGHTCURVE_COLUMNS:
+                parts[field].append(np.asarray(segment[field][start:end]))
+
+        if len(parts["jd"]) == 0:
+            return {
+                field: np.empty(0, dtype=dtype)
+                for field, (_, dtype) in LIGHTCURVE_COLUMNS.items()
+            }
+        if len(parts["jd"]) == 1:
+            return {field: values[0] for field, values in parts.items()}
+        lightcurve = {field: np.concatenate(values) for field, values in parts.items()}
+        # the same alert can be in 2 segments (e.g. overlapping nights)
+        _, first = np.unique(lightcurve["candid"], return_index=True)
+        order = first[np.argsort(lightcurve["jd"][first], kind="stable")]
+        return {field: values[order] for field, values in lightcurve.items()}
+
+    def lightcurves(self, objectIds) -> dict:
+        return {objectId: self.lightcurve(objectId) for objectId in objectIds}
+
+    def objects(self) -> np.ndarray:
+        return np.unique(
+            np.concatenate(
+                [np.asarray(self._segment(name)["objects"]) for name in self.segments]
+                or [np.empty(0, dtype=str)]
+            )
+        )
+
+    def compact(self, name=COMPACTED_SEGMENT) -> str:
+        # merge all the segments into one, which keeps lookups to a single binary search
+        names = self.segments
+        if len(names) <= 1:
+            return os.path.join(self.directory, names[0]) if names else None
+        segments = [self._segment(n) for n in names]
+        objects = np.concatenate([np.asarray(s["objects"]) for s in segments])
+        inverse_parts = []
+        for segment in segments:
+            counts = np.diff(np.asarray(segment["offsets"]))
+            inverse_parts.append(np.repeat(np.arange(len(counts)), counts))
+        # map each alert to its object in the concatenated objects array
+        shifts = np.cumsum([0] + [len(s["objects"]) for s in segments[:-1]])
+        alert_objects = objects[
+            np.concatenate([part + shift for part, shift in zip(inverse_parts, shifts)])
+        ]
+        fields = {
+            field: np.concatenate([np.asarray(s[field]) for s in segments])
+            for field in LIGHTCURVE_COLUMNS
+        }
+        # the night of each alert, as a code into the sources of all the segments
+        source_shifts = np.cumsum([0] + [len(s["sources"]) for s in segments[:-1]])
+        alert_sources = np.concatenate([s["sources"] for s in segments])[
+            np.concatenate(
+                [
+                    np.asarray(s["source"]) + shift
+                    for s, shift in zip(segments, source_shifts)
+                ]
+            )
+        ]
+        _, first = np.unique(fields["candid"], return_index=True)
+        merged_objects, inverse = np.unique(alert_objects[first], return_inverse=True)
+        order = first[np.lexsort((fields["jd"][first], inverse))]
+        offsets = np.zeros(len(merged_objects) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(inverse, minlength=len(merged_objects)), out=offsets[1:])
+        sources, source = np.unique(alert_sources[order], return_inverse=True)
+        lightcurves = {
+            "objects": merged_objects,
+            "offsets": offsets,
+            "sources": sources,
+            "source": source.astype(np.int32),
+        }
+        for field, values in fields.items():
+            lightcurves[field] = values[order]
+
+        path = self.write_segment(lightcurves, name)
+        for n in names:
+            if n != name:
+                self.remove(n)
+        return path
@@ -2,10 +2,20 @@ import argparse
 import multiprocessing
 import os
 
-import numpy as np
-from astropy.time import Time
-
-from frigate.utils.datasets import validate_output_options
+from frigate.utils.cache import (
+    QUERY_CACHE_DIR_ENV,
+    QUERY_CACHE_MAX_SIZE_ENV,
+    QUERY_CACHE_TTL_ENV,
+)
+from frigate.utils.dates import iso_to_jd, night_start_jd
+from frigate.utils.datasets import list_datasets, validate_output_options
+from frigate.utils.iobench import (
+    IO_OPTIONS,
+    IO_RECOMMENDATION_FILENAME,
+    OBJECTIVES,
+    load_io_recommendation,
+)
+from frigate.utils.summary import DEFAULT_SUMMARY_HISTOGRAMS
 
 
 def str_to_bool(value):
@@ -27,7 +37,7 @@ def main_parser():
         "--start",
         nargs="+",
         type=str,
-        default=np.floor(Time.now().jd - 1) + 0.5,
+        default=[str(night_start_jd())],
         help="Start time(s) for the query, default to 1 day ago",
     )
     parser.add_argument(
@@ -52,7 +62,8 @@ def main_parser():
         "--output_format",
         type=str,
         default="parquet",
-        help="Output format for the results",
+        help="Output format for the results, or auto to use the recommendation "
+        "of frigate bench-io",
     )
     parser.add_argument(
         "--output_compression",
@@ -72,12 +83,92 @@ def main_parser():
         default="./data",
         help="Output directory for the results",
     )
+    parser.add_argument(
+        "--io_recommendation",
+        type=str,
+        default=None,
+        help="Path to the recommendation used with --output_format auto, "
+        f"defaults to <output_directory>/{IO_RECOMMENDATION_FILENAME}",
+    )
     parser.add_argument(
         "--low_memory",
         type=str_to_bool,
         default=False,
         help="Use low memory mode, to reduce RAM usage",
     )
+    parser.add_argument(
+        "--query_cache",
+        type=str_to_bool,
+        default=False,
+        help="Cache the Kowalski query results on disk, so that re-runs on past "
+        "nights are nearly free",
+    )
+    parser.add_argument(
+        "--query_cache_dir",
+        type=str,
+        default=None,
+        help="Directory of the query cache, defaults to <output_directory>/.query_cache",
+    )
+    parser.add_argument(
+        "--query_cache_size",
+        type=float,
+        default=10.0,
+        help="Maximum size of the query cache in GB, least recently used results "
+        "are evicted first",
+    )
+    parser.add_argument(
+        "--query_cache_ttl",
+        type=float,
+        default=600,
+        help="Time to live in seconds of cached results for nights that are not "
+        "closed yet",
+    )
+    parser.add_argument(
+        "--row_group_size",
+        type=int,
+        default=10000,
+        help="Number of alerts per parquet row group / feather record batch, "
+        "the unit indexed lookups read",
+    )
+    parser.add_argument(
+        "--healpix_nside",
+        type=int,
+        default=0,
+        help="Add a HEALPix (nested) pixel column at this nside and sort the alerts "
+        "by it, for spatial queries (0, the default, keeps the jd order)",
+    )
+    parser.add_argument(
+        "--index",
+        type=str_to_bool,
+        default=False,
+        help="Index the objectIds and candids of each night, to read the alerts of "
+        "a few objects without scanning every night",
+    )
+    parser.add_argument(
+        "--lightcurves",
+        type=str_to_bool,
+        default=False,
+        help="Append the alerts to the per-object light curve store",
+    )
+    parser.add_argument(
+        "--lightcurves_directory",
+        type=str,
+        default=None,
+        help="Directory of the light curve store, defaults to <output_directory>/lightcurves",
+    )
+    parser.add_argument(
+        "--summary",
+        type=str_to_bool,
+        default=True,
+        help="Save a summary (counts, histograms and sketches) next to each night",
+    )
+    parser.add_argument(
+        "--summary_columns",
+        type=str,
+        default=None,
+        help="Columns to histogram in the summary, comma separated, as column "
+        "or column:start:stop:nb_bins",
+    )
     parser.add_argument(
         "--verbose",
         type=str_to_bool,
@@ -108,6 +199,44 @@ def main_parser_args():
         # if provided, we add the token in the environment instead
         os.environ["SKYPORTAL_TOKEN"] = args.sp_token
 
+    # set up the query cache through the environment, so that the pool workers see it too
+    if args.query_cache:
+        if args.query_cache_dir is None:
+            args.query_cache_dir = os.path.join(args.output_directory, ".query_cache")
+        os.environ[QUERY_CACHE_DIR_ENV] = args.query_cache_dir
+        os.environ[QUERY_CACHE_MAX_SIZE_ENV] = str(
+            int(args.query_cache_size * 1024**3)
+        )
+        os.environ[QUERY_CACHE_TTL_ENV] = str(args.query_cache_ttl)
+    else:
+        os.environ.pop(QUERY_CACHE_DIR_ENV, None)
+
+    # validate the healpix nside
+    if args.healpix_nside:
+        from frigate.utils.healpix import nside_to_order
+
+        try:
+            nside_to_order(args.healpix_nside)
+        except ValueError as e:
+            raise ValueError(f"Invalid healpix_nside: {e}")
+
+    if args.lightcurves_directory is None:
+        args.lightcurves_directory = os.path.join(args.output_directory, "lightcurves")
+
+    # use the output options recommended by frigate bench-io on this machine
+    if args.output_format == "auto":
+        if args.io_recommendation is None:
+            args.io_recommendation = os.path.join(
+                args.output_directory, IO_RECOMMENDATION_FILENAME
+            )
+        recommendation, err = load_io_recommendation(args.io_recommendation)
+        if err:
+            raise ValueError(err)
+        args.output_format = recommendation["output_format"]
+        if args.output_compression is None and args.output_compression_level is None:
+            args.output_compression = recommendation["output_compression"]
+            args.output_compression_level = recommendation["output_compression_level"]
+
     # validate the output options
     try:
         validate_output_options(
@@ -143,7 +272,7 @@ def main_parser_args():
             try:
                 t_i.append(float(start))
             except ValueError:
-                t_i.append(Time(start).jd)
+                t_i.append(iso_to_jd(start))
         except ValueError:
             raise ValueError(f"Invalid start time: {start}")
 
@@ -152,7 +281,7 @@ def main_parser_args():
             try:
                 t_f = float(args.end)
             except ValueError:
-                t_f = Time(args.end).jd
+                t_f = iso_to_jd(args.end)
         except ValueError:
             raise ValueError(f"Invalid end time: {args.end}")
     else:
@@ -179,6 +308,30 @@ def main_parser_args():
         if args.filterids in [[], None, ""]:
             args.filterids = []
 
+    # validate the summary columns
+    if args.summary_columns:
+        summary_histograms = {}
+        for column in args.summary_columns.split(","):
+            column, *bins = column.split(":")
+            if len(bins) == 0:
+                if column not in DEFAULT_SUMMARY_HISTOGRAMS:
+                    raise ValueError(
+                        f"No default bins for summary column {column}, "
+                        "use column:start:stop:nb_bins"
+                    )
+                summary_histograms[column] = DEFAULT_SUMMARY_HISTOGRAMS[column]
+                continue
+            try:
+                start, stop, nb_bins = float(bins[0]), float(bins[1]), int(bins[2])
+            except (ValueError, IndexError):
+                raise ValueError(f"Invalid summary column bins: {column}:{bins}")
+            if stop <= start or nb_bins <= 0:
+                raise ValueError(f"Invalid summary column bins: {column}:{bins}")
+            summary_histograms[column] = (start, stop, nb_bins)
+        args.summary_columns = summary_histograms
+    else:
+        args.summary_columns = DEFAULT_SUMMARY_HISTOGRAMS
+
     if len(t_i) == 1:
         args.start = float(t_i[0])
         args.end = float(t_f[0])
@@ -193,11 +346,44 @@ def stats_parser():
     # takes a path to a dataset and a list of columns to compute stats on
     parser = argparse.ArgumentParser(description="Compute stats on a dataset")
     parser.add_argument(
-        "--dataset_path", type=str, help="Path to the dataset to compute stats on"
+        "--dataset_path",
+        nargs="+",
+        type=str,
+        help="Path(s) to the dataset(s) to compute stats on, files or directories",
     )
     parser.add_argument(
         "--columns", type=str, help="Columns to compute stats on, comma separated"
     )
+    parser.add_argument(
+        "--group_by",
+        type=str,
+        default=None,
+        help="Split the stats by any of program,fid,night (comma separated)",
+    )
+    parser.add_argument(
+        "--quantiles",
+        type=str,
+        default="0.25,0.5,0.75",
+        help="Approximate quantiles to compute, comma separated",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=65536,
+        help="Number of rows to read at once from each file",
+    )
+    parser.add_argument(
+        "--n_threads",
+        type=str,
+        default=None,
+        help="Number of processes to use when reading files in parallel",
+    )
+    parser.add_argument(
+        "--from_summaries",
+        type=str_to_bool,
+        default=False,
+        help="Merge the summaries saved with the datasets instead of reading them",
+    )
 
     return parser
 
@@ -205,9 +391,11 @@ def stats_parser():
 def stats_parser_args():
     args = stats_parser().parse_args()
 
-    # validate the dataset path
-    if not os.path.exists(args.dataset_path):
-        raise ValueError(f"Invalid dataset path: {args.dataset_path}")
+    # validate the dataset path(s), directories are expanded to the datasets they contain
+    dataset_paths = list_datasets(args.dataset_path or [])
+    if len(dataset_paths) == 0:
+        raise ValueError("No dataset provided")
+    args.dataset_path = dataset_paths
 
     # validate the columns
     if args.columns:
@@ -219,7 +407,129 @@ def stats_parser_args():
         if args.columns in [[], None, ""]:
             args.columns = []
 
-    if len(args.columns) == 0:
+    if not args.columns and not args.from_summaries:
         raise ValueError("No columns provided")
 
+    # validate the group_by
+    if args.group_by and args.from_summaries:
+        raise ValueError(
+            "Cannot group_by with from_summaries, the summaries are merged"
+        )
+    if args.group_by:
+        group_by = list(map(str, args.group_by.split(",")))
+        for group in group_by:
+            if group not in ["program", "fid", "night"]:
+                raise ValueError(f"Invalid group_by: {group}")
+        args.group_by = group_by
+    else:
+        args.group_by = []
+
+    # validate the quantiles
+    try:
+        args.quantiles = list(map(float, args.quantiles.split(",")))
+    except ValueError:
+        raise ValueError(f"Invalid quantiles: {args.quantiles}")
+    if any(q < 0 or q > 1 for q in args.quantiles):
+        raise ValueError(f"Invalid quantiles: {args.quantiles}")
+
+    # validate the number of threads
+    n_threads = args.n_threads
+    if n_threads is None:
+        n_threads = multiprocessing.cpu_count()
+    else:
+        n_threads = min(int(n_threads), multiprocessing.cpu_count())
+    args.n_threads = n_threads
+
+    return args
+
+
+def bench_io_parser():
+    parser = argparse.ArgumentParser(
+        prog="frigate bench-io",
+        description="Benchmark the output formats and compressions on a sample "
+        "of a night, and recommend one",
+    )
+    parser.add_argument(
+        "--dataset_path",
+        type=str,
+        default=None,
+        help="Path to a night saved by frigate to take the sample from, "
+        "synthetic alerts if not provided",
+    )
+    parser.add_argument(
+        "--sample_size",
+        type=int,
+        default=100000,
+        help="Number of alerts to sample from the night",
+    )
+    parser.add_argument(
+        "--formats",
+        type=str,
+        default="parquet,feather,csv",
+        help="Output formats to benchmark, comma separated",
+    )
+    parser.add_argument(
+        "--objective",
+        type=str,
+        default="balanced",
+        help=f"What to optimize the recommendation for, one of {OBJECTIVES}",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of times each measurement is repeated, the best is kept",
+    )
+    parser.add_argument(
+        "--output_directory",
+        type=str,
+        default="./data",
+        help="Directory where the recommendation is saved and the benchmark files are written",
+    )
+    parser.add_argument(
+        "--recommendation_path",
+        type=str,
+        default=None,
+        help="Where to save the recommendation, "
+        f"defaults to <output_directory>/{IO_RECOMMENDATION_FILENAME}",
+    )
+    parser.add_argument(
+        "--save",
+        type=str_to_bool,
+        default=True,
+        help="Save the recommendation for --output_format auto",
+    )
+    parser.add_argument(
+        "--verbose",
+        type=str_to_bool,
+        default=True,
+        help="Print verbose output",
+    )
+    return parser
+
+
+def bench_io_parser_args(argv=None):
+    args = bench_io_parser().parse_args(argv)
+
+    if args.dataset_path is not None and not os.path.isfile(args.dataset_path):
+        raise ValueError(f"Invalid dataset path: {args.dataset_path}")
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    for format in formats:
+        if format not in IO_OPTIONS:
+            raise ValueError(
+                f"Invalid format: {format}, must be one of {list(IO_OPTIONS)}"
+            )
+    args.formats = formats
+
+    if args.objective not in OBJECTIVES:
+        raise ValueError(
+            f"Invalid objective: {args.objective}, must be one of {OBJECTIVES}"
+        )
+
+    if args.recommendation_path is None:
+        args.recommendation_path = os.path.join(
+            args.output_directory, IO_RECOMMENDATION_FILENAME
+        )
+
     return args
@@ -1,7 +1,7 @@
-import requests
-from astropy.time import Time
 import os
 
+from frigate.utils.dates import jd_to_iso
+
 
 def get_skyportal_token():
     try:
@@ -13,14 +13,21 @@ def get_skyportal_token():
         raise ValueError(f"Failed to get SkyPortal token: {e}")
 
 
+def get_skyportal_host():
+    # can be pointed to a local stand-in (see frigate/utils/standin.py)
+    return os.getenv("SKYPORTAL_HOST", "https://fritz.science").rstrip("/")
+
+
 def get_candids_per_filter_from_skyportal(
     t_i, t_f, groupIDs, filterIDs, saved=False, verbose=True
 ):
-    host = "https://fritz.science/api/candidates_filter"
+    import requests
+
+    host = f"{get_skyportal_host()}/api/candidates_filter"
     headers = {"Authorization": f"token {get_skyportal_token()}"}
     # compute the isoformat of the start and end dates
-    start_date = Time(t_i, format="jd").iso
-    end_date = Time(t_f, format="jd").iso
+    start_date = jd_to_iso(t_i)
+    end_date = jd_to_iso(t_f)
     page = 1
     numPerPage = 500  # 500 is the max for this endpoint
     total = None
@@ -90,7 +97,9 @@ def get_candids_per_filter_from_skyportal(
 # write a function that takes a list of objectIds as input, and for each return the list
 # of groups that the object has been saved to in SkyPortal
 def get_source_metadata_from_skyportal(objectIds):
-    host = "https://fritz.science/api/sources"
+    import requests
+
+    host = f"{get_skyportal_host()}/api/sources"
     headers = {"Authorization": f"token {get_skyportal_token()}"}
     metadata_per_object = {}
     try:
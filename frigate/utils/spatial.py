@@ -0,0 +1,177 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from frigate.utils.datasets import infer_format, list_datasets
+from frigate.utils.healpix import (
+    HEALPIX_COLUMN_PREFIX,
+    ang2pix_nest,
+    angular_distance,
+    box_bounding_cap,
+    cap_pixel_ranges,
+    healpix_column,
+    in_box,
+    in_polygon,
+    nside_from_column,
+    polygon_bounding_cap,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def add_healpix_column(candidates: "pd.DataFrame", nside: int) -> "pd.DataFrame":
+    candidates[healpix_column(nside)] = ang2pix_nest(
+        nside,
+        candidates["candidate.ra"].to_numpy(),
+        candidates["candidate.dec"].to_numpy(),
+    )
+    return candidates
+
+
+def sort_by_healpix(candidates: "pd.DataFrame", nside: int) -> "pd.DataFrame":
+    # alerts of the same region end up in the same row groups (sorted by jd within
+    # a pixel), so that spatial queries can skip the row groups of other pixels
+    if healpix_column(nside) not in candidates.columns:
+        candidates = add_healpix_column(candidates, nside)
+    return candidates.sort_values(
+        by=[healpix_column(nside), "candidate.jd"], kind="stable", ignore_index=True
+    )
+
+
+def _healpix_column(names) -> str:
+    columns = [name for name in names if name.startswith(HEALPIX_COLUMN_PREFIX)]
+    # the finest pixelization if there are several
+    return max(columns, key=nside_from_column) if columns else None
+
+
+def _read_matching_row_groups(filepath: str, pixel_ranges, columns=None):
+    # table with the row groups (parquet) / record batches (feather) that can hold
+    # pixels in the ranges, or the whole file if it has no healpix column
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    format = infer_format(filepath)
+    if format == "parquet":
+        parquet_file = pq.ParquetFile(filepath)
+        column = _healpix_column(parquet_file.schema_arrow.names)
+        if column is None or pixel_ranges is None:
+            return parquet_file.read(columns=columns), None
+        nside = nside_from_column(column)
+        metadata = parquet_file.metadata
+        index = parquet_file.schema_arrow.get_field_index(column)
+        row_groups = []
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(index).statistics
+            if statistics is None or not statistics.has_min_max:
+                row_groups.append(i)
+            elif _overlaps(statistics.min, statistics.max, pixel_ranges[nside]):
+                row_groups.append(i)
+        return parquet_file.read_row_groups(row_groups, columns=columns), column
+    elif format == "feather":
+        # not closed explicitly, the buffers of the batches we return keep the memory map open
+        reader = pa.ipc.open_file(pa.memory_map(filepath))
+        column = _healpix_column(reader.schema.names)
+        batches = []
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if column is not None and pixel_ranges is not None and batch.num_rows > 0:
+                pixels = batch.column(column).to_numpy()
+                if not _overlaps(
+                    pixels.min(), pixels.max(), pixel_ranges[nside_from_column(column)]
+                ):
+                    continue
+            batches.append(batch)
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+        return (table.select(columns) if columns is not None else table), column
+    else:
+        from frigate.utils.datasets import load_dataframe
+
+        data = load_dataframe(filepath, format)
+        return (
+            pa.Table.from_pandas(
+                data[columns] if columns else data, preserve_index=False
+            ),
+            None,
+        )
+
+
+def _overlaps(start, stop, ranges) -> bool:
+    # whether [start, stop] overlaps any of the [range_start, range_stop) ranges
+    i = np.searchsorted(ranges[:, 0], stop, side="right") - 1
+    return i >= 0 and ranges[i, 1] > start
+
+
+class _PixelRanges(dict):
+    # pixel ranges of a region, computed once per nside found in the datasets
+    def __init__(self, cap):
+        super().__init__()
+        self.cap = cap
+
+    def __missing__(self, nside):
+        ranges = cap_pixel_ranges(nside, *self.cap)
+        if ranges is None:
+            ranges = np.array([[0, 12 * nside**2]], dtype=np.int64)
+        self[nside] = ranges
+        return ranges
+
+
+def region_search(paths, cap, contains, columns=None) -> "pd.DataFrame":
+    # alerts of the datasets in a region: only the row groups of the pixels overlapping
+    # the bounding cap (ra, dec, radius) of the region are read, then the alerts are
+    # filtered with contains(ra, dec)
+    import pandas as pd
+
+    if isinstance(paths, str):
+        paths = [paths]
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys([*columns, "candidate.ra", "candidate.dec"]))
+    pixel_ranges = _PixelRanges(cap)
+    frames = []
+    for filepath in list_datasets(paths):
+        table, _ = _read_matching_row_groups(filepath, pixel_ranges, read_columns)
+        if table.num_rows == 0:
+            continue
+        ra = table.column("candidate.ra").to_numpy()
+        dec = table.column("candidate.dec").to_numpy()
+        mask = contains(ra, dec)
+        if not mask.any():
+            continue
+        data = table.filter(mask).to_pandas()
+        frames.append(data[columns] if columns is not None else data)
+    if len(frames) == 0:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def cone_search(
+    paths, ra: float, dec: float, radius: float, columns=None
+) -> "pd.DataFrame":
+    # radius in degrees
+    return region_search(
+        paths,
+        (ra, dec, radius),
+        lambda r, d: angular_distance(r, d, ra, dec) <= radius,
+        columns,
+    )
+
+
+def box_search(paths, ra_min, ra_max, dec_min, dec_max, columns=None) -> "pd.DataFrame":
+    # ra_min > ra_max for boxes across ra = 0
+    return region_search(
+        paths,
+        box_bounding_cap(ra_min, ra_max, dec_min, dec_max),
+        lambda r, d: in_box(r, d, ra_min, ra_max, dec_min, dec_max),
+        columns,
+    )
+
+
+def polygon_search(paths, vertices, columns=None) -> "pd.DataFrame":
+    # vertices as (ra, dec) pairs, the edges being great circles
+    return region_search(
+        paths,
+        polygon_bounding_cap(vertices),
+        lambda r, d: in_polygon(r, d, vertices),
+        columns,
+    )
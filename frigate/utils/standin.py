@@ -0,0 +1,705 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from frigate.utils.crossmatch import ReferenceCatalog
+from frigate.utils.dates import iso_to_jd
+from frigate.utils.synthetic import (
+    SyntheticAlerts,
+    object_index,
+    synthetic_reference_catalog,
+)
+
+# local stand-in for the subset of the Kowalski and Fritz (SkyPortal) APIs that frigate
+# uses, backed by synthetic alerts, so the pipeline can run (and be benchmarked) offline
+#
+# Kowalski: POST /api/auth, GET /, POST /api/queries with query_type info,
+#   count_documents, find (projection/skip/limit), aggregate and cone_search
+# Fritz: GET /api/candidates_filter, /api/sources/<objectId>, /api/classification
+# SIMBAD: in process, query_region of astroquery's Simbad on a synthetic catalog
+
+ZTF_ALERTS_CATALOG = "ZTF_alerts"
+REFERENCE_CATALOG = "Synthetic_reference"
+
+UNITS_TO_DEG = {"arcsec": 1 / 3600, "arcmin": 1 / 60, "deg": 1.0, "rad": 180 / np.pi}
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _nest(row: dict) -> dict:
+    # {"candidate.jd": 1} -> {"candidate": {"jd": 1}}
+    doc = {}
+    for key, value in row.items():
+        parts = key.split(".")
+        target = doc
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return doc
+
+
+def columns_to_documents(columns: dict, nest=True) -> list:
+    keys = [key for key in columns if not key.startswith("_") or key == "_id"]
+    values = [columns[key].tolist() for key in keys]
+    docs = []
+    for row in zip(*values):
+        row = {key: _to_json(value) for key, value in zip(keys, row)}
+        docs.append(_nest(row) if nest else row)
+    return docs
+
+
+def _select(columns: dict, mask) -> dict:
+    return {key: values[mask] for key, values in columns.items()}
+
+
+def _nb_rows(columns: dict) -> int:
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def _is_number(values):
+    values = np.asarray(values)
+    if values.dtype.kind in "iub":
+        return np.ones(len(values), dtype=bool)
+    if values.dtype.kind == "f":
+        return np.isfinite(values)
+    return np.array(
+        [isinstance(v, (int, float)) and v == v for v in values], dtype=bool
+    )
+
+
+def _match(columns: dict, query: dict):
+    n = _nb_rows(columns)
+    mask = np.ones(n, dtype=bool)
+    for key, condition in query.items():
+        if key == "$and":
+            for sub in condition:
+                mask &= _match(columns, sub)
+            continue
+        if key == "$or":
+            mask &= np.any([_match(columns, sub) for sub in condition], axis=0)
+            continue
+        if key not in columns:
+            # missing fields only match {"$exists": False} or None
+            mask &= condition is None or condition == {"$exists": False}
+            continue
+        values = columns[key]
+        if not isinstance(condition, dict):
+            mask &= values == condition
+            continue
+        for operator, operand in condition.items():
+            if operator == "$gte":
+                mask &= values >= operand
+            elif operator == "$gt":
+                mask &= values > operand
+            elif operator == "$lte":
+                mask &= values <= operand
+            elif operator == "$lt":
+                mask &= values < operand
+            elif operator == "$eq":
+                mask &= values == operand
+            elif operator == "$ne":
+                mask &= values != operand
+            elif operator == "$in":
+                mask &= np.isin(values, np.asarray(operand, dtype=values.dtype))
+            elif operator == "$nin":
+                mask &= ~np.isin(values, np.asarray(operand, dtype=values.dtype))
+            elif operator == "$exists":
+                mask &= bool(operand)
+            elif operator == "$type":
+                if operand not in ["number", "double", "int", "long"]:
+                    raise UnsupportedQuery(f"Unsupported $type: {operand}")
+                mask &= _is_number(values)
+            else:
+                raise UnsupportedQuery(f"Unsupported operator: {operator}")
+    return mask
+
+
+def _project(columns: dict, projection: dict) -> dict:
+    if not projection:
+        return columns
+    included = {key for key, value in projection.items() if value and key != "_id"}
+    if included:
+        return {
+            key: values
+            for key, values in columns.items()
+            if any(key == field or key.startswith(field + ".") for field in included)
+        }
+    excluded = [key for key, value in projection.items() if not value]
+    return {
+        key: values
+        for key, values in columns.items()
+        if not any(key == field or key.startswith(field + ".") for field in excluded)
+    }
+
+
+def _evaluate(expression, columns: dict, n: int):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return columns.get(expression[1:], np.full(n, np.nan))
+    if isinstance(expression, dict):
+        (operator, operand), *_ = expression.items()
+        if operator == "$round":
+            values, digits = operand
+            return np.round(_evaluate(values, columns, n).astype(np.float64), digits)
+        if operator == "$isNumber":
+            return _is_number(_evaluate(operand, columns, n))
+        if operator == "$cond":
+            condition, if_true, if_false = operand
+            return np.where(
+                _evaluate(condition, columns, n),
+                _evaluate(if_true, columns, n),
+                _evaluate(if_false, columns, n),
+            )
+        raise UnsupportedQuery(f"Unsupported expression: {operator}")
+    return np.full(n, expression)
+
+
+def _accumulate(accumulator: dict, columns: dict, n: int):
+    (operator, operand), *_ = accumulator.items()
+    values = _evaluate(operand, columns, n)
+    if operator == "$push":
+        return values.tolist()
+    if operator == "$sum":
+        return _to_json(np.sum(values[_is_number(values)]))
+    if operator == "$first":
+        return _to_json(values[0]) if n else None
+    if operator == "$last":
+        return _to_json(values[-1]) if n else None
+    # the other accumulators ignore null and non numeric values, like MongoDB
+    values = values[_is_number(values)].astype(np.float64)
+    if len(values) == 0:
+        return None
+    if operator == "$min":
+        return _to_json(values.min())
+    if operator == "$max":
+        return _to_json(values.max())
+    if operator == "$avg":
+        return _to_json(values.mean())
+    if operator == "$stdDevPop":
+        return _to_json(values.std())
+    raise UnsupportedQuery(f"Unsupported accumulator: {operator}")
+
+
+def _group(columns: dict, spec: dict) -> list:
+    n = _nb_rows(columns)
+    accumulators = {key: value for key, value in spec.items() if key != "_id"}
+    if spec["_id"] is None:
+        groups = [(None, np.ones(n, dtype=bool))]
+    else:
+        keys = _evaluate(spec["_id"], columns, n)
+        groups = [(_to_json(key), keys == key) for key in np.unique(keys)]
+    docs = []
+    for key, mask in groups:
+        selected = _select(columns, mask)
+        doc = {"_id": key}
+        for name, accumulator in accumulators.items():
+            doc[name] = _accumulate(accumulator, selected, int(mask.sum()))
+        docs.append(doc)
+    return docs
+
+
+def _bucket(columns: dict, spec: dict) -> list:
+    n = _nb_rows(columns)
+    values = _evaluate(spec["groupBy"], columns, n).astype(np.float64)
+    boundaries = np.asarray(spec["boundaries"], dtype=np.float64)
+    output = spec.get("output", {"count": {"$sum": 1}})
+    idx = np.searchsorted(boundaries, values, side="right") - 1
+    in_range = (idx >= 0) & (idx < len(boundaries) - 1)
+    docs = []
+    for i in np.unique(idx[in_range]):
+        mask = in_range & (idx == i)
+        doc = {"_id": _to_json(boundaries[i])}
+        for name, accumulator in output.items():
+            doc[name] = _accumulate(
+                accumulator, _select(columns, mask), int(mask.sum())
+            )
+        docs.append(doc)
+    if "default" in spec and (~in_range).any():
+        mask = ~in_range
+        doc = {"_id": spec["default"]}
+        for name, accumulator in output.items():
+            doc[name] = _accumulate(
+                accumulator, _select(columns, mask), int(mask.sum())
+            )
+        docs.append(doc)
+    return docs
+
+
+def _bucket_auto(columns: dict, spec: dict) -> list:
+    n = _nb_rows(columns)
+    values = np.sort(_evaluate(spec["groupBy"], columns, n).astype(np.float64))
+    if len(values) == 0:
+        return []
+    # (nearly) equal count buckets, that never split identical values
+    splits = np.unique(
+        np.searchsorted(
+            values,
+            values[
+                np.linspace(0, len(values), int(spec["buckets"]) + 1, dtype=np.int64)[
+                    1:-1
+                ]
+            ],
+        )
+    )
+    starts = np.concatenate([[0], splits[splits > 0]])
+    ends = np.concatenate([starts[1:], [len(values)]])
+    return [
+        {
+            "_id": {
+                "min": _to_json(values[start]),
+                "max": _to_json(values[end] if end < len(values) else values[-1]),
+            },
+            "count": int(end - start),
+        }
+        for start, end in zip(starts, ends)
+        if end > start
+    ]
+
+
+def _docs_stage(docs: list, stage: dict) -> list:
+    # stages applied after a $group, on (few) documents rather than columns
+    (operator, operand), *_ = stage.items()
+    if operator == "$project":
+        included = [key for key, value in operand.items() if value and key != "_id"]
+        if included:
+            if operand.get("_id", 1):
+                included.append("_id")
+            return [{key: doc[key] for key in included if key in doc} for doc in docs]
+        excluded = [key for key, value in operand.items() if not value]
+        return [{k: v for k, v in doc.items() if k not in excluded} for doc in docs]
+    if operator == "$limit":
+        return docs[: int(operand)]
+    if operator == "$skip":
+        return docs[int(operand) :]
+    raise UnsupportedQuery(f"Unsupported stage after $group: {operator}")
+
+
+def _run_pipeline(columns: dict, pipeline: list):
+    docs = None
+    for stage in pipeline:
+        (operator, operand), *_ = stage.items()
+        if docs is not None:
+            docs = _docs_stage(docs, stage)
+        elif operator == "$match":
+            columns = _select(columns, _match(columns, operand))
+        elif operator == "$project":
+            if all(value in (0, False) for value in operand.values()):
+                columns = _project(columns, operand)
+                continue
+            # inclusion mode, where values can also be expressions ("$field", $round...)
+            projected = {}
+            for key, value in operand.items():
+                if value in (0, False):
+                    continue
+                if value in (1, True):
+                    projected.update(_project(columns, {key: 1}))
+                else:
+                    projected[key] = _evaluate(value, columns, _nb_rows(columns))
+            columns = projected
+        elif operator == "$group":
+            docs = _group(columns, operand)
+        elif operator == "$bucket":
+            docs = _bucket(columns, operand)
+        elif operator == "$bucketAuto":
+            docs = _bucket_auto(columns, operand)
+        elif operator == "$facet":
+            docs = [
+                {name: _run_pipeline(columns, sub) for name, sub in operand.items()}
+            ]
+        elif operator == "$limit":
+            columns = {key: values[: int(operand)] for key, values in columns.items()}
+        else:
+            raise UnsupportedQuery(f"Unsupported stage: {operator}")
+    if docs is None:
+        docs = columns_to_documents(columns)
+    return docs
+
+
+class KowalskiStandin:
+    def __init__(self, alerts: SyntheticAlerts, catalogs=None):
+        self.alerts = alerts
+        # other catalogs are small enough to be held as columns in memory
+        self.catalogs = catalogs or {}
+        self._trees = {}
+
+    def _jd_range(self, query_filter: dict):
+        condition = query_filter.get("candidate.jd", {})
+        if not isinstance(condition, dict):
+            return condition, condition
+        jd_min = max(condition.get("$gte", -np.inf), condition.get("$gt", -np.inf))
+        jd_max = min(condition.get("$lt", np.inf), condition.get("$lte", np.inf))
+        return jd_min, jd_max
+
+    def _iter_matches(self, query_filter: dict):
+        for b in self.alerts.blocks_in_range(*self._jd_range(query_filter)):
+            columns = self.alerts.block(b)
+            mask = _match(columns, query_filter)
+            if mask.any():
+                yield _select(columns, mask)
+
+    def _catalog_columns(self, catalog: str, query_filter: dict):
+        if catalog == ZTF_ALERTS_CATALOG:
+            yield from self._iter_matches(query_filter)
+        elif catalog in self.catalogs:
+            columns = self.catalogs[catalog]
+            yield _select(columns, _match(columns, query_filter))
+        else:
+            raise UnsupportedQuery(f"Unknown catalog: {catalog}")
+
+    def count_documents(self, query: dict):
+        return sum(
+            _nb_rows(columns)
+            for columns in self._catalog_columns(
+                query["catalog"], query.get("filter", {})
+            )
+        )
+
+    def find(self, query: dict, kwargs: dict):
+        # the alerts are generated in candid order, so a sort on candid is a no-op
+        skip = int(kwargs.get("skip", 0))
+        limit = int(kwargs.get("limit", 0)) or np.inf
+        pages = []
+        for columns in self._catalog_columns(query["catalog"], query.get("filter", {})):
+            n = _nb_rows(columns)
+            if skip >= n:
+                skip -= n
+                continue
+            take = int(min(n - skip, limit))
+            pages.append(
+                {key: values[skip : skip + take] for key, values in columns.items()}
+            )
+            skip, limit = 0, limit - take
+            if limit <= 0:
+                break
+        docs = []
+        for columns in pages:
+            docs.extend(
+                columns_to_documents(_project(columns, query.get("projection", {})))
+            )
+        return docs
+
+    def aggregate(self, query: dict):
+        pipeline = query["pipeline"]
+        if not pipeline or "$match" not in pipeline[0]:
+            raise UnsupportedQuery("Aggregation pipelines must start with a $match")
+        chunks = list(self._catalog_columns(query["catalog"], pipeline[0]["$match"]))
+        if chunks:
+            columns = {
+                key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]
+            }
+        else:
+            columns = {}
+        if _nb_rows(columns) == 0:
+            return []
+        return _run_pipeline(columns, pipeline[1:])
+
+    def _reference(self, catalog: str) -> ReferenceCatalog:
+        if catalog not in self._trees:
+            if catalog == ZTF_ALERTS_CATALOG:
+                raise UnsupportedQuery(
+                    "Cone searches are only supported on reference catalogs"
+                )
+            columns = self.catalogs[catalog]
+            self._trees[catalog] = ReferenceCatalog(
+                catalog, columns["ra"], columns["dec"]
+            )
+        return self._trees[catalog]
+
+    def cone_search(self, query: dict):
+        coordinates = query["object_coordinates"]
+        radius = (
+            float(coordinates["cone_search_radius"])
+            * UNITS_TO_DEG[coordinates.get("cone_search_unit", "arcsec")]
+        )
+        names = list(coordinates["radec"].keys())
+        radec = np.asarray(
+            list(coordinates["radec"].values()), dtype=np.float64
+        ).reshape(-1, 2)
+        data = {}
+        for catalog, spec in query["catalogs"].items():
+            columns = self.catalogs[catalog]
+            positions, sources, _ = self._reference(catalog).within(
+                radec[:, 0], radec[:, 1], radius * 3600
+            )
+            starts = np.searchsorted(positions, np.arange(len(names) + 1))
+            data[catalog] = {}
+            for i, name in enumerate(names):
+                selected = _select(columns, sources[starts[i] : starts[i + 1]])
+                selected = _select(selected, _match(selected, spec.get("filter", {})))
+                data[catalog][name] = columns_to_documents(
+                    _project(selected, spec.get("projection", {}))
+                )
+        return data
+
+    def query(self, request: dict):
+        query_type = request.get("query_type")
+        query = request.get("query", {})
+        kwargs = request.get("kwargs", {})
+        try:
+            if query_type == "info":
+                data = [ZTF_ALERTS_CATALOG] + list(self.catalogs)
+            elif query_type == "count_documents":
+                data = self.count_documents(query)
+            elif query_type == "find":
+                data = self.find(query, kwargs)
+            elif query_type == "aggregate":
+                data = self.aggregate(query)
+            elif query_type == "cone_search":
+                data = self.cone_search(query)
+            else:
+                raise UnsupportedQuery(f"Unsupported query_type: {query_type}")
+        except (UnsupportedQuery, KeyError, ValueError) as e:
+            return {"status": "error", "message": f"{type(e).__name__}: {e}"}
+        return {
+            "status": "success",
+            "message": f"Successfully executed {query_type} query",
+            "data": data,
+        }
+
+
+class FritzStandin:
+    def __init__(self, alerts: SyntheticAlerts):
+        self.alerts = alerts
+        self._passing = {}
+
+    def _passing_alerts(self, start_jd, end_jd, filterIDs):
+        # all (filter_id, candid) passing in the window, computed once per window
+        key = (start_jd, end_jd, tuple(filterIDs or []))
+        if key not in self._passing:
+            passing = []
+            for b in self.alerts.blocks_in_range(start_jd, end_jd):
+                columns = self.alerts.block(b)
+                mask = (columns["candidate.jd"] >= start_jd) & (
+                    columns["candidate.jd"] < end_jd
+                )
+                candids = columns["candid"][mask]
+                for candid, passed in zip(
+                    candids.tolist(), self.alerts.passed_filters(candids)
+                ):
+                    passing.extend(
+                        {"filter_id": filter_id, "passing_alert_id": candid}
+                        for filter_id in passed
+                        if not filterIDs or filter_id in filterIDs
+                    )
+            self._passing[key] = passing
+        return self._passing[key]
+
+    def candidates_filter(self, params: dict):
+        filterIDs = [
+            int(x) for value in params.get("filterIDs", []) for x in value.split(",")
+        ]
+        passing = self._passing_alerts(
+            iso_to_jd(params["startDate"][0]),
+            iso_to_jd(params["endDate"][0]),
+            filterIDs,
+        )
+        page = int(params.get("pageNumber", ["1"])[0])
+        numPerPage = min(500, int(params.get("numPerPage", ["100"])[0]))
+        return {
+            "candidates": passing[(page - 1) * numPerPage : page * numPerPage],
+            "totalMatches": len(passing),
+            "pageNumber": page,
+            "numPerPage": numPerPage,
+        }
+
+    def source(self, objectId: str):
+        return {"id": objectId, **self.alerts.source(object_index(objectId))}
+
+    def classifications(self, params: dict):
+        # classifications of the saved sources that have alerts in the window
+        start_jd = iso_to_jd(params["startDate"][0])
+        end_jd = iso_to_jd(params["endDate"][0]) + 1
+        key = ("classifications", start_jd, end_jd)
+        if key not in self._passing:
+            objects = set()
+            for b in self.alerts.blocks_in_range(start_jd, end_jd):
+                columns = self.alerts.block(b)
+                mask = (columns["candidate.jd"] >= start_jd) & (
+                    columns["candidate.jd"] < end_jd
+                )
+                objects.update(np.unique(columns["_object"][mask]).tolist())
+            classifications = []
+            for index in sorted(objects):
+                classifications.extend(self.alerts.source(index)["classifications"])
+            self._passing[key] = classifications
+        classifications = self._passing[key]
+        page = int(params.get("pageNumber", ["1"])[0])
+        numPerPage = int(params.get("numPerPage", ["100"])[0])
+        return {
+            "classifications": classifications[
+                (page - 1) * numPerPage : page * numPerPage
+            ],
+            "totalMatches": len(classifications),
+        }
+
+
+class SimbadStandin:
+    # stand-in for astroquery's Simbad client (query_region, with one or many
+    # coordinates), serving the types of a reference catalog, with injected latency
+    # and failures (ConnectionError) to exercise batching, retries and caching
+    def __init__(self, catalog: dict, latency=0.0, failure_rate=0.0):
+        self.catalog = catalog
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.nb_queries = 0
+        self._reference = ReferenceCatalog("simbad", catalog["ra"], catalog["dec"])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_alerts(cls, alerts: SyntheticAlerts, **kwargs):
+        return cls(synthetic_reference_catalog(alerts), **kwargs)
+
+    def add_votable_fields(self, *args):
+        pass
+
+    def query_region(self, coordinates, radius="0d0m3s", **kwargs):
+        from astropy.coordinates import Angle, SkyCoord
+        from astropy.table import Table
+
+        with self._lock:
+            self.nb_queries += 1
+        if self.latency > 0:
+            time.sleep(random.expovariate(1 / self.latency))
+        if self.failure_rate > 0 and random.random() < self.failure_rate:
+            raise ConnectionError("Injected failure")
+        coordinates = SkyCoord(coordinates).icrs
+        ra = np.atleast_1d(coordinates.ra.deg)
+        dec = np.atleast_1d(coordinates.dec.deg)
+        _, sources, _ = self._reference.within(ra, dec, Angle(radius).arcsec)
+        # like SIMBAD, each source once even if it is around several coordinates
+        sources = np.unique(sources)
+        return Table(
+            {
+                "main_id": np.array(
+                    [f"SYN {i}" for i in self.catalog["_id"][sources]], dtype=object
+                ),
+                "ra": self.catalog["ra"][sources],
+                "dec": self.catalog["dec"][sources],
+                "otype": self.catalog["type"][sources],
+            }
+        )
+
+
+def make_handler(
+    kowalski: KowalskiStandin, fritz: FritzStandin, latency=0.0, failure_rate=0.0
+):
+    class StandinHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _respond(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _inject(self):
+            # injected latency (exponentially distributed around the mean) and failures
+            if latency > 0:
+                time.sleep(random.expovariate(1 / latency))
+            if failure_rate > 0 and random.random() < failure_rate:
+                self._respond(503, {"status": "error", "message": "Injected failure"})
+                return True
+            return False
+
+        def do_GET(self):
+            if self._inject():
+                return
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path in ["", "/"]:
+                self._respond(
+                    200, {"status": "success", "message": "greetings from the stand-in"}
+                )
+            elif url.path == "/api/candidates_filter":
+                self._respond(
+                    200, {"status": "success", "data": fritz.candidates_filter(params)}
+                )
+            elif url.path.startswith("/api/sources/"):
+                self._respond(
+                    200,
+                    {
+                        "status": "success",
+                        "data": fritz.source(url.path.rsplit("/", 1)[-1]),
+                    },
+                )
+            elif url.path == "/api/classification":
+                self._respond(
+                    200, {"status": "success", "data": fritz.classifications(params)}
+                )
+            else:
+                self._respond(
+                    404, {"status": "error", "message": f"Unknown endpoint: {url.path}"}
+                )
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/") == "/api/auth":
+                self._respond(200, {"status": "success", "token": "standin-token"})
+                return
+            if self._inject():
+                return
+            if self.path.rstrip("/") == "/api/queries":
+                response = kowalski.query(request)
+                self._respond(200 if response["status"] == "success" else 400, response)
+            else:
+                self._respond(
+                    404,
+                    {"status": "error", "message": f"Unknown endpoint: {self.path}"},
+                )
+
+    return StandinHandler
+
+
+def start_standin_server(
+    alerts: SyntheticAlerts = None,
+    host="localhost",
+    port=0,
+    latency=0.0,
+    failure_rate=0.0,
+    reference_catalog=True,
+):
+    # starts the server in a background thread, returns it along with its url
+    # (port=0 picks a free port), call server.shutdown() to stop it
+    alerts = alerts or SyntheticAlerts()
+    catalogs = {}
+    if reference_catalog:
+        catalogs[REFERENCE_CATALOG] = synthetic_reference_catalog(alerts)
+    handler = make_handler(
+        KowalskiStandin(alerts, catalogs), FritzStandin(alerts), latency, failure_rate
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def standin_environment(url: str) -> dict:
+    # environment variables pointing frigate to the stand-in
+    parsed = urlparse(url)
+    return {
+        "KOWALSKI_PROTOCOL": parsed.scheme,
+        "KOWALSKI_HOST": parsed.hostname,
+        "KOWALSKI_PORT": str(parsed.port),
+        "KOWALSKI_TOKEN": "standin-token",
+        "SKYPORTAL_HOST": url,
+        "SKYPORTAL_TOKEN": "standin-token",
+    }
@@ -0,0 +1,551 @@
+import json
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from frigate.utils.datasets import dataset_columns, iter_record_batches
+
+GROUP_BY_COLUMNS = {
+    "program": "candidate.programid",
+    "fid": "candidate.fid",
+    "night": "candidate.jd",
+}
+
+
+class RunningStats:
+    # count/min/max/mean/std accumulator, merged with Chan's parallel algorithm
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        finite = np.isfinite(values)
+        self.nulls += int(len(values) - finite.sum())
+        values = values[finite]
+        if len(values) == 0:
+            return
+        other = RunningStats()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self.merge(other)
+
+    def merge(self, other):
+        self.nulls += other.nulls
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        # sample std (ddof=1), like pandas' describe()
+        if self.count < 2:
+            return np.nan
+        return float(np.sqrt(self.m2 / (self.count - 1)))
+
+    def to_dict(self):
+        # min/max are None (not +-inf, which isn't valid JSON) while empty
+        return {
+            "count": self.count,
+            "nulls": self.nulls,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for key, value in data.items():
+            if value is not None:
+                setattr(stats, key, value)
+        return stats
+
+
+class QuantileSketch:
+    # KLL-style sketch: level h holds items of weight 2^h, and a full level is
+    # compacted by sorting it and promoting every other item to the next level.
+    # The error is ~1/k in rank, independent of the number of values added.
+    def __init__(self, k=200):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng()
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(8, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays at this level so no weight is lost
+                keep = items[:0] if len(items) % 2 == 0 else items[-1:]
+                pairs = items[: len(items) - len(keep)]
+                promoted = pairs[self._rng.integers(2) :: 2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+            level += 1
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+        return self
+
+    def weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [
+                np.full(len(level_items), 2**level)
+                for level, level_items in enumerate(self.levels)
+            ]
+        )
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def quantiles(self, qs):
+        items, weights = self.weighted_items()
+        if len(items) == 0:
+            return [np.nan for _ in qs]
+        cumulative = np.cumsum(weights)
+        ranks = np.asarray(qs, dtype=np.float64) * cumulative[-1]
+        idx = np.searchsorted(cumulative, ranks, side="left")
+        return items[np.clip(idx, 0, len(items) - 1)].tolist()
+
+    def to_dict(self):
+        return {"k": self.k, "levels": [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data["k"])
+        sketch.levels = [
+            np.asarray(items, dtype=np.float64) for items in data["levels"]
+        ]
+        return sketch
+
+
+class DistinctCounter:
+    # HyperLogLog with 2^p registers, merged by taking the register-wise max
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(2**p, dtype=np.uint8)
+
+    def add(self, values):
+        values = np.asarray(values)
+        if len(values) == 0:
+            return
+        if values.dtype.kind in "OUS":
+            values = values.astype(object)
+        hashes = pd.util.hash_array(values)
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # rank is the position of the leftmost 1-bit in the remaining 64 - p bits
+        bit_length = np.zeros(len(rest), dtype=np.int64)
+        nonzero = rest > 0
+        bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))) + 1
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m**2 / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            # small range correction (linear counting)
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {"p": self.p, "registers": self.registers.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        counter = cls(p=data["p"])
+        counter.registers = np.asarray(data["registers"], dtype=np.uint8)
+        return counter
+
+
+class FixedHistogram:
+    # histogram with bins fixed up front, so histograms of different batches or
+    # nights can be merged by summing their counts
+    def __init__(self, start, stop, nb_bins):
+        self.start = float(start)
+        self.stop = float(stop)
+        self.nb_bins = int(nb_bins)
+        self.counts = np.zeros(self.nb_bins, dtype=np.int64)
+        # values outside of [start, stop) are counted but not binned
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def edges(self):
+        return np.linspace(self.start, self.stop, self.nb_bins + 1)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        idx = np.floor(
+            (values - self.start) / (self.stop - self.start) * self.nb_bins
+        ).astype(np.int64)
+        self.underflow += int(np.count_nonzero(idx < 0))
+        self.overflow += int(np.count_nonzero(idx >= self.nb_bins))
+        idx = idx[(idx >= 0) & (idx < self.nb_bins)]
+        self.counts += np.bincount(idx, minlength=self.nb_bins)
+
+    def merge(self, other):
+        if (other.start, other.stop, other.nb_bins) != (
+            self.start,
+            self.stop,
+            self.nb_bins,
+        ):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def to_dict(self):
+        return {
+            "start": self.start,
+            "stop": self.stop,
+            "nb_bins": self.nb_bins,
+            "counts": self.counts.tolist(),
+            "underflow": self.underflow,
+            "overflow": self.overflow,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["start"], data["stop"], data["nb_bins"])
+        histogram.counts = np.asarray(data["counts"], dtype=np.int64)
+        histogram.underflow = data["underflow"]
+        histogram.overflow = data["overflow"]
+        return histogram
+
+
+class ColumnStats:
+    # count, moments, min/max and quantile sketch of a column, plus optional fixed-bin
+    # histogram counts (bins as (start, stop, nb_bins)), memory is O(k + bins)
+    def __init__(self, k=200, bins=None):
+        self.moments = RunningStats()
+        self.sketch = QuantileSketch(k=k)
+        self.histogram = FixedHistogram(*bins) if bins is not None else None
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.moments.add(values)
+        self.sketch.add(values)
+        if self.histogram is not None:
+            self.histogram.add(values)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        if self.histogram is not None and other.histogram is not None:
+            self.histogram.merge(other.histogram)
+        return self
+
+    def binned(self, nb_bins=100):
+        # (edges, counts) from the fixed bins if we have them, else approximated
+        # from the weighted items of the quantile sketch
+        if self.histogram is not None:
+            return self.histogram.edges, self.histogram.counts
+        items, weights = self.sketch.weighted_items()
+        if len(items) == 0:
+            return np.linspace(0, 1, nb_bins + 1), np.zeros(nb_bins)
+        counts, edges = np.histogram(items, bins=int(nb_bins), weights=weights)
+        return edges, counts
+
+    def summary(self, quantiles=(0.25, 0.5, 0.75)):
+        summary = {
+            "count": self.moments.count,
+            "nulls": self.moments.nulls,
+            "mean": self.moments.mean if self.moments.count else np.nan,
+            "std": self.moments.std,
+            "min": self.moments.min if self.moments.count else np.nan,
+            "max": self.moments.max if self.moments.count else np.nan,
+        }
+        for q, value in zip(quantiles, self.sketch.quantiles(quantiles)):
+            summary[f"{q:.0%}"] = value
+        return summary
+
+    def to_dict(self):
+        data = {"moments": self.moments.to_dict(), "sketch": self.sketch.to_dict()}
+        if self.histogram is not None:
+            data["histogram"] = self.histogram.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.moments = RunningStats.from_dict(data["moments"])
+        stats.sketch = QuantileSketch.from_dict(data["sketch"])
+        if "histogram" in data:
+            stats.histogram = FixedHistogram.from_dict(data["histogram"])
+        return stats
+
+
+class GroupStats:
+    # everything we accumulate for one (program, fid, night) group
+    def __init__(self, columns, distinct_columns):
+        self.count = 0
+        self.passed_any = 0
+        self.passes = 0
+        self.passes_per_filter = {}
+        self.columns = {column: ColumnStats() for column in columns}
+        self.distinct = {column: DistinctCounter() for column in distinct_columns}
+
+    def merge(self, other):
+        self.count += other.count
+        self.passed_any += other.passed_any
+        self.passes += other.passes
+        for filter_id, count in other.passes_per_filter.items():
+            self.passes_per_filter[filter_id] = (
+                self.passes_per_filter.get(filter_id, 0) + count
+            )
+        for column, stats in other.columns.items():
+            self.columns[column].merge(stats)
+        for column, counter in other.distinct.items():
+            self.distinct[column].merge(counter)
+        return self
+
+    def summary(self, quantiles=(0.25, 0.5, 0.75)):
+        return {
+            "count": self.count,
+            "distinct": {
+                column: counter.estimate() for column, counter in self.distinct.items()
+            },
+            "candidates_passed_any_filter": self.passed_any,
+            "total_filter_passes": self.passes,
+            "unique_filters": len(self.passes_per_filter),
+            "passes_per_filter": dict(
+                sorted(
+                    self.passes_per_filter.items(),
+                    key=lambda item: item[1],
+                    reverse=True,
+                )
+            ),
+            "columns": {
+                column: stats.summary(quantiles)
+                for column, stats in self.columns.items()
+            },
+        }
+
+
+def _group_keys(batch: pa.RecordBatch, group_by: list) -> np.ndarray:
+    keys = []
+    for group in group_by:
+        column = GROUP_BY_COLUMNS[group]
+        values = batch.column(column).to_numpy(zero_copy_only=False)
+        if group == "night":
+            # nights start at 0h UTC, like the default --start of frigate
+            values = np.floor(values - 0.5) + 0.5
+        keys.append(np.asarray(values))
+    return keys
+
+
+def _passed_filters_counts(passed_filters, mask=None):
+    # passed_filters is a list column, we flatten it once instead of looping over rows
+    if mask is not None:
+        passed_filters = passed_filters.filter(pa.array(mask))
+    if pa.types.is_string(passed_filters.type) or pa.types.is_large_string(
+        passed_filters.type
+    ):
+        # csv files store the lists as their string representation
+        passed_filters = pa.array(
+            [json.loads(x) if x else [] for x in passed_filters.to_pylist()]
+        )
+    lengths = pc.list_value_length(passed_filters).fill_null(0).to_numpy()
+    flat = pc.list_flatten(passed_filters).to_numpy(zero_copy_only=False)
+    filter_ids, counts = np.unique(flat, return_counts=True)
+    return (
+        int(np.count_nonzero(lengths)),
+        int(lengths.sum()),
+        dict(zip(filter_ids.tolist(), counts.tolist())),
+    )
+
+
+def _update_group(stats, batch, mask, columns, distinct_columns):
+    stats.count += len(batch) if mask is None else int(mask.sum())
+    for column in columns:
+        if column not in batch.schema.names:
+            continue
+        values = batch.column(column).to_numpy(zero_copy_only=False)
+        stats.columns[column].add(values if mask is None else values[mask])
+    for column in distinct_columns:
+        if column not in batch.schema.names:
+            continue
+        values = batch.column(column).to_numpy(zero_copy_only=False)
+        stats.distinct[column].add(values if mask is None else values[mask])
+    if "passed_filters" in batch.schema.names:
+        passed_any, passes, per_filter = _passed_filters_counts(
+            batch.column("passed_filters"), mask
+        )
+        stats.passed_any += passed_any
+        stats.passes += passes
+        for filter_id, count in per_filter.items():
+            stats.passes_per_filter[filter_id] = (
+                stats.passes_per_filter.get(filter_id, 0) + count
+            )
+
+
+def file_stats(
+    filename, columns, group_by=None, distinct_columns=("objectId",), batch_size=65536
+) -> dict:
+    group_by = group_by or []
+    distinct_columns = list(distinct_columns or [])
+    read_columns = list(
+        dict.fromkeys(
+            columns
+            + distinct_columns
+            + ["passed_filters"]
+            + [GROUP_BY_COLUMNS[group] for group in group_by]
+        )
+    )
+    groups = {}
+    for batch in iter_record_batches(
+        filename, columns=read_columns, batch_size=batch_size
+    ):
+        if len(group_by) == 0:
+            key = ()
+            if key not in groups:
+                groups[key] = GroupStats(columns, distinct_columns)
+            _update_group(groups[key], batch, None, columns, distinct_columns)
+            continue
+        # combine the per-column codes into a single group code per row
+        uniques, codes = zip(
+            *(
+                np.unique(keys, return_inverse=True)
+                for keys in _group_keys(batch, group_by)
+            )
+        )
+        shape = tuple(len(values) for values in uniques)
+        group_codes = np.ravel_multi_index([c.reshape(-1) for c in codes], shape)
+        for code in np.unique(group_codes):
+            idx = np.unravel_index(code, shape)
+            key = tuple(values[i].item() for values, i in zip(uniques, idx))
+            if key not in groups:
+                groups[key] = GroupStats(columns, distinct_columns)
+            _update_group(
+                groups[key], batch, group_codes == code, columns, distinct_columns
+            )
+    return groups
+
+
+def _file_stats_worker(kwargs):
+    return kwargs["filename"], dataset_columns(kwargs["filename"]), file_stats(**kwargs)
+
+
+def compute_dataset_stats(
+    filenames,
+    columns,
+    group_by=None,
+    distinct_columns=("objectId",),
+    quantiles=(0.25, 0.5, 0.75),
+    batch_size=65536,
+    n_threads=None,
+    verbose=True,
+):
+    # single pass over one or many files: each file is streamed by batches in its own
+    # process, and the partial (mergeable) accumulators are combined as they come back
+    group_by = group_by or []
+    for group in group_by:
+        if group not in GROUP_BY_COLUMNS:
+            return (
+                None,
+                f"Invalid group_by: {group}, must be one of {list(GROUP_BY_COLUMNS)}",
+            )
+
+    tasks = [
+        {
+            "filename": filename,
+            "columns": list(columns),
+            "group_by": group_by,
+            "distinct_columns": distinct_columns,
+            "batch_size": batch_size,
+        }
+        for filename in filenames
+    ]
+    groups = {}
+    # columns that are not in every file (e.g. older nights), and in no file at all
+    missing = {column: [] for column in columns}
+    n_threads = n_threads or multiprocessing.cpu_count()
+    n_processes = max(1, min(n_threads, len(tasks)))
+    with multiprocessing.Pool(processes=n_processes) as pool:
+        for filename, file_columns, file_groups in pool.imap_unordered(
+            _file_stats_worker, tasks
+        ):
+            for column in set(columns) - set(file_columns):
+                missing[column].append(filename)
+            for key, stats in file_groups.items():
+                if key in groups:
+                    groups[key].merge(stats)
+                else:
+                    groups[key] = stats
+            if verbose:
+                print(f"Processed {len(groups)} group(s) so far...")
+        pool.close()
+        pool.join()
+
+    unknown = [c for c, files in missing.items() if len(files) == len(tasks)]
+    if len(unknown) > 0:
+        return None, f"Column(s) not found in any of the datasets: {unknown}"
+    for column, files in missing.items():
+        if len(files) > 0:
+            print(
+                f"Warning: column {column} is missing from {len(files)} of the "
+                f"{len(tasks)} dataset(s), e.g. {files[0]}"
+            )
+
+    results = {}
+    for key in sorted(groups):
+        name = (
+            ", ".join(f"{group}={value}" for group, value in zip(group_by, key))
+            or "all"
+        )
+        results[name] = groups[key].summary(quantiles)
+    return results, None
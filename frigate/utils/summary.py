@@ -0,0 +1,202 @@
+import json
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# fixed bins (start, stop, nb_bins) of the histograms we keep for each night,
+# these must not change between nights for the histograms to be mergeable
+DEFAULT_SUMMARY_HISTOGRAMS = {
+    "candidate.drb": (0.0, 1.0, 100),
+    "candidate.magpsf": (12.0, 23.0, 110),
+    "candidate.sigmapsf": (0.0, 0.5, 100),
+    "candidate.fwhm": (0.0, 10.0, 100),
+    "classifications.acai_n": (0.0, 1.0, 100),
+}
+
+SUMMARY_SUFFIX = ".summary.json"
+
+
+def _count_values(values: "pd.Series") -> dict:
+    counts = values.value_counts(dropna=True)
+    return {str(key): int(value) for key, value in counts.items()}
+
+
+def _count_list_values(lists: "pd.Series") -> dict:
+    import numpy as np
+
+    # the list columns are flattened once, instead of iterating over the rows
+    lengths = lists.str.len().fillna(0).astype(int).to_numpy()
+    if lengths.sum() == 0:
+        return {}
+    flat = np.concatenate([np.asarray(x) for x in lists[lengths > 0]])
+    keys, counts = np.unique(flat, return_counts=True)
+    return {str(key): int(count) for key, count in zip(keys.tolist(), counts.tolist())}
+
+
+def compute_night_summary(candidates: "pd.DataFrame", histograms=None) -> dict:
+    import numpy as np
+
+    from frigate.utils.stats import ColumnStats, DistinctCounter, FixedHistogram
+
+    if histograms is None:
+        histograms = DEFAULT_SUMMARY_HISTOGRAMS
+
+    summary = {
+        "count": int(len(candidates)),
+        "jd_min": float(candidates["candidate.jd"].min()) if len(candidates) else None,
+        "jd_max": float(candidates["candidate.jd"].max()) if len(candidates) else None,
+        "count_per_fid": _count_values(candidates["candidate.fid"]),
+        "count_per_programid": _count_values(candidates["candidate.programid"]),
+    }
+
+    objects = DistinctCounter()
+    objects.add(candidates["objectId"].to_numpy())
+    summary["distinct_objects"] = int(candidates["objectId"].nunique())
+    summary["objects_sketch"] = objects.to_dict()
+
+    if "passed_filters" in candidates.columns:
+        summary["passes_per_filter"] = _count_list_values(candidates["passed_filters"])
+        summary["candidates_passed_any_filter"] = int(
+            (candidates["passed_filters"].str.len() > 0).sum()
+        )
+    if "groups" in candidates.columns:
+        saved = candidates[candidates["groups"].str.len() > 0]
+        summary["saved_per_group"] = _count_list_values(saved["groups"])
+        summary["saved_candidates"] = int(len(saved))
+        summary["saved_objects"] = int(saved["objectId"].nunique())
+
+    summary["columns"] = {}
+    for column, (start, stop, nb_bins) in histograms.items():
+        if column not in candidates.columns:
+            continue
+        values = candidates[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        histogram = FixedHistogram(start, stop, nb_bins)
+        histogram.add(values)
+        stats = ColumnStats()
+        stats.add(values)
+        summary["columns"][column] = {
+            "histogram": histogram.to_dict(),
+            "stats": stats.to_dict(),
+        }
+    return summary
+
+
+def summary_filename(filepath):
+    for ext in [".parquet", ".feather", ".csv"]:
+        if filepath.endswith(ext):
+            filepath = filepath[: -len(ext)]
+            break
+    return filepath + SUMMARY_SUFFIX
+
+
+def save_night_summary(summary: dict, filepath: str) -> str:
+    # the summary is stored next to the night's dataset
+    filename = summary_filename(filepath)
+    with open(filename, "w") as f:
+        json.dump(summary, f)
+    return filename
+
+
+def load_night_summaries(directory: str) -> dict:
+    summaries = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(SUMMARY_SUFFIX):
+            continue
+        with open(os.path.join(directory, filename)) as f:
+            summaries[filename[: -len(SUMMARY_SUFFIX)]] = json.load(f)
+    return summaries
+
+
+def load_dataset_summaries(filepaths) -> (dict, str):
+    # the summaries saved next to each of the datasets, by dataset
+    summaries, missing = {}, []
+    for filepath in filepaths:
+        filename = summary_filename(filepath)
+        if not os.path.exists(filename):
+            missing.append(filepath)
+            continue
+        with open(filename) as f:
+            summaries[filepath] = json.load(f)
+    if missing:
+        return (
+            None,
+            f"No summary saved for {len(missing)} dataset(s), e.g. {missing[0]}",
+        )
+    return summaries, None
+
+
+def merge_night_summaries(summaries) -> dict:
+    from frigate.utils.stats import ColumnStats, DistinctCounter, FixedHistogram
+
+    # combine the summaries of many nights (a list, or a dict by night name as
+    # loaded above), e.g. to get the stats of a whole season
+    if not isinstance(summaries, dict):
+        summaries = dict(enumerate(summaries))
+    merged = {"count": 0, "nights": 0, "columns": {}}
+    objects = None
+    count_keys = [
+        "count_per_fid",
+        "count_per_programid",
+        "passes_per_filter",
+        "saved_per_group",
+    ]
+    for night, summary in summaries.items():
+        merged["nights"] += 1
+        merged["count"] += summary["count"]
+        for key in count_keys:
+            for value, count in summary.get(key, {}).items():
+                merged.setdefault(key, {})
+                merged[key][value] = merged[key].get(value, 0) + count
+        for key in ["candidates_passed_any_filter", "saved_candidates"]:
+            if key in summary:
+                merged[key] = merged.get(key, 0) + summary[key]
+
+        night_objects = DistinctCounter.from_dict(summary["objects_sketch"])
+        objects = night_objects if objects is None else objects.merge(night_objects)
+
+        for column, data in summary["columns"].items():
+            histogram = FixedHistogram.from_dict(data["histogram"])
+            stats = ColumnStats.from_dict(data["stats"])
+            if column not in merged["columns"]:
+                merged["columns"][column] = {"histogram": histogram, "stats": stats}
+                continue
+            merged["columns"][column]["stats"].merge(stats)
+            merged_histogram = merged["columns"][column]["histogram"]
+            if merged_histogram is None:
+                continue
+            try:
+                merged_histogram.merge(histogram)
+            except ValueError:
+                # e.g. nights saved with other bins, the moments and sketch still merge
+                print(
+                    f"Warning: the {column} histogram of night {night} has other bins "
+                    "than the previous nights, the merged histogram is dropped"
+                )
+                merged["columns"][column]["histogram"] = None
+
+    merged["distinct_objects"] = objects.estimate() if objects is not None else 0
+    return merged
+
+
+def merged_summary_stats(
+    merged: dict, columns=None, quantiles=(0.25, 0.5, 0.75)
+) -> dict:
+    # the stats of merged summaries, laid out like a group of compute_dataset_stats
+    passes = merged.get("passes_per_filter", {})
+    return {
+        "count": merged["count"],
+        "distinct": {"objectId": merged["distinct_objects"]},
+        "candidates_passed_any_filter": merged.get("candidates_passed_any_filter", 0),
+        "total_filter_passes": sum(passes.values()),
+        "unique_filters": len(passes),
+        "passes_per_filter": dict(
+            sorted(passes.items(), key=lambda item: item[1], reverse=True)
+        ),
+        "columns": {
+            column: data["stats"].summary(quantiles)
+            for column, data in merged["columns"].items()
+            if not columns or column in columns
+        },
+    }
@@ -0,0 +1,292 @@
+import string
+from functools import lru_cache
+
+import numpy as np
+
+# synthetic ZTF alerts, generated block by block and deterministically from a seed,
+# so that very large nights (e.g. 10M alerts) never need to be held in memory at once
+
+CANDID_OFFSET = 2_500_000_000_000_000_000
+LETTERS = np.array(list(string.ascii_lowercase))
+NB_LETTERS = 7
+DEC_MIN = -30.0  # ZTF doesn't observe much further south
+
+# fraction of the alerts of each program
+PROGRAM_WEIGHTS = {1: 0.6, 2: 0.3, 3: 0.1}
+
+# fields frigate's find queries project out
+FRIGATE_EXCLUDED_FIELDS = ["candidate.candid"]
+
+SIMBAD_TYPES = ["Star", "SN", "AGN", "QSO", "EB*", "RRLyr", "CV*", "YSO", "Galaxy"]
+FRITZ_CLASSES = ["Sn Ia", "Sn II", "AGN", "CV", "Varstar", "YSO", "TDE"]
+
+
+def splitmix64(values, salt=0) -> np.ndarray:
+    # vectorized hash of integers, used to derive reproducible per-object or
+    # per-alert properties without storing them
+    z = np.asarray(values, dtype=np.uint64) + np.uint64(
+        (salt * 0x9E3779B97F4A7C15) % 2**64
+    )
+    with np.errstate(over="ignore"):
+        z = z + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def uniform_hash(values, salt=0) -> np.ndarray:
+    return (splitmix64(values, salt) >> np.uint64(11)).astype(np.float64) / 2.0**53
+
+
+def object_ids(indexes, year=24) -> np.ndarray:
+    # ZTF-like objectIds (ZTF24aaabcde), the letters are the object index in base 26
+    indexes = np.asarray(indexes, dtype=np.int64)
+    digits = np.empty((len(indexes), NB_LETTERS), dtype=np.int64)
+    remainder = indexes.copy()
+    for i in range(NB_LETTERS - 1, -1, -1):
+        digits[:, i] = remainder % 26
+        remainder //= 26
+    letters = LETTERS[digits]
+    return np.array([f"ZTF{year}" + "".join(row) for row in letters], dtype=object)
+
+
+def object_index(objectId: str) -> int:
+    index = 0
+    for letter in objectId[-NB_LETTERS:]:
+        index = index * 26 + (ord(letter) - ord("a"))
+    return index
+
+
+def object_positions(indexes):
+    # uniform on the sphere above DEC_MIN
+    indexes = np.asarray(indexes, dtype=np.int64)
+    ra = 360.0 * uniform_hash(indexes, 1)
+    sin_dec_min = np.sin(np.radians(DEC_MIN))
+    dec = np.degrees(
+        np.arcsin(sin_dec_min + (1 - sin_dec_min) * uniform_hash(indexes, 2))
+    )
+    return ra, dec
+
+
+class SyntheticAlerts:
+    def __init__(
+        self,
+        nb_alerts=100_000,
+        t_i=2460355.5,
+        t_f=2460356.5,
+        nb_objects=None,
+        nb_filters=10,
+        pass_rate=0.002,
+        saved_rate=0.1,
+        programids=(1, 2, 3),
+        seed=0,
+        block_size=100_000,
+    ):
+        self.nb_alerts = int(nb_alerts)
+        self.t_i = float(t_i)
+        self.t_f = float(t_f)
+        self.nb_objects = int(nb_objects or max(1, self.nb_alerts // 3))
+        self.filter_ids = list(range(1, int(nb_filters) + 1))
+        self.pass_rate = pass_rate
+        self.saved_rate = saved_rate
+        self.programids = list(programids)
+        self.seed = seed
+        self.block_size = int(block_size)
+        self.nb_blocks = int(np.ceil(self.nb_alerts / self.block_size))
+        weights = np.array([PROGRAM_WEIGHTS.get(p, 0.1) for p in self.programids])
+        self.program_weights = weights / weights.sum()
+        # cache a few blocks, paging through a night hits the same block many times
+        self.block = lru_cache(maxsize=8)(self._block)
+
+    def _block(self, b: int) -> dict:
+        start = b * self.block_size
+        end = min(self.nb_alerts, start + self.block_size)
+        size = end - start
+        rng = np.random.default_rng([self.seed, b])
+        idx = np.arange(start, end, dtype=np.int64)
+
+        # alerts are ordered by jd, one random time per slot of the night
+        jd = self.t_i + (idx + rng.random(size)) / self.nb_alerts * (
+            self.t_f - self.t_i
+        )
+        # a few objects have long histories, most have a handful of alerts
+        objects = (self.nb_objects * rng.random(size) ** 2).astype(np.int64)
+        ra, dec = object_positions(objects)
+        ra = (ra + rng.normal(0, 0.1 / 3600, size) / np.cos(np.radians(dec))) % 360
+        dec = dec + rng.normal(0, 0.1 / 3600, size)
+        base_mag = 16.0 + 5.0 * uniform_hash(objects, 3)
+        real = uniform_hash(objects, 4) > 0.3
+        magpsf = base_mag + rng.normal(0, 0.3, size)
+        sigmapsf = np.clip(0.02 * np.exp((magpsf - 16.0) / 2.5), 0.005, 0.4)
+        drb = np.where(real, rng.beta(8, 1, size), rng.beta(1, 8, size))
+        age = 200.0 * uniform_hash(objects, 5) ** 3
+        fid = np.where(
+            rng.random(size) < 0.45, 1, np.where(rng.random(size) < 0.95, 2, 3)
+        )
+        acai = rng.dirichlet(np.ones(5), size)
+
+        return {
+            "objectId": object_ids(objects),
+            "candid": CANDID_OFFSET + idx,
+            "_object": objects,
+            "candidate.jd": jd,
+            "candidate.fid": fid,
+            "candidate.pid": (jd * 1e5).astype(np.int64),
+            "candidate.programid": rng.choice(
+                self.programids, size=size, p=self.program_weights
+            ),
+            "candidate.candid": CANDID_OFFSET + idx,
+            "candidate.isdiffpos": np.where(rng.random(size) < 0.8, "t", "f").astype(
+                object
+            ),
+            "candidate.nid": (jd - 2458000).astype(np.int64),
+            "candidate.rcid": rng.integers(0, 64, size),
+            "candidate.field": rng.integers(200, 900, size),
+            "candidate.xpos": rng.uniform(0, 3072, size),
+            "candidate.ypos": rng.uniform(0, 3080, size),
+            "candidate.ra": ra,
+            "candidate.dec": dec,
+            "candidate.magpsf": magpsf,
+            "candidate.sigmapsf": sigmapsf,
+            "candidate.chipsf": rng.gamma(2.0, 1.0, size),
+            "candidate.magap": magpsf + rng.normal(0, 0.1, size),
+            "candidate.sigmagap": sigmapsf * 1.2,
+            "candidate.diffmaglim": rng.normal(20.5, 0.3, size),
+            "candidate.distnr": rng.exponential(1.0, size),
+            "candidate.magnr": rng.normal(18.0, 1.5, size),
+            "candidate.rb": np.clip(drb + rng.normal(0, 0.1, size), 0, 1),
+            "candidate.drb": drb,
+            "candidate.rbversion": np.full(size, "t17_f5_c3", dtype=object),
+            "candidate.drbversion": np.full(size, "d6_m7", dtype=object),
+            "candidate.fwhm": rng.gamma(4.0, 0.6, size),
+            "candidate.classtar": rng.random(size),
+            "candidate.sgscore1": uniform_hash(objects, 6),
+            "candidate.distpsnr1": rng.exponential(2.0, size),
+            "candidate.neargaia": np.where(
+                rng.random(size) < 0.2, -999.0, rng.exponential(5.0, size)
+            ),
+            "candidate.maggaia": rng.normal(17.0, 2.0, size),
+            "candidate.scorr": rng.gamma(3.0, 4.0, size),
+            "candidate.ndethist": 1 + (age * uniform_hash(objects, 7)).astype(np.int64),
+            "candidate.ncovhist": 1 + (age * 2).astype(np.int64),
+            "candidate.jdstarthist": jd - age,
+            "candidate.jdendhist": jd - rng.exponential(0.5, size) * (age > 0),
+            "candidate.jdstartref": jd - 2000.0,
+            "candidate.jdendref": jd - 1000.0,
+            "candidate.nframesref": rng.integers(15, 40, size),
+            "candidate.ssdistnr": np.full(size, -999.0),
+            "candidate.ssmagnr": np.full(size, -999.0),
+            "candidate.tooflag": np.zeros(size, dtype=np.int64),
+            "classifications.acai_h": acai[:, 0],
+            "classifications.acai_v": acai[:, 1],
+            "classifications.acai_o": acai[:, 2],
+            "classifications.acai_n": acai[:, 3],
+            "classifications.acai_b": acai[:, 4],
+            "classifications.braai": drb,
+            "classifications.braai_version": np.full(size, "d6_m7", dtype=object),
+            "classifications.acai_h_version": np.full(
+                size, "d1_dnn_20201130", dtype=object
+            ),
+        }
+
+    def dataframe(self, nb_rows=None, exclude=None):
+        # the alerts as frigate stores them (flattened, without the excluded fields),
+        # built straight from the columns, without going through documents
+        import pandas as pd
+
+        from frigate.utils.kowalski import shorten_string_fields
+
+        exclude = set(exclude or FRIGATE_EXCLUDED_FIELDS)
+        nb_rows = min(self.nb_alerts, nb_rows or self.nb_alerts)
+        frames = []
+        for b in range(int(np.ceil(nb_rows / self.block_size))):
+            columns = self.block(b)
+            size = min(self.block_size, nb_rows - b * self.block_size)
+            frames.append(
+                pd.DataFrame(
+                    {
+                        key: values[:size]
+                        for key, values in columns.items()
+                        if not key.startswith("_") and key not in exclude
+                    }
+                )
+            )
+        return shorten_string_fields(pd.concat(frames, ignore_index=True))
+
+    def blocks_in_range(self, jd_min=-np.inf, jd_max=np.inf):
+        # alerts are sorted by jd, so a jd range maps to a range of blocks
+        span = self.t_f - self.t_i
+        first = int(
+            np.clip((jd_min - self.t_i) / span * self.nb_alerts, 0, self.nb_alerts)
+        )
+        last = int(
+            np.clip((jd_max - self.t_i) / span * self.nb_alerts + 1, 0, self.nb_alerts)
+        )
+        return range(
+            first // self.block_size, min(self.nb_blocks, last // self.block_size + 1)
+        )
+
+    def passed_filters(self, candids) -> list:
+        # deterministic subset of the alerts passing each filter
+        candids = np.asarray(candids, dtype=np.int64)
+        passed = [[] for _ in range(len(candids))]
+        for filter_id in self.filter_ids:
+            for i in np.flatnonzero(
+                uniform_hash(candids, 100 + filter_id) < self.pass_rate
+            ):
+                passed[i].append(filter_id)
+        return passed
+
+    def source(self, index: int) -> dict:
+        # what SkyPortal knows about an object: saved groups, classifications, tns name
+        u = uniform_hash([index], 8)[0]
+        if u >= self.saved_rate:
+            return {"groups": [], "classifications": [], "tns_name": None}
+        group_ids = sorted(
+            {1 + int(uniform_hash([index], 9 + i)[0] * 50) for i in range(2)}
+        )
+        classification = FRITZ_CLASSES[
+            int(uniform_hash([index], 11)[0] * len(FRITZ_CLASSES))
+        ]
+        return {
+            "groups": [{"id": group_id} for group_id in group_ids],
+            "classifications": [
+                {
+                    "classification": classification,
+                    "ml": bool(u < self.saved_rate / 4),
+                    "probability": float(uniform_hash([index], 12)[0]),
+                    "obj_id": object_ids([index])[0],
+                }
+            ],
+            "tns_name": f"2024{index % 100000:05d}"
+            if u < self.saved_rate / 2
+            else None,
+        }
+
+
+def synthetic_reference_catalog(
+    alerts: SyntheticAlerts, nb_sources=100_000, matched_fraction=0.3, seed=0
+) -> dict:
+    # reference sources with a type, a fraction of them on top of alert objects
+    # so that crossmatches actually find something
+    rng = np.random.default_rng([seed, 1])
+    nb_matched = int(nb_sources * matched_fraction)
+    objects = rng.choice(
+        alerts.nb_objects, size=min(nb_matched, alerts.nb_objects), replace=False
+    )
+    ra_matched, dec_matched = object_positions(objects)
+    ra_matched = ra_matched + rng.normal(0, 0.3 / 3600, len(objects))
+    dec_matched = dec_matched + rng.normal(0, 0.3 / 3600, len(objects))
+    ra_random, dec_random = object_positions(
+        rng.integers(2**40, 2**41, nb_sources - len(objects))
+    )
+    ra = np.concatenate([ra_matched, ra_random]) % 360
+    dec = np.concatenate([dec_matched, dec_random])
+    return {
+        "_id": np.arange(len(ra)),
+        "ra": ra,
+        "dec": dec,
+        "type": np.array(SIMBAD_TYPES, dtype=object)[
+            rng.integers(0, len(SIMBAD_TYPES), len(ra))
+        ],
+    }
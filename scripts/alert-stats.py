@@ -1,6 +1,7 @@
 import argparse
 import os
 import time
+from multiprocessing.pool import ThreadPool
 
 import arrow
 import corner
@@ -11,6 +12,9 @@ import requests
 from astropy.time import Time
 from penquins import Kowalski
 
+from frigate.utils.stats import ColumnStats, RunningStats
+from frigate.utils.summary import DEFAULT_SUMMARY_HISTOGRAMS
+
 
 def str_to_bool(value):
     if isinstance(value, bool):
@@ -77,199 +81,400 @@ def get_candidates_from_skyportal(t_i, t_f, groupIDs, filterIDs, token, saved=Fa
     return candidates, None
 
 
-def get_values_batch(k, fields, rounding, t_i, t_f, programids, objectIds=None):
+def _values_pipeline(fields, rounding, match):
+    field_leaves = [field.split(".")[-1] for field in fields]
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0}},
+        {"$group": {"_id": None}},
+        {"$project": {"_id": 0}},
+    ]
+    for field, field_leaf in zip(fields, field_leaves):
+        pipeline[1]["$project"][field_leaf] = (
+            {"$round": [f"${field}", rounding]} if rounding else f"${field}"
+        )
+        pipeline[2]["$group"][f"values_{field_leaf}"] = {"$push": f"${field_leaf}"}
+        pipeline[3]["$project"][f"values_{field_leaf}"] = 1
+    return pipeline
+
+
+def iter_values_batches(
+    k, fields, rounding, t_i, t_f, programids, objectIds=None, nb_windows=1
+):
+    # yields the values of each field one query at a time (per jd window, and per
+    # chunk of 1000 objectIds since we can't send too many at once), so callers can
+    # consume a chunk and drop it before the next one arrives
     field_leaves = [field.split(".")[-1] for field in fields]
-    if objectIds is None:
+    for match in _partitions(t_i, t_f, programids, nb_windows, objectIds):
         query = {
             "query_type": "aggregate",
             "query": {
                 "catalog": catalog,
-                "pipeline": [
-                    {
-                        "$match": {
-                            "candidate.jd": {"$gte": t_i, "$lt": t_f},
-                            "candidate.programid": {"$in": programids},
-                        }
-                    },
-                    {
-                        "$project": {
-                            "_id": 0,
-                        }
-                    },
-                    {
-                        "$group": {
-                            "_id": None,
-                            # 'values': {
-                            #     '$push': f'${field_leaf}'
-                            # }
-                        }
-                    },
-                    {
-                        "$project": {
-                            "_id": 0,
-                            # 'values': 1
-                        }
-                    },
-                ],
+                "pipeline": _values_pipeline(fields, rounding, match),
             },
         }
-        for field, field_leaf in zip(fields, field_leaves):
-            query["query"]["pipeline"][1]["$project"][field_leaf] = (
-                {"$round": [f"${field}", rounding]} if rounding else f"${field}"
-            )
-            query["query"]["pipeline"][2]["$group"][f"values_{field_leaf}"] = {
-                "$push": f"${field_leaf}"
-            }
-            query["query"]["pipeline"][3]["$project"][f"values_{field_leaf}"] = 1
-
         response = k.query(query=query).get("default")
         if response is None:
-            return None, "No response"
+            yield None, "No response"
+            return
         if response.get("status") != "success":
-            return None, str(response.get("message"))[:1000]
+            yield None, str(response.get("message"))[:1000]
+            return
         if len(response.get("data", [])) == 0:
-            return None, "No data found"
+            continue
         data = response.get("data", [])[0]
-        data_per_field = {
-            fields[i]: data.get(f"values_{field_leaves[i]}", [])
-            for i in range(len(field_leaves))
-        }
+        yield {
+            field: data.get(f"values_{field_leaf}", [])
+            for field, field_leaf in zip(fields, field_leaves)
+        }, None
 
-    else:
-        # here we batch the queries because we can't send too many objectIds at once, so we cap it to 1000 at a time
-        data_per_field = {}
-        for i in range(0, len(objectIds), 1000):
-            query = {
-                "query_type": "aggregate",
-                "query": {
-                    "catalog": catalog,
-                    "pipeline": [
-                        {
-                            "$match": {
-                                "objectId": {"$in": objectIds[i : i + 1000]},
-                                "candidate.jd": {"$gte": t_i, "$lt": t_f},
-                                "candidate.programid": {"$in": programids},
-                            }
-                        },
-                        {
-                            "$project": {
-                                "_id": 0,
-                            }
-                        },
-                        {
-                            "$group": {
-                                "_id": None,
-                                # 'values': {
-                                #     '$push': f'${field_leaf}'
-                                # }
-                            }
-                        },
-                        {
-                            "$project": {
-                                "_id": 0,
-                                # 'values': 1
-                            }
-                        },
-                    ],
-                },
-            }
-            for field, field_leaf in zip(fields, field_leaves):
-                query["query"]["pipeline"][1]["$project"][field_leaf] = (
-                    {"$round": [f"${field}", rounding]} if rounding else f"${field}"
-                )
-                query["query"]["pipeline"][2]["$group"][f"values_{field_leaf}"] = {
-                    "$push": f"${field_leaf}"
-                }
-                query["query"]["pipeline"][3]["$project"][f"values_{field_leaf}"] = 1
-
-            response = k.query(query=query).get("default")
-            if response is None:
-                return None, "No response"
-            if response.get("status") != "success":
-                return None, str(response.get("message"))[:1000]
-            if len(response.get("data", [])) == 0:
-                return None, "No data found"
-            data = response.get("data", [])[0]
-            for field, field_leaf in zip(fields, field_leaves):
-                data_per_field[field] = data_per_field.get(field, []) + data.get(
-                    f"values_{field_leaf}", []
-                )
+
+def get_values_batch(k, fields, rounding, t_i, t_f, programids, objectIds=None):
+    data_per_field = {field: [] for field in fields}
+    for data, error in iter_values_batches(
+        k, fields, rounding, t_i, t_f, programids, objectIds
+    ):
+        if error:
+            return None, error
+        for field in fields:
+            data_per_field[field].extend(data[field])
+    if all(len(values) == 0 for values in data_per_field.values()):
+        return None, "No data found"
     return data_per_field, None
 
 
+def _population_std(moments):
+    # ddof=0, like the np.std of the earlier versions of this script, so that the
+    # printed numbers stay comparable (RunningStats.std is the sample std)
+    return np.sqrt(moments.m2 / moments.count) if moments.count else np.nan
+
+
+def _stats_from_accumulator(accumulator, nb_bins, values=None):
+    # exact median and histogram from the values when they are kept, else the
+    # fixed bins of the field if it has some, and the quantile sketch as a last
+    # resort (approximate, its bins can be off by a lot in the dense parts)
+    moments = accumulator.moments
+    approximate = values is None
+    if values is not None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+    if values is not None and accumulator.histogram is None and len(values) > 0:
+        counts, edges = np.histogram(values, bins=int(nb_bins))
+    else:
+        edges, counts = accumulator.binned(nb_bins)
+    if values is not None and len(values) > 0:
+        median = float(np.median(values))
+    else:
+        median = accumulator.sketch.quantiles([0.5])[0]
+    return {
+        "min": moments.min,
+        "max": moments.max,
+        "avg": moments.mean,
+        "median": median,
+        "median_approximate": approximate,
+        "std": _population_std(moments),
+        "total": moments.count,
+        "histogram": {
+            "edges": edges,
+            "counts": counts,
+            "approximate": approximate and accumulator.histogram is None,
+        },
+        "accumulator": accumulator,
+    }
+
+
 def get_stats(
-    k, field, rounding, t_i, t_f, programids, passed_filters=None, saved=None
+    k,
+    field,
+    rounding,
+    t_i,
+    t_f,
+    programids,
+    passed_filters=None,
+    saved=None,
+    bins=None,
+    nb_bins=200,
+    nb_windows=1,
+    keep_values=False,
 ):
+    # one accumulator per field and subset consumes the values as each query returns,
+    # so memory is O(bins) rather than O(alerts), unless keep_values is set (corner plots)
     start = time.time()
-    values_all, error = get_values_batch(k, field, rounding, t_i, t_f, programids)
-    if error or values_all is None:
+    bins = bins or {}
+    subsets = {"all": None, "passed_filters": passed_filters, "saved": saved}
+    accumulators = {}
+    values = {}
+    for subset, objectIds in subsets.items():
+        if subset != "all" and not objectIds:
+            continue
+        if subset == "passed_filters":
+            print(f"Getting values for {len(objectIds)} alerts that passed filters...")
+        elif subset == "saved":
+            print(f"Getting values for {len(objectIds)} saved alerts...")
+        accumulators[subset] = {f: ColumnStats(bins=bins.get(f)) for f in field}
+        values[subset] = {f: [] for f in field}
+        for data, error in iter_values_batches(
+            k, field, rounding, t_i, t_f, programids, objectIds, nb_windows
+        ):
+            if error:
+                return None, error
+            for f, chunk in data.items():
+                accumulators[subset][f].add(chunk)
+                if keep_values:
+                    values[subset][f].extend(chunk)
+        if subset == "all" and all(
+            accumulator.moments.count == 0
+            for accumulator in accumulators["all"].values()
+        ):
+            return None, "No data found"
+    end = time.time()
+    print(f"Queries took {end - start:.2f} seconds")
+
+    stats_per_field = {}
+    for f in field:
+        stats_per_field[f] = {}
+        for subset in accumulators:
+            stats_per_field[f][subset] = _stats_from_accumulator(
+                accumulators[subset][f],
+                nb_bins,
+                values[subset][f] if keep_values else None,
+            )
+            if keep_values:
+                stats_per_field[f][subset]["values"] = values[subset][f]
+    return stats_per_field, None
+
+
+def _approximate(stats):
+    return " (approximate)" if stats.get("median_approximate") else ""
+
+
+def merge_stats_per_field(stats_per_field, other, nb_bins=200):
+    # combine the stats of two runs (e.g. two nights) from their accumulators
+    merged = {}
+    for f, subsets in stats_per_field.items():
+        merged[f] = {}
+        for subset, stats in subsets.items():
+            accumulator = ColumnStats.from_dict(stats["accumulator"].to_dict())
+            if subset in other.get(f, {}):
+                accumulator.merge(other[f][subset]["accumulator"])
+            merged[f][subset] = _stats_from_accumulator(accumulator, nb_bins)
+    return merged
+
+
+def _jd_windows(t_i, t_f, nb_windows):
+    edges = np.linspace(t_i, t_f, int(nb_windows) + 1)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def _partitions(t_i, t_f, programids, nb_windows, objectIds=None):
+    # one $match per jd window (and per chunk of 1000 objectIds, if any),
+    # that can all be queried in parallel and merged locally
+    partitions = []
+    for window_start, window_end in _jd_windows(t_i, t_f, nb_windows):
+        match = {
+            "candidate.jd": {"$gte": window_start, "$lt": window_end},
+            "candidate.programid": {"$in": programids},
+        }
+        if objectIds is None:
+            partitions.append(match)
+            continue
+        for i in range(0, len(objectIds), 1000):
+            partitions.append({**match, "objectId": {"$in": objectIds[i : i + 1000]}})
+    return partitions
+
+
+def _run_aggregations(k, pipelines, n_threads):
+    def run(pipeline):
+        query = {
+            "query_type": "aggregate",
+            "query": {"catalog": catalog, "pipeline": pipeline},
+        }
+        response = k.query(query=query).get("default")
+        if response is None:
+            return None, "No response"
+        if response.get("status") != "success":
+            return None, str(response.get("message"))[:1000]
+        return response.get("data", []), None
+
+    with ThreadPool(processes=max(1, min(n_threads, len(pipelines)))) as pool:
+        results = pool.map(run, pipelines)
+    for _, error in results:
+        if error:
+            return None, error
+    return [data for data, _ in results], None
+
+
+def _histogram_median(edges, counts):
+    total = counts.sum()
+    if total == 0:
+        return np.nan
+    cumulative = np.cumsum(counts)
+    i = int(np.searchsorted(cumulative, total / 2))
+    before = cumulative[i - 1] if i > 0 else 0
+    fraction = (total / 2 - before) / counts[i] if counts[i] else 0
+    return float(edges[i] + fraction * (edges[i + 1] - edges[i]))
+
+
+def _rebin_buckets(lower, upper, counts, edges):
+    # spread the counts of variable-width buckets over fixed edges, assuming values
+    # are uniform within each bucket (zero-width buckets are point masses)
+    lower, upper, counts = map(np.asarray, (lower, upper, counts))
+    width = upper - lower
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(
+            width > 0,
+            np.clip((edges[:, None] - lower) / np.where(width > 0, width, 1), 0, 1),
+            (edges[:, None] > lower).astype(np.float64),
+        )
+    cdf = fraction @ counts.astype(np.float64)
+    cdf[-1] = counts.sum()
+    return np.diff(cdf)
+
+
+def get_stats_server_side(
+    k,
+    fields,
+    t_i,
+    t_f,
+    programids,
+    objectIds=None,
+    nb_bins=200,
+    bins_mode="fixed",
+    nb_windows=4,
+    n_threads=4,
+):
+    # only accumulators and bin counts come back from Kowalski, never the raw values
+    field_leaves = [field.split(".")[-1] for field in fields]
+    partitions = _partitions(t_i, t_f, programids, nb_windows, objectIds)
+    nb_bins = int(nb_bins)
+
+    group = {"_id": None}
+    for field, field_leaf in zip(fields, field_leaves):
+        group[f"count_{field_leaf}"] = {
+            "$sum": {"$cond": [{"$isNumber": f"${field}"}, 1, 0]}
+        }
+        group[f"min_{field_leaf}"] = {"$min": f"${field}"}
+        group[f"max_{field_leaf}"] = {"$max": f"${field}"}
+        group[f"avg_{field_leaf}"] = {"$avg": f"${field}"}
+        group[f"std_{field_leaf}"] = {"$stdDevPop": f"${field}"}
+    pipelines = [
+        [{"$match": match}, {"$group": group}, {"$project": {"_id": 0}}]
+        for match in partitions
+    ]
+    results, error = _run_aggregations(k, pipelines, n_threads)
+    if error:
         return None, error
 
-    if len(values_all) == 0:
+    moments = {field: RunningStats() for field in fields}
+    for data in results:
+        if len(data) == 0:
+            continue
+        for field, field_leaf in zip(fields, field_leaves):
+            partial = RunningStats()
+            partial.count = data[0].get(f"count_{field_leaf}", 0)
+            if partial.count == 0:
+                continue
+            partial.mean = data[0][f"avg_{field_leaf}"]
+            partial.m2 = data[0][f"std_{field_leaf}"] ** 2 * partial.count
+            partial.min = data[0][f"min_{field_leaf}"]
+            partial.max = data[0][f"max_{field_leaf}"]
+            moments[field].merge(partial)
+    if all(moments[field].count == 0 for field in fields):
         return None, "No data found"
 
-    if passed_filters:
-        print(f"Getting values for {len(passed_filters)} alerts that passed filters...")
-        values_passed_filters, error = get_values_batch(
-            k, field, rounding, t_i, t_f, programids, passed_filters
-        )
-        if error or values_passed_filters is None:
-            return None, error
-    if saved:
-        print(f"Getting values for {len(saved)} saved alerts...")
-        values_saved, error = get_values_batch(
-            k, field, rounding, t_i, t_f, programids, saved
+    facets = {}
+    edges_per_field = {}
+    for field, field_leaf in zip(fields, field_leaves):
+        numbers_only = {"$match": {field: {"$type": "number"}}}
+        if bins_mode == "auto":
+            facets[field_leaf] = [
+                numbers_only,
+                {"$bucketAuto": {"groupBy": f"${field}", "buckets": nb_bins}},
+            ]
+            continue
+        low, high = moments[field].min, moments[field].max
+        if not np.isfinite(low):
+            low, high = 0.0, 1.0
+        # the last boundary is exclusive in $bucket, so we nudge it past the max
+        edges = np.linspace(low, high if high > low else low + 1, nb_bins + 1)
+        edges[-1] = np.nextafter(edges[-1], np.inf)
+        edges_per_field[field] = edges
+        facets[field_leaf] = [
+            numbers_only,
+            {
+                "$bucket": {
+                    "groupBy": f"${field}",
+                    "boundaries": edges.tolist(),
+                    "default": "out_of_range",
+                    "output": {"count": {"$sum": 1}},
+                }
+            },
+        ]
+    pipelines = [[{"$match": match}, {"$facet": facets}] for match in partitions]
+    results, error = _run_aggregations(k, pipelines, n_threads)
+    if error:
+        return None, error
+
+    stats_per_field = {}
+    for field, field_leaf in zip(fields, field_leaves):
+        buckets = [
+            bucket
+            for data in results
+            if len(data) > 0
+            for bucket in data[0].get(field_leaf, [])
+        ]
+        if bins_mode == "auto":
+            lower = [bucket["_id"]["min"] for bucket in buckets]
+            upper = [bucket["_id"]["max"] for bucket in buckets]
+            low = min(lower, default=0.0)
+            high = max(upper, default=1.0)
+            edges = np.linspace(low, high if high > low else low + 1, nb_bins + 1)
+            counts = _rebin_buckets(
+                lower, upper, [bucket["count"] for bucket in buckets], edges
+            )
+        else:
+            edges = edges_per_field[field]
+            counts = np.zeros(nb_bins, dtype=np.float64)
+            in_range = [bucket for bucket in buckets if bucket["_id"] != "out_of_range"]
+            idx = np.searchsorted(
+                edges, [bucket["_id"] for bucket in in_range], side="right"
+            )
+            np.add.at(
+                counts,
+                np.clip(idx - 1, 0, nb_bins - 1),
+                [bucket["count"] for bucket in in_range],
+            )
+        stats_per_field[field] = {
+            "min": moments[field].min,
+            "max": moments[field].max,
+            "avg": moments[field].mean,
+            "median": _histogram_median(edges, counts),
+            "median_approximate": True,
+            "std": _population_std(moments[field]),
+            "total": moments[field].count,
+            "histogram": {"edges": edges, "counts": counts},
+        }
+    return stats_per_field, None
+
+
+def get_stats_per_subset_server_side(
+    k, fields, t_i, t_f, programids, passed_filters=None, saved=None, **kwargs
+):
+    start = time.time()
+    subsets = {"all": None, "passed_filters": passed_filters, "saved": saved}
+    stats_per_field = {field: {} for field in fields}
+    for subset, objectIds in subsets.items():
+        if subset != "all" and not objectIds:
+            continue
+        stats, error = get_stats_server_side(
+            k, fields, t_i, t_f, programids, objectIds=objectIds, **kwargs
         )
-        if error or values_saved is None:
+        if error or stats is None:
             return None, error
+        for field in fields:
+            stats_per_field[field][subset] = stats[field]
     end = time.time()
     print(f"Queries took {end - start:.2f} seconds")
-    stats_per_field = {}
-    # if one of the field_leaf is neargaia, we want to filter out values where the gaia distance is too large in the negative direction
-    # basically when that distance is missing, the value is set to -999, so we want to filter those out
-    # find the indexes where the gaia distance is not -999 and remove the corresponding values from all the other fields
-    # if "neargaia" in values_all:
-    #     gaia_missing_indexes = np.where(values_all["neargaia"] == -999)[0]
-    #     values_all = {k: v[~gaia_missing_indexes] for k, v in values_all.items()}
-    # if passed_filters and "neargaia" in values_passed_filters:
-    #     gaia_missing_indexes = np.where(values_passed_filters["neargaia"] == -999)[0]
-    #     values_passed_filters = {k: v[~gaia_missing_indexes] for k, v in values_passed_filters.items()}
-    # if saved and "neargaia" in values_saved:
-    #     gaia_missing_indexes = np.where(values_saved["neargaia"] == -999)[0]
-    #     values_saved = {k: v[~gaia_missing_indexes] for k, v in values_saved.items()}
-
-    for field_leaf, values in values_all.items():
-        stats_per_field[field_leaf] = {
-            "all": {
-                "min": np.min(values),
-                "max": np.max(values),
-                "avg": np.mean(values),
-                "median": np.median(values),
-                "std": np.std(values),
-                "total": len(values),
-                "values": values,
-            }
-        }
-        if passed_filters:
-            stats_per_field[field_leaf]["passed_filters"] = {
-                "min": np.min(values_passed_filters[field_leaf]),
-                "max": np.max(values_passed_filters[field_leaf]),
-                "avg": np.mean(values_passed_filters[field_leaf]),
-                "median": np.median(values_passed_filters[field_leaf]),
-                "std": np.std(values_passed_filters[field_leaf]),
-                "total": len(values_passed_filters[field_leaf]),
-                "values": values_passed_filters[field_leaf],
-            }
-        if saved:
-            stats_per_field[field_leaf]["saved"] = {
-                "min": np.min(values_saved[field_leaf]),
-                "max": np.max(values_saved[field_leaf]),
-                "avg": np.mean(values_saved[field_leaf]),
-                "median": np.median(values_saved[field_leaf]),
-                "std": np.std(values_saved[field_leaf]),
-                "total": len(values_saved[field_leaf]),
-                "values": values_saved[field_leaf],
-            }
     return stats_per_field, None
 
 
@@ -285,7 +490,16 @@ def plot_histogram(stats_per_field, nb_bins=100):
             data["all"]["min"], data["passed_filters"]["min"], data["saved"]["min"]
         )
         for key, color in zip(["all", "passed_filters", "saved"], ["b", "r", "g"]):
-            if key in data:
+            if key in data and "histogram" in data[key]:
+                # already binned (server-side), we only draw the counts
+                axes[column][row].stairs(
+                    data[key]["histogram"]["counts"],
+                    data[key]["histogram"]["edges"],
+                    fill=True,
+                    alpha=0.8,
+                    color=color,
+                )
+            elif key in data:
                 binwidth = (max(data[key]["values"]) - min(data[key]["values"])) / min(
                     nb_bins, len(data[key]["values"])
                 )
@@ -396,8 +610,38 @@ if __name__ == "__main__":
         "--sp_filterIDs", type=str, default=None, help="SkyPortal group IDs"
     )
     parser.add_argument("--k_token", type=str, default=None, help="Kowalski token")
+    parser.add_argument(
+        "--server_side",
+        type=str_to_bool,
+        nargs="?",
+        const=True,
+        default=False,
+        help="Compute the stats and histograms on Kowalski instead of fetching all values",
+    )
+    parser.add_argument(
+        "--bins_mode",
+        type=str,
+        default="fixed",
+        help="Server-side binning: fixed (between min and max) or auto (equal counts)",
+    )
+    parser.add_argument(
+        "--nb_windows",
+        type=int,
+        default=4,
+        help="Number of jd windows to split the queries into",
+    )
+    parser.add_argument(
+        "--n_threads",
+        type=int,
+        default=4,
+        help="Number of server-side aggregations to run in parallel",
+    )
     args = parser.parse_args()
 
+    if args.bins_mode not in ["fixed", "auto"]:
+        print(f"Invalid bins_mode: {args.bins_mode}, must be one of ['fixed', 'auto']")
+        exit(1)
+
     if not args.k_token:
         print("No Kowalski token provided")
         exit(1)
@@ -455,6 +699,7 @@ if __name__ == "__main__":
     else:
         t_f = t_i + args.nb_days
 
+    candidates, saved = None, None
     if args.sp_token and (args.sp_groupIDs or args.sp_filterIDs):
         if args.sp_groupIDs:
             try:
@@ -534,16 +779,40 @@ if __name__ == "__main__":
     print(
         f"Querying Kowalski for stats for {fields} from {t_i} to {t_f} for programids {programids} {'with rounding to ' + str(rounding) if rounding else ''}..."
     )
-    stats_per_field, error = get_stats(
-        k,
-        fields,
-        rounding,
-        t_i,
-        t_f,
-        programids,
-        passed_filters=candidates,
-        saved=saved,
-    )
+    if args.server_side:
+        stats_per_field, error = get_stats_per_subset_server_side(
+            k,
+            fields,
+            t_i,
+            t_f,
+            programids,
+            passed_filters=candidates,
+            saved=saved,
+            nb_bins=args.nb_bins,
+            bins_mode=args.bins_mode,
+            nb_windows=args.nb_windows,
+            n_threads=args.n_threads,
+        )
+    else:
+        stats_per_field, error = get_stats(
+            k,
+            fields,
+            rounding,
+            t_i,
+            t_f,
+            programids,
+            passed_filters=candidates,
+            saved=saved,
+            bins={
+                field: DEFAULT_SUMMARY_HISTOGRAMS[field]
+                for field in fields
+                if field in DEFAULT_SUMMARY_HISTOGRAMS
+            },
+            nb_bins=args.nb_bins,
+            nb_windows=args.nb_windows,
+            # corner plots are the only consumer of the raw values
+            keep_values=args.plot,
+        )
     if error:
         print(f"Failed to get stats for {fields}: {error}")
         exit(1)
@@ -555,21 +824,26 @@ if __name__ == "__main__":
         print(f"    min: {stats['all']['min']}")
         print(f"    max: {stats['all']['max']}")
         print(f"    average: {stats['all']['avg']}")
-        print(f"    median: {stats['all']['median']}")
+        print(f"    median: {stats['all']['median']}{_approximate(stats['all'])}")
         print(f"    standard deviation: {stats['all']['std']}")
         if "passed_filters" in stats:
             print("  Alerts that passed filters:")
             print(f"    min: {stats['passed_filters']['min']}")
             print(f"    max: {stats['passed_filters']['max']}")
             print(f"    average: {stats['passed_filters']['avg']}")
-            print(f"    median: {stats['passed_filters']['median']}")
+            print(
+                f"    median: {stats['passed_filters']['median']}"
+                f"{_approximate(stats['passed_filters'])}"
+            )
             print(f"    standard deviation: {stats['passed_filters']['std']}")
         if "saved" in stats:
             print("  Saved alerts:")
             print(f"    min: {stats['saved']['min']}")
             print(f"    max: {stats['saved']['max']}")
             print(f"    average: {stats['saved']['avg']}")
-            print(f"    median: {stats['saved']['median']}")
+            print(
+                f"    median: {stats['saved']['median']}{_approximate(stats['saved'])}"
+            )
             print(f"    standard deviation: {stats['saved']['std']}")
 
     print(
@@ -587,4 +861,7 @@ if __name__ == "__main__":
     if args.plot:
         plot_histogram(stats_per_field, nb_bins=args.nb_bins)
 
-        plot_corner(stats_per_field)
+        if args.server_side:
+            print("Corner plots need the raw values, skipping them in server-side mode")
+        else:
+            plot_corner(stats_per_field)
@@ -0,0 +1,373 @@
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from frigate.__main__ import add_passed_filters, add_source_metadata
+from frigate.utils.datasets import save_dataframe, load_dataframe
+from frigate.utils.kowalski import concat_candidates, flatten_candidates_page
+from frigate.utils.parsers import str_to_bool
+from frigate.utils.standin import columns_to_documents
+from frigate.utils.stats import compute_dataset_stats
+from frigate.utils.synthetic import (
+    FRIGATE_EXCLUDED_FIELDS,
+    SyntheticAlerts,
+    object_index,
+)
+
+PAGE_SIZE = 10000  # same page size as get_candidates_from_kowalski
+
+IO_FORMATS = {
+    "parquet": [None, "snappy", "gzip", "brotli"],
+    "feather": [None, "lz4", "zstd"],
+    "csv": [None, "gzip"],
+}
+
+BENCHMARKS = [
+    "flatten_page",
+    "concat_sort",
+    "passed_filters",
+    "source_metadata",
+    "save_load",
+    "compute_stats",
+    "preprocess",
+]
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                stderr=subprocess.DEVNULL,
+                # the commit of the benchmarked code, wherever this is run from
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def measure(func, setup=None, repeat=3, trace_memory=True):
+    # best wall time over the repeats, and the peak memory allocated by
+    # python (numpy and pandas included) during one extra, traced, run.
+    # allocations made by arrow's own memory pool are not traced, and neither
+    # are those of child processes, so trace_memory=False for those (peak None)
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        gc.collect()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+        del args
+    if not trace_memory:
+        return min(times), None
+    args = setup() if setup is not None else ()
+    gc.collect()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 1024**2
+
+
+def synthetic_pages(alerts, nb_rows):
+    # raw find results, as Kowalski returns them, one list of documents per page
+    pages = []
+    for start in range(0, nb_rows, PAGE_SIZE):
+        end = min(start + PAGE_SIZE, nb_rows)
+        b, offset = divmod(start, alerts.block_size)
+        columns = {
+            key: values[offset : offset + end - start]
+            for key, values in alerts.block(b).items()
+            if key not in FRIGATE_EXCLUDED_FIELDS
+        }
+        pages.append(columns_to_documents(columns))
+    return pages
+
+
+def synthetic_candids_per_filter(alerts, candidates):
+    candids_per_filter = {filter_id: [] for filter_id in alerts.filter_ids}
+    candids = candidates["candid"].values
+    for candid, passed in zip(candids, alerts.passed_filters(candids)):
+        for filter_id in passed:
+            candids_per_filter[filter_id].append(int(candid))
+    return candids_per_filter
+
+
+def synthetic_source_metadata(alerts, candidates):
+    object_ids = candidates[candidates["passed_filters"].apply(len) > 0][
+        "objectId"
+    ].unique()
+    source_metadata = {}
+    for object_id in object_ids:
+        # same shape as get_source_metadata_from_skyportal
+        source = alerts.source(object_index(object_id))
+        source_metadata[object_id] = {
+            "group_ids": [group["id"] for group in source["groups"]],
+            "classifications": {
+                c["classification"] for c in source["classifications"] if not c["ml"]
+            },
+            "tns_name": source["tns_name"],
+        }
+    return source_metadata
+
+
+def run_benchmarks(alerts, nb_rows, benchmarks, repeat, directory, n_threads):
+    results = []
+
+    def record(name, seconds, peak, **extra):
+        result = {
+            "name": name,
+            "rows": nb_rows,
+            "seconds": round(seconds, 6),
+            "rows_per_second": round(nb_rows / seconds, 1) if seconds > 0 else None,
+            "peak_memory_mb": round(peak, 3) if peak is not None else None,
+            **extra,
+        }
+        results.append(result)
+        print(
+            f"{name:<32} {nb_rows:>10} rows {seconds:>10.4f}s "
+            f"{result['rows_per_second'] or 0:>14.0f} rows/s "
+            + (f"{peak:>10.1f} MB" if peak is not None else f"{'n/a':>13}")
+            + (
+                f" {extra['file_size'] / 1024**2:>10.2f} MB on disk"
+                if "file_size" in extra
+                else ""
+            )
+        )
+
+    if "flatten_page" in benchmarks or "concat_sort" in benchmarks:
+        pages = synthetic_pages(alerts, nb_rows)
+        if "flatten_page" in benchmarks:
+            seconds, peak = measure(
+                lambda: [flatten_candidates_page(page) for page in pages], repeat=repeat
+            )
+            record("flatten_page", seconds, peak)
+        if "concat_sort" in benchmarks:
+            frames = [flatten_candidates_page(page) for page in pages]
+            # pages come back out of order from the pool
+            frames = frames[::-1]
+            seconds, peak = measure(lambda: concat_candidates(frames), repeat=repeat)
+            record("concat_sort", seconds, peak)
+            del frames
+        del pages
+
+    candidates = alerts.dataframe(nb_rows)
+    candids_per_filter = synthetic_candids_per_filter(alerts, candidates)
+    if "passed_filters" in benchmarks:
+        seconds, peak = measure(
+            add_passed_filters,
+            setup=lambda: (candidates.copy(), candids_per_filter),
+            repeat=repeat,
+        )
+        record("passed_filters", seconds, peak)
+
+    candidates = add_passed_filters(candidates, candids_per_filter)
+    source_metadata = synthetic_source_metadata(alerts, candidates)
+    if "source_metadata" in benchmarks:
+        seconds, peak = measure(
+            add_source_metadata,
+            setup=lambda: (candidates.copy(), source_metadata),
+            repeat=repeat,
+        )
+        record("source_metadata", seconds, peak)
+    candidates = add_source_metadata(candidates, source_metadata)
+
+    if "save_load" in benchmarks:
+        for format, compressions in IO_FORMATS.items():
+            for compression in compressions:
+                filename = f"benchmark_{nb_rows}_{compression}.{format}"
+                filepath = os.path.join(directory, filename)
+                label = f"{format}/{compression or 'none'}"
+
+                def save(filename=filename, format=format, compression=compression):
+                    save_dataframe(
+                        candidates, filename, format, compression, None, directory
+                    )
+
+                def load(filename=filename, format=format):
+                    load_dataframe(filename, format, directory)
+
+                seconds, peak = measure(save, repeat=repeat)
+                file_size = os.path.getsize(filepath)
+                record(f"save {label}", seconds, peak, file_size=file_size)
+                seconds, peak = measure(load, repeat=repeat)
+                record(f"load {label}", seconds, peak, file_size=file_size)
+                os.remove(filepath)
+
+    if "compute_stats" in benchmarks:
+        filename = f"benchmark_{nb_rows}.parquet"
+        save_dataframe(candidates, filename, "parquet", None, None, directory)
+        filepath = os.path.join(directory, filename)
+        seconds, peak = measure(
+            lambda: compute_dataset_stats(
+                [filepath],
+                columns=["candidate.magpsf", "candidate.drb", "candidate.fwhm"],
+                group_by=["program", "fid"],
+                n_threads=n_threads,
+                verbose=False,
+            ),
+            repeat=repeat,
+            # the files are read in pool processes, tracemalloc can't see them
+            trace_memory=False,
+        )
+        record("compute_stats", seconds, peak)
+        os.remove(filepath)
+
+    if "preprocess" in benchmarks:
+        sys.path.insert(
+            0, os.path.join(os.path.dirname(__file__), "..", "visualizations", "tsne")
+        )
+        from tsne_utils import alert_preprocessor
+
+        filename = f"benchmark_{nb_rows}.parquet"
+        save_dataframe(candidates, filename, "parquet", None, None, directory)
+        filepath = os.path.join(directory, filename)
+        seconds, peak = measure(
+            lambda: alert_preprocessor(filepath, edit_filters=True).preprocess_data(),
+            repeat=repeat,
+        )
+        record("preprocess", seconds, peak)
+        os.remove(filepath)
+
+    return results
+
+
+def load_results(results_path):
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(results, previous):
+    # compare with the latest results for the same benchmark and scale
+    latest = {}
+    for result in previous:
+        latest[(result["name"], result["rows"])] = result
+    print(
+        f"\n{'benchmark':<32} {'rows':>10} {'before':>10} {'after':>10} {'speedup':>8}"
+    )
+    for result in results:
+        before = latest.get((result["name"], result["rows"]))
+        if before is None:
+            continue
+        speedup = (
+            before["seconds"] / result["seconds"] if result["seconds"] > 0 else np.inf
+        )
+        print(
+            f"{result['name']:<32} {result['rows']:>10} {before['seconds']:>10.4f} "
+            f"{result['seconds']:>10.4f} {speedup:>7.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot paths of frigate on synthetic alerts, offline."
+    )
+    parser.add_argument(
+        "--scales",
+        type=str,
+        default="10000,100000",
+        help="Comma-separated numbers of alerts to run the benchmarks with",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        type=str,
+        default=",".join(BENCHMARKS),
+        help=f"Comma-separated benchmarks to run, among: {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per benchmark, the best is kept"
+    )
+    parser.add_argument("--nb_filters", type=int, default=10)
+    parser.add_argument("--pass_rate", type=float, default=0.002)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n_threads", type=int, default=1)
+    parser.add_argument(
+        "--results_path",
+        type=str,
+        default="./data/benchmarks/results.jsonl",
+        help="JSON lines file the results are appended to",
+    )
+    parser.add_argument(
+        "--save", type=str_to_bool, default=True, help="Append the results"
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="Commit to compare against, using its results in the results file",
+    )
+    args = parser.parse_args()
+
+    benchmarks = [b.strip() for b in args.benchmarks.split(",") if b.strip()]
+    unknown = set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        print(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        exit(1)
+    scales = [int(float(scale)) for scale in args.scales.split(",")]
+
+    commit = git_commit()
+    timestamp = datetime.now(timezone.utc).isoformat()
+    print(f"Benchmarking commit {commit} at scales {scales}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for nb_rows in scales:
+            alerts = SyntheticAlerts(
+                nb_alerts=nb_rows,
+                nb_filters=args.nb_filters,
+                pass_rate=args.pass_rate,
+                seed=args.seed,
+            )
+            results.extend(
+                run_benchmarks(
+                    alerts, nb_rows, benchmarks, args.repeat, directory, args.n_threads
+                )
+            )
+
+    for result in results:
+        result.update(
+            {
+                "commit": commit,
+                "timestamp": timestamp,
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+            }
+        )
+
+    if args.compare is not None:
+        previous = [
+            result
+            for result in load_results(args.results_path)
+            if result.get("commit") == args.compare
+        ]
+        if len(previous) == 0:
+            print(f"No results found for commit {args.compare} in {args.results_path}")
+        else:
+            compare(results, previous)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results_path)), exist_ok=True)
+        with open(args.results_path, "a") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        print(f"\nSaved {len(results)} results to {args.results_path}")
+
+
+if __name__ == "__main__":
+    main()
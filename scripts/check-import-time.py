@@ -0,0 +1,69 @@
+# check that the frigate CLI starts fast: `frigate --help` must not import any of the
+# heavy modules (they are only loaded in the code paths that use them), and the
+# imports it does need must stay within a time budget
+import argparse
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = [
+    "astropy",
+    "numpy",
+    "pandas",
+    "penquins",
+    "pyarrow",
+    "tqdm",
+    "requests",
+]
+
+# modules imported by the interpreter itself before running frigate
+STARTUP_MODULES = ["site", "encodings", "_frozen_importlib_external", "zipimport"]
+
+
+def measure_imports(command, env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to run {command}: {result.stderr[-1000:]}")
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = int(cumulative)
+        # only count top-level imports, their cumulative time includes the nested ones
+        if not name[1:].startswith(" ") and name.strip() not in STARTUP_MODULES:
+            total += int(cumulative)
+    return total / 1e6, modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of the CLI")
+    parser.add_argument(
+        "--budget", type=float, default=0.25, help="Import time budget in seconds"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of runs, the fastest is kept"
+    )
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": os.getcwd()}
+    failed = False
+    for command in [["frigate", "--help"], ["scripts/loop-frigate.py", "--help"]]:
+        runs = [measure_imports(command, env) for _ in range(args.repeat)]
+        elapsed, modules = min(runs, key=lambda run: run[0])
+        heavy = [module for module in HEAVY_MODULES if module in modules]
+        print(f"{' '.join(command)}: imports took {elapsed:.3f}s")
+        if heavy:
+            print(f"  imports heavy modules: {heavy}")
+            failed = True
+        if elapsed > args.budget:
+            print(f"  exceeds the import time budget of {args.budget:.3f}s")
+            failed = True
+
+    exit(1 if failed else 0)
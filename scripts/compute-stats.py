@@ -1,41 +1,57 @@
-# we want to open a given dataset and compute some statistics on a set of columns
-import os
+# we want to open one or many datasets and compute some statistics on a set of columns
+# in a single streaming pass, without loading the datasets in memory, or to merge the
+# summaries saved next to them at ingest (e.g. to get the stats of a range of nights)
 import json
 
-from frigate.utils.datasets import load_dataframe, compute_column_stats
 from frigate.utils.parsers import stats_parser_args
+from frigate.utils.stats import compute_dataset_stats
+from frigate.utils.summary import (
+    load_dataset_summaries,
+    merge_night_summaries,
+    merged_summary_stats,
+)
 
 if __name__ == "__main__":
     args = stats_parser_args()
-    elements = os.path.split(args.dataset_path)
-    dataset = elements[-1]
-    path = elements[0]
 
-    df = load_dataframe(filename=dataset, directory=path)
-    # DEBUG: print the first 10 rows of the dataframe
-    print(df.head(10))
-
-    # print the total number of unique filters
-    unique_filter_ids = []
-    for index, row in df.iterrows():
-        unique_filter_ids.extend(row["passed_filters"])
-    unique_filter_ids = list(set(unique_filter_ids))
-    print(f"\nTotal number of unique filters: {len(unique_filter_ids)}")
-
-    # get the candidates that passed at least one filter, i.e the ones where len(passed_filters) > 0
-    candidates_passed_filters = df[df["passed_filters"].apply(lambda x: len(x) > 0)]
-    print(
-        f"Number of candidates that passed at least one filter: {len(candidates_passed_filters)}"
-    )
-
-    # print the total number of candidates passing filters per filter, so basically the sum of all the passed_filters
-    total = 0
-    for index, row in df.iterrows():
-        total += len(row["passed_filters"])
-
-    print(f"Total number of candidates passing any filters: {total}")
-
-    for column in args.columns:
-        stats = compute_column_stats(df, column)
-        print(f"\nStats for column {column}:")
-        print(json.dumps(stats, indent=4))
+    if args.from_summaries:
+        summaries, err = load_dataset_summaries(args.dataset_path)
+        if not err:
+            merged = merge_night_summaries(summaries)
+            stats = {
+                f"{merged['nights']} night(s)": merged_summary_stats(
+                    merged, args.columns, args.quantiles
+                )
+            }
+    else:
+        stats, err = compute_dataset_stats(
+            args.dataset_path,
+            args.columns,
+            group_by=args.group_by,
+            quantiles=args.quantiles,
+            batch_size=args.batch_size,
+            n_threads=args.n_threads,
+        )
+    if err:
+        print(err)
+        exit(1)
+
+    for group, group_stats in stats.items():
+        print(f"\n=== {group} ===")
+        print(f"Total number of candidates: {group_stats['count']}")
+        print(f"Number of unique objects: {group_stats['distinct'].get('objectId')}")
+        print(f"Total number of unique filters: {group_stats['unique_filters']}")
+        print(
+            "Number of candidates that passed at least one filter: "
+            f"{group_stats['candidates_passed_any_filter']}"
+        )
+        print(
+            "Total number of candidates passing any filters: "
+            f"{group_stats['total_filter_passes']}"
+        )
+        print("Number of candidates passing per filter:")
+        print(json.dumps(group_stats["passes_per_filter"], indent=4))
+
+        for column, column_stats in group_stats["columns"].items():
+            print(f"\nStats for column {column}:")
+            print(json.dumps(column_stats, indent=4))
@@ -0,0 +1,63 @@
+# index nights already saved by frigate, or read the alerts of some objects
+# (or candids) from the index, only reading the row groups they are in
+import argparse
+import os
+
+from frigate.utils.alert_index import ALERT_INDEX_DIRECTORY, AlertIndex
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="objectId/candid index of the saved nights"
+    )
+    parser.add_argument(
+        "--index_directory",
+        type=str,
+        default=os.path.join("./data", ALERT_INDEX_DIRECTORY),
+        help="Directory of the index",
+    )
+    parser.add_argument(
+        "--dataset_path",
+        nargs="+",
+        type=str,
+        default=None,
+        help="Night(s) saved by frigate to (re)index",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Merge the index files of all the nights into one",
+    )
+    parser.add_argument(
+        "--objectIds",
+        type=str,
+        default=None,
+        help="Comma-separated objectIds to look up",
+    )
+    parser.add_argument(
+        "--candids",
+        type=str,
+        default=None,
+        help="Comma-separated candids to look up (with --objectIds, only the alerts "
+        "matching both are returned)",
+    )
+    parser.add_argument(
+        "--columns", type=str, default=None, help="Comma-separated columns to print"
+    )
+    args = parser.parse_args()
+
+    index = AlertIndex(args.index_directory)
+
+    for dataset_path in args.dataset_path or []:
+        index.add(dataset_path)
+        print(f"Indexed {dataset_path}")
+
+    if args.compact:
+        print(f"Compacted the index into {index.compact()}")
+
+    if args.objectIds or args.candids:
+        alerts = index.load(
+            objectIds=args.objectIds.split(",") if args.objectIds else None,
+            candids=list(map(int, args.candids.split(","))) if args.candids else None,
+            columns=args.columns.split(",") if args.columns else None,
+        )
+        print(alerts.to_string())
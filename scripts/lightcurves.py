@@ -0,0 +1,56 @@
+# build the per-object light curve store from nights already saved by frigate,
+# or look up the light curve of some objects in it
+import argparse
+import os
+
+from frigate.utils.datasets import load_dataframe
+from frigate.utils.lightcurves import LIGHTCURVE_COLUMNS, LightCurveStore
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-object light curve store")
+    parser.add_argument(
+        "--lightcurves_directory",
+        type=str,
+        default="./data/lightcurves",
+        help="Directory of the light curve store",
+    )
+    parser.add_argument(
+        "--dataset_path",
+        nargs="+",
+        type=str,
+        default=None,
+        help="Night(s) saved by frigate to append to the store",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Merge all the nights of the store into a single segment",
+    )
+    parser.add_argument(
+        "--objectIds",
+        type=str,
+        default=None,
+        help="Comma-separated objectIds to print the light curve of",
+    )
+    args = parser.parse_args()
+
+    store = LightCurveStore(args.lightcurves_directory)
+
+    columns = ["objectId"] + [column for column, _ in LIGHTCURVE_COLUMNS.values()]
+    for dataset_path in args.dataset_path or []:
+        candidates = load_dataframe(dataset_path)
+        candidates = candidates[[c for c in columns if c in candidates.columns]]
+        name = os.path.basename(dataset_path).rsplit(".", 1)[0]
+        store.append(candidates, name)
+        print(f"Appended {len(candidates)} alerts from {dataset_path}")
+
+    if args.compact:
+        print(f"Compacted the store into {store.compact()}")
+
+    for objectId in (args.objectIds or "").split(","):
+        if not objectId:
+            continue
+        lightcurve = store.lightcurve(objectId)
+        print(f"{objectId}: {len(lightcurve['jd'])} alerts")
+        for row in zip(*lightcurve.values()):
+            print("  " + "  ".join(f"{k}={v}" for k, v in zip(lightcurve, row)))
@@ -0,0 +1,78 @@
+# run a local stand-in for Kowalski and Fritz, serving synthetic ZTF alerts, e.g.:
+#   PYTHONPATH=. python scripts/standin-server.py --nb_alerts=1000000 --port=4000
+# and point frigate to it with the environment variables printed at startup
+import argparse
+import time
+
+from frigate.utils.parsers import str_to_bool
+from frigate.utils.standin import standin_environment, start_standin_server
+from frigate.utils.synthetic import SyntheticAlerts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Kowalski/Fritz stand-in")
+    parser.add_argument("--host", type=str, default="localhost", help="Host to bind")
+    parser.add_argument("--port", type=int, default=4000, help="Port to bind")
+    parser.add_argument(
+        "--nb_alerts", type=int, default=100_000, help="Number of alerts to serve"
+    )
+    parser.add_argument(
+        "--nb_objects", type=int, default=None, help="Number of distinct objects"
+    )
+    parser.add_argument(
+        "--nb_filters", type=int, default=10, help="Number of Fritz filters"
+    )
+    parser.add_argument(
+        "--pass_rate",
+        type=float,
+        default=0.002,
+        help="Probability for an alert to pass each filter",
+    )
+    parser.add_argument(
+        "--start", type=float, default=2460355.5, help="Start (jd) of the alerts"
+    )
+    parser.add_argument(
+        "--nb_days", type=float, default=1.0, help="Number of days of alerts"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Mean latency (s) per request"
+    )
+    parser.add_argument(
+        "--failure_rate",
+        type=float,
+        default=0.0,
+        help="Probability of a request failing with a 503",
+    )
+    parser.add_argument(
+        "--reference_catalog",
+        type=str_to_bool,
+        default=True,
+        help="Also serve a synthetic reference catalog for cone searches",
+    )
+    args = parser.parse_args()
+
+    alerts = SyntheticAlerts(
+        nb_alerts=args.nb_alerts,
+        t_i=args.start,
+        t_f=args.start + args.nb_days,
+        nb_objects=args.nb_objects,
+        nb_filters=args.nb_filters,
+        pass_rate=args.pass_rate,
+        seed=args.seed,
+    )
+    server, url = start_standin_server(
+        alerts,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        reference_catalog=args.reference_catalog,
+    )
+    print(f"Stand-in serving {args.nb_alerts} alerts at {url}, use:")
+    for key, value in standin_environment(url).items():
+        print(f"  export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
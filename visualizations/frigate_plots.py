@@ -64,38 +64,49 @@ class ScatterPlotter:
     def __init__(self, df):
         self.df = df
 
-    def scatter(self, param1, param2):
+    def scatter(self, param1, param2, raster=None, width=200, height=200):
+        """
+        density of param2 vs param1 per band, filtered alerts over unfiltered ones.
+        raster: count the alerts on a width x height grid (in one pass over the
+        alerts) instead of hexbins, by default when there are many alerts
+        """
+        # visualizations/raster.py, next to this file
+        from raster import count_rasters, draw_counts, raster_extent, use_raster
+
         fig, axes = plt.subplots(1, 3, figsize=(12, 5))
+        x = self.df[param1].to_numpy(np.float64)
+        y = self.df[param2].to_numpy(np.float64)
+        fid = self.df["fid"].to_numpy()
+        filtered = (self.df["filtered_bool"] == 1).to_numpy()
         # for axes
-        x_min, x_max = self.df[param1].min(), self.df[param1].max()
-        y_min, y_max = self.df[param2].min(), self.df[param2].max()
-
-        g_filtered = self.df[(self.df["fid"] == 1) & (self.df["filtered_bool"] == 1)]
-        g_unfiltered = self.df[(self.df["fid"] == 1) & (self.df["filtered_bool"] == 0)]
-        r_filtered = self.df[(self.df["fid"] == 2) & (self.df["filtered_bool"] == 1)]
-        r_unfiltered = self.df[(self.df["fid"] == 2) & (self.df["filtered_bool"] == 0)]
-        i_filtered = self.df[(self.df["fid"] == 3) & (self.df["filtered_bool"] == 1)]
-        i_unfiltered = self.df[(self.df["fid"] == 3) & (self.df["filtered_bool"] == 0)]
+        extent = raster_extent(x, y)
+        x_min, x_max, y_min, y_max = extent
+
+        raster = use_raster(raster, len(self.df))
+        if raster:
+            # one count raster per (band, filtered) pair
+            codes = np.where(np.isin(fid, [1, 2, 3]), (fid - 1) * 2 + filtered, -1)
+            counts, _ = count_rasters(x, y, codes, 6, width, height, extent)
+
+        def density(ax, band, is_filtered, cmap):
+            if raster:
+                return draw_counts(
+                    ax, counts[(band - 1) * 2 + is_filtered], extent, cmap
+                )
+            mask = (fid == band) & (filtered == is_filtered)
+            return ax.hexbin(x[mask], y[mask], cmap=cmap, bins="log")
 
         axes[0].set_title("g", fontsize=16)
-        hb1 = axes[0].hexbin(
-            g_unfiltered[param1], g_unfiltered[param2], cmap="binary", bins="log"
-        )
-        axes[0].hexbin(
-            g_filtered[param1], g_filtered[param2], cmap="viridis", bins="log"
-        )
+        hb1 = density(axes[0], 1, False, "binary")
+        density(axes[0], 1, True, "viridis")
         axes[0].set_xlim([x_min, x_max])
         axes[0].set_ylim([y_min, y_max])
         axes[0].set_aspect("auto")
         axes[0].tick_params(axis="both", which="major", labelsize=17)
 
         axes[1].set_title("r", fontsize=16)
-        hb3 = axes[1].hexbin(
-            r_unfiltered[param1], r_unfiltered[param2], cmap="binary", bins="log"
-        )
-        axes[1].hexbin(
-            r_filtered[param1], r_filtered[param2], cmap="viridis", bins="log"
-        )
+        hb3 = density(axes[1], 2, False, "binary")
+        density(axes[1], 2, True, "viridis")
         axes[1].set_xlim([x_min, x_max])
         axes[1].set_ylim([y_min, y_max])
         axes[1].set_aspect("auto")
@@ -103,15 +114,11 @@ class ScatterPlotter:
         axes[1].set_yticks([])
 
         axes[2].set_title("i", fontsize=16)
-        if len(i_unfiltered) == 0 and len(i_filtered) == 0:
+        if not (fid == 3).any():
             axes[2].set_title("i: No data", fontsize=16)
         else:
-            # hb5 = axes[2].hexbin(
-            #     i_unfiltered[param1], i_unfiltered[param2], cmap="binary", bins="log"
-            # )
-            axes[2].hexbin(
-                i_filtered[param1], i_filtered[param2], cmap="viridis", bins="log"
-            )
+            # hb5 = density(axes[2], 3, False, "binary")
+            density(axes[2], 3, True, "viridis")
         axes[2].set_xlim([x_min, x_max])
         axes[2].set_ylim([y_min, y_max])
         axes[2].set_aspect("auto")
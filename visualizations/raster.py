@@ -0,0 +1,203 @@
+import numpy as np
+
+# rasterized scatter plots: the points are aggregated into a fixed grid of pixels
+# with np.bincount (counts, mean of a value, or category per pixel) and the grid is
+# drawn as a single image, so the time to plot and the size of the output depend on
+# the number of pixels rather than on the number of points
+
+# above this many points, plots are rasterized unless asked otherwise
+RASTER_THRESHOLD = 100_000
+
+
+def use_raster(raster, nb_points):
+    return nb_points > RASTER_THRESHOLD if raster is None else raster
+
+
+def raster_extent(x, y, extent=None):
+    if extent is not None:
+        return extent
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    x_min, x_max = np.nanmin(x), np.nanmax(x)
+    y_min, y_max = np.nanmin(y), np.nanmax(y)
+    # pad a degenerate range, so that the points fall in the grid
+    if x_max == x_min:
+        x_min, x_max = x_min - 0.5, x_max + 0.5
+    if y_max == y_min:
+        y_min, y_max = y_min - 0.5, y_max + 0.5
+    return (x_min, x_max, y_min, y_max)
+
+
+def pixel_index(x, y, width, height, extent):
+    """
+    flat pixel index of each point (row * width + column), -1 outside of extent
+    """
+    x_min, x_max, y_min, y_max = extent
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        columns = np.floor((x - x_min) / (x_max - x_min) * width)
+        rows = np.floor((y - y_min) / (y_max - y_min) * height)
+        # the points on the upper edges go in the last pixels
+        columns = np.where(x == x_max, width - 1, columns)
+        rows = np.where(y == y_max, height - 1, rows)
+        inside = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+    index = np.full(len(x), -1, dtype=np.int64)
+    index[inside] = rows[inside].astype(np.int64) * width + columns[inside].astype(
+        np.int64
+    )
+    return index
+
+
+def count_raster(x, y, width=800, height=600, extent=None, weights=None):
+    """
+    number (or sum of weights) of points per pixel, shape (height, width)
+    """
+    extent = raster_extent(x, y, extent)
+    index = pixel_index(x, y, width, height, extent)
+    inside = index >= 0
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)[inside]
+    counts = np.bincount(index[inside], weights=weights, minlength=width * height)
+    return counts.reshape(height, width).astype(np.float64), extent
+
+
+def mean_raster(x, y, values, width=800, height=600, extent=None, weights=None):
+    """
+    (weighted) mean of values per pixel, nan for the empty pixels and the points without value
+    """
+    extent = raster_extent(x, y, extent)
+    values = np.asarray(values, dtype=np.float64)
+    weights = (
+        np.ones(len(values))
+        if weights is None
+        else np.asarray(weights, dtype=np.float64)
+    )
+    index = pixel_index(x, y, width, height, extent)
+    inside = (index >= 0) & np.isfinite(values)
+    sums = np.bincount(
+        index[inside],
+        weights=values[inside] * weights[inside],
+        minlength=width * height,
+    )
+    totals = np.bincount(
+        index[inside], weights=weights[inside], minlength=width * height
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(totals > 0, sums / totals, np.nan)
+    return means.reshape(height, width), extent
+
+
+def count_rasters(
+    x, y, codes, nb_categories, width=800, height=600, extent=None, weights=None
+):
+    """
+    one count raster per category, from integer codes in [0, nb_categories) (points
+    with a negative code are ignored), in a single pass: shape (nb_categories, height, width)
+    """
+    extent = raster_extent(x, y, extent)
+    codes = np.asarray(codes, dtype=np.int64)
+    index = pixel_index(x, y, width, height, extent)
+    inside = (index >= 0) & (codes >= 0) & (codes < nb_categories)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)[inside]
+    counts = np.bincount(
+        codes[inside] * (width * height) + index[inside],
+        weights=weights,
+        minlength=nb_categories * width * height,
+    )
+    return counts.reshape(nb_categories, height, width).astype(np.float64), extent
+
+
+def category_raster(
+    x,
+    y,
+    codes,
+    nb_categories,
+    width=800,
+    height=600,
+    extent=None,
+    mode="top",
+    weights=None,
+):
+    """
+    category of each pixel (-1 if empty) from integer codes in [0, nb_categories):
+    mode "top" keeps the highest code in the pixel (as if the points were drawn in
+    the order of their codes), "majority" the most frequent one
+    """
+    counts, extent = count_rasters(
+        x, y, codes, nb_categories, width, height, extent, weights
+    )
+    if mode == "top":
+        category = nb_categories - 1 - np.argmax(counts[::-1] > 0, axis=0)
+    elif mode == "majority":
+        category = np.argmax(counts, axis=0)
+    else:
+        raise ValueError(f"Invalid mode: {mode}, must be one of ['top', 'majority']")
+    return np.where(counts.sum(axis=0) > 0, category, -1), extent
+
+
+def draw_counts(ax, counts, extent, cmap="viridis", log=True, alpha=1.0):
+    """
+    draw a count raster, empty pixels transparent. Returns the image (for colorbars)
+    """
+    from matplotlib.colors import LogNorm, Normalize
+
+    masked = np.ma.masked_less_equal(counts, 0)
+    vmax = max(float(masked.max()) if masked.count() else 1.0, 1.0)
+    norm = LogNorm(vmin=1, vmax=vmax) if log else Normalize(vmin=0, vmax=vmax)
+    return ax.imshow(
+        masked,
+        extent=extent,
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+        cmap=cmap,
+        norm=norm,
+        alpha=alpha,
+    )
+
+
+def draw_values(ax, values, extent, cmap="viridis", vmin=None, vmax=None):
+    return ax.imshow(
+        np.ma.masked_invalid(values),
+        extent=extent,
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+        cmap=cmap,
+        vmin=vmin,
+        vmax=vmax,
+    )
+
+
+def draw_categories(ax, categories, extent, colors, labels=None, alpha=1.0):
+    """
+    draw a category raster with a color per category. With labels, an empty
+    labelled artist is added per category, for ax.legend() to list them
+    """
+    from matplotlib.colors import to_rgba
+
+    palette = np.array([to_rgba(color) for color in colors] + [(0, 0, 0, 0)])
+    image = ax.imshow(
+        palette[categories],  # -1, empty pixels, are the last (transparent) color
+        extent=extent,
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+        alpha=alpha,
+    )
+    if labels is not None:
+        for color, label in zip(colors, labels):
+            ax.scatter([], [], color=color, label=str(label))
+    return image
+
+
+def overlay_points(ax, x, y, max_points=10_000, seed=0, **scatter_kwargs):
+    """
+    scatter at most max_points of the points (a random subset) on top of a raster,
+    e.g. to highlight a few interesting alerts
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if len(x) > max_points:
+        keep = np.random.default_rng(seed).choice(len(x), max_points, replace=False)
+        x, y = x[keep], y[keep]
+    return ax.scatter(x, y, **scatter_kwargs)
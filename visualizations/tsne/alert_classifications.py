@@ -1,7 +1,12 @@
+import numpy as np
 import pandas as pd
 import yaml
 import requests
 import pickle
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from penquins import Kowalski
 from astropy.time import Time
 from astroquery.simbad import Simbad
@@ -34,20 +39,122 @@ def get_filtered_subset(df):
     return filtered_df
 
 
+def get_coordinates(df):
+    """
+    ra and dec of the alerts, from frigate's columns or flattened ones
+    """
+    for ra_column, dec_column in [("candidate.ra", "candidate.dec"), ("ra", "dec")]:
+        if ra_column in df.columns and dec_column in df.columns:
+            return df[ra_column].values, df[dec_column].values
+    raise MyException("No ra/dec columns in the dataframe")
+
+
+def map_classes(df, object_id, class_value):
+    """
+    class of each alert of the dataframe, from the classes of some objects
+    (the last one if an object has several), None for the others
+    """
+    classes = pd.Series(
+        np.atleast_1d(np.asarray(class_value, dtype=object)),
+        index=np.atleast_1d(np.asarray(object_id, dtype=object)),
+    )
+    classes = classes[~classes.index.duplicated(keep="last")]
+    mapped = df["objectId"].map(classes)
+    return mapped.astype(object).where(mapped.notna(), None)
+
+
 def add_class_to_df(df, column_name, object_id, class_value):
     """
-    add classification to the dataframe
+    add classification to the dataframe: values given for each alert (object_id
+    being the objectId column) are assigned as is, others are mapped by objectId
     """
-    df[column_name] = None
-    df.loc[df["objectId"] == object_id, column_name] = class_value
+    object_id = np.atleast_1d(np.asarray(object_id, dtype=object))
+    if len(object_id) == len(df) and np.array_equal(
+        object_id, df["objectId"].values.astype(object)
+    ):
+        df[column_name] = class_value
+    else:
+        df[column_name] = map_classes(df, object_id, class_value).values
 
 
 # fritz groups assigned
 
 
 class FritzNightClassifications:
-    def __init__(self, token):
+    def __init__(
+        self,
+        token,
+        host="https://fritz.science",
+        numPerPage=500,
+        max_workers=4,
+        max_retries=3,
+        cache_directory=None,
+    ):
+        """
+        max_workers: number of pages fetched at the same time
+        cache_directory: where the classifications of closed nights are saved (e.g.
+        next to the data), None (default) to not cache them
+        """
         self.token = token
+        self.host = host.rstrip("/")
+        self.numPerPage = numPerPage
+        self.max_workers = max_workers
+        self.cache_directory = cache_directory
+
+        # one pool of connections reused for all the pages
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"token {self.token}"})
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_workers,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_page(self, startdate, enddate, page):
+        response = self.session.get(
+            f"{self.host}/api/classification",
+            params={
+                "startDate": startdate,
+                "endDate": enddate,
+                "numPerPage": self.numPerPage,
+                "pageNumber": page,
+            },
+        )
+        if response.status_code != 200:
+            raise MyException(
+                f"Could not retrieve classification - {response.status_code} - {response.text}"
+            )
+        return response.json()["data"]
+
+    def get_classifications(self, startdate, enddate):
+        """
+        all the classifications between startdate and enddate, the first page
+        gives the number of pages, the others are fetched concurrently
+        """
+        first = self.get_page(startdate, enddate, 1)
+        total = first.get("totalMatches") or 0
+        nb_pages = max(1, -(-total // self.numPerPage))
+        classifications = list(first["classifications"])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pages = executor.map(
+                lambda page: self.get_page(startdate, enddate, page),
+                range(2, nb_pages + 1),
+            )
+            for data in pages:
+                classifications.extend(data["classifications"])
+
+        columns = ["obj_id", "classification", "probability", "ml", "created_at"]
+        classifications = pd.DataFrame(classifications)
+        return classifications[[c for c in columns if c in classifications.columns]]
 
     def get_night_classifications(self, df, add_to_df=True):
         # get dates
@@ -57,35 +164,137 @@ class FritzNightClassifications:
             "%Y-%m-%d"
         )
 
-        # api call
-        endpoint = f"https://fritz.science/api/classification?startDate={startdate}&endDate={enddate}&numPerPage=500"
-        headers = {"Authorization": f"token {self.token}"}
-        response = requests.request("GET", endpoint, headers=headers)
-
-        if response.status_code != 200:
-            raise MyException(
-                f"Could not retrieve classification - {response.status_code} - {response.text}"
+        # closed nights don't change anymore, their classifications are cached, per
+        # instance and account (accounts with different group access see different
+        # classifications), with only a hash of the token in the key
+        closed = enddate < Time.now().utc.strftime("%Y-%m-%d")
+        cache_path = None
+        if self.cache_directory and closed:
+            from frigate.utils.cache import query_key
+
+            key = query_key(
+                {"startdate": startdate, "enddate": enddate},
+                host=self.host,
+                token=self.token,
+            )[:16]
+            cache_path = os.path.join(
+                self.cache_directory,
+                f"classifications_{startdate}_{enddate}_{key}.parquet",
             )
+        if cache_path and os.path.exists(cache_path):
+            classifications = pd.read_parquet(cache_path)
+        else:
+            classifications = self.get_classifications(startdate, enddate)
+            if cache_path:
+                from frigate.utils.files import atomic_path
 
-        data = response.json()
-        obj_id = [
-            classification["obj_id"]
-            for classification in data["data"]["classifications"]
-        ]
-        value = [
-            classification["classification"]
-            for classification in data["data"]["classifications"]
-        ]
+                with atomic_path(cache_path) as tmp_path:
+                    classifications.to_parquet(tmp_path, index=False)
 
-        if add_to_df:
-            add_class_to_df(df, "fritz_night_classification", obj_id, value)
+        if add_to_df and len(classifications) > 0:
+            add_class_to_df(
+                df,
+                "fritz_night_classification",
+                classifications["obj_id"].values,
+                classifications["classification"].values,
+            )
+        elif add_to_df:
+            df["fritz_night_classification"] = None
 
-        return data, df
+        return classifications, df
 
 
 # SIMBAD classifications
 
 
+class SimbadCache:
+    """
+    SIMBAD classifications of the positions already queried, persisted as a parquet
+    file, so that objects resolved on earlier nights are not queried again. Positions
+    are looked up with a crossmatch, within tolerance (arcsec) of a cached position
+    """
+
+    def __init__(self, path, tolerance=0.5):
+        from frigate.utils.crossmatch import ReferenceCatalog
+
+        self.path = path
+        self.tolerance = tolerance
+        if path and os.path.exists(path):
+            self.data = pd.read_parquet(path)
+        else:
+            self.data = pd.DataFrame(
+                {
+                    "ra": np.empty(0),
+                    "dec": np.empty(0),
+                    "simbad_classification": np.empty(0, dtype=object),
+                    "queried_at": np.empty(0),
+                }
+            )
+        self._reference = ReferenceCatalog("cache", self.data["ra"], self.data["dec"])
+
+    def __len__(self):
+        return len(self.data)
+
+    def lookup(self, ra, dec):
+        """
+        cached classification of each position, and whether it was cached
+        """
+        indexes, _ = self._reference.nearest(ra, dec, self.tolerance)
+        found = indexes >= 0
+        values = np.full(len(indexes), None, dtype=object)
+        values[found] = self.data["simbad_classification"].values[indexes[found]]
+        return values, found
+
+    def add(self, ra, dec, values):
+        from frigate.utils.crossmatch import ReferenceCatalog
+
+        new = pd.DataFrame(
+            {
+                "ra": np.asarray(ra, dtype=np.float64),
+                "dec": np.asarray(dec, dtype=np.float64),
+                "simbad_classification": np.asarray(values, dtype=object),
+                "queried_at": time.time(),
+            }
+        )
+        self.data = pd.concat([self.data, new], ignore_index=True)
+        self._reference = ReferenceCatalog("cache", self.data["ra"], self.data["dec"])
+
+    def save(self):
+        if not self.path:
+            return
+        from frigate.utils.files import atomic_path
+
+        with atomic_path(self.path) as tmp_path:
+            self.data.to_parquet(tmp_path, index=False)
+
+
+# column of the verbose SIMBAD types ("Galaxy", "SuperNova", ...) the mapping of
+# plot_simbad_analysis is keyed on, added with the "otype(V)" votable field: OTYPE_V
+# before astroquery 0.4.8, the description of the otypedef table since. Clients that
+# only return the short codes (otype) fall back to them
+SIMBAD_TYPE_COLUMNS = ["OTYPE_V", "description", "otype"]
+
+
+def simbad_type_column(result):
+    return next(
+        (column for column in SIMBAD_TYPE_COLUMNS if column in result.colnames), None
+    )
+
+
+def simbad_positions(result):
+    """
+    ra, dec (degrees) of the sources of a SIMBAD query result: decimal ra/dec
+    columns since astroquery 0.4.8, sexagesimal RA/DEC before
+    """
+    if "ra" in result.colnames:
+        return (
+            np.asarray(result["ra"], dtype=np.float64),
+            np.asarray(result["dec"], dtype=np.float64),
+        )
+    coords = SkyCoord(result["RA"], result["DEC"], unit=(u.hourangle, u.degree))
+    return coords.ra.degree, coords.dec.degree
+
+
 class SimbadClassifications:
     def __init__(
         self,
@@ -95,13 +304,36 @@ class SimbadClassifications:
         filtered_only=True,
         verbose=False,
         display_results=True,
+        radius=3.0,
+        chunk_size=300,
+        max_workers=4,
+        max_retries=3,
+        cache_path=None,
+        simbad=None,
     ):
+        """
+        radius: in arcsec
+        chunk_size: number of coordinates per SIMBAD query (above 300, astroquery
+        uploads them as a table instead of sending them in the query)
+        max_workers: number of SIMBAD queries running at the same time
+        cache_path: parquet file with the classifications of the positions already
+        queried (e.g. next to the data), None (default) to not cache them
+        simbad: client with the query_region method of astroquery's Simbad (e.g. the
+        local stand-in of frigate.utils.standin), a Simbad instance per thread if None
+        """
         self.df = df
         self.save_query_path = save_query_path
         self.add_to_df = add_to_df
         self.filtered_only = filtered_only
         self.verbose = verbose
         self.display_results = display_results
+        self.radius = radius
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.cache = SimbadCache(cache_path) if cache_path else None
+        self.simbad = simbad
+        self._local = threading.local()
 
         warnings.filterwarnings("ignore")
 
@@ -117,6 +349,59 @@ class SimbadClassifications:
         result = custom_simbad.query_region(coord, radius="0d0m3s")
         return result
 
+    def get_client(self):
+        if self.simbad is not None:
+            return self.simbad
+        # one client per thread, reused by all the chunks of that thread
+        if getattr(self._local, "simbad", None) is None:
+            self._local.simbad = Simbad()
+            self._local.simbad.add_votable_fields("otype(V)")
+        return self._local.simbad
+
+    def query_simbad_chunk(self, ra, dec):
+        """
+        SIMBAD types of the sources within radius of each coordinate of the chunk,
+        from a single multi-coordinate region query, retried with exponential backoff
+        """
+        from frigate.utils.crossmatch import ReferenceCatalog
+
+        coords = SkyCoord(ra=ra * u.degree, dec=dec * u.degree, frame="icrs")
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = self.get_client().query_region(
+                    coords, radius=self.radius * u.arcsec
+                )
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    if self.verbose:
+                        print(f"Error querying SIMBAD for {len(ra)} coordinates: {e}")
+                    return [None] * len(ra)
+                time.sleep(2**attempt)
+
+        # no source around any of the coordinates (None before astroquery 0.4.8)
+        if result is None or len(result) == 0:
+            return ["[]"] * len(ra)
+
+        # the query returns the sources around any of the coordinates, match them back
+        try:
+            type_column = simbad_type_column(result)
+            if type_column is None:
+                raise ValueError(f"no SIMBAD type column in {result.colnames}")
+            reference = ReferenceCatalog("simbad", *simbad_positions(result))
+            types = np.asarray(result[type_column], dtype=object)
+            positions, sources, _ = reference.within(ra, dec, self.radius)
+        except Exception as e:
+            # like a failed query, this chunk is left unresolved (and not cached)
+            if self.verbose:
+                print(f"Error reading SIMBAD results for {len(ra)} coordinates: {e}")
+            return [None] * len(ra)
+        starts = np.searchsorted(positions, np.arange(len(ra) + 1))
+        return [
+            str(types[sources[start:stop]].tolist())
+            for start, stop in zip(starts[:-1], starts[1:])
+        ]
+
     @staticmethod
     def plot_query_results(results):
         """
@@ -136,25 +421,40 @@ class SimbadClassifications:
     def get_classifications(self):
         if self.filtered_only:
             self.df = get_filtered_subset(self.df)  # do this bc query is slow
-        coords = [(x, y) for x, y in zip(self.df["ra"], self.df["dec"])]
-        sky_coords = [
-            SkyCoord(ra=ra * u.degree, dec=dec * u.degree, frame="icrs")
-            for ra, dec in coords
+        ra, dec = get_coordinates(self.df)
+        simbad_results = np.full(len(self.df), None, dtype=object)
+
+        missing = np.ones(len(self.df), dtype=bool)
+        if self.cache is not None:
+            simbad_results, cached = self.cache.lookup(ra, dec)
+            missing = ~cached
+            if self.verbose:
+                print(
+                    f"{cached.sum()} / {len(self.df)} alerts found in the SIMBAD cache"
+                )
+
+        # one query per chunk of coordinates, a few at a time
+        to_query = np.flatnonzero(missing)
+        chunks = [
+            to_query[i : i + self.chunk_size]
+            for i in range(0, len(to_query), self.chunk_size)
         ]
-        simbad_results = []
-        for coord in sky_coords:
-            try:
-                result = self.query_simbad(coord)
-                value = str(list(result["OTYPE_V"].data))
-            except ConnectionError as e:
-                if self.verbose:
-                    print(f"Connection error querying SIMBAD for {coord}: {e}")
-                value = None
-            except Exception as e:
-                if self.verbose:
-                    print(f"Error querying SIMBAD for {coord}: {e}")
-                value = None
-            simbad_results.append(value)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(
+                lambda chunk: self.query_simbad_chunk(ra[chunk], dec[chunk]), chunks
+            )
+            for chunk, values in zip(chunks, results):
+                simbad_results[chunk] = values
+
+        if self.cache is not None and len(to_query) > 0:
+            # failed queries (None) are not cached, they are retried next time
+            resolved = to_query[
+                np.array([v is not None for v in simbad_results[to_query]], dtype=bool)
+            ]
+            self.cache.add(ra[resolved], dec[resolved], simbad_results[resolved])
+            self.cache.save()
+
+        simbad_results = simbad_results.tolist()
         obj_ids = self.df["objectId"].values
         if self.save_query_path:
             simbad_dict = {
@@ -164,10 +464,11 @@ class SimbadClassifications:
                 pickle.dump(simbad_dict, f)
 
         if self.add_to_df:
-            add_class_to_df(self.df, "simbad_classification", obj_ids, simbad_results)
+            self.df = self.df.copy()
+            self.df["simbad_classification"] = simbad_results
 
         if self.display_results:
-            matches = [x for x in simbad_results if x]
+            matches = [x for x in simbad_results if x and x != "[]"]
             print(
                 f"{len(matches)} / {len(self.df)} alerts matched a SIMBAD classification"
             )
@@ -180,65 +481,212 @@ class SimbadClassifications:
 
 
 class CatalogClassifications:
-    def __init__(self, kowalski_password):
+    def __init__(
+        self, kowalski_password, chunk_size=1000, max_n_threads=4, max_retries=3
+    ):
+        """
+        chunk_size: number of coordinates per cone search query
+        max_n_threads: number of queries running at the same time on each instance,
+        or dict of instance name -> number of queries
+        """
         self.kowalski_password = kowalski_password
         self.kowalski = None
+        self.chunk_size = chunk_size
+        self.max_n_threads = max_n_threads
+        self.max_retries = max_retries
 
-    def connect_to_kowalski(self):
-        instances = {
-            "kowalski": {
-                "name": "kowalski",
-                "host": "kowalski.caltech.edu",
-                "protocol": "https",
-                "port": 443,
-                "username": "knolan",
-                "password": self.kowalski_password,
-                "timeout": 6000,
-            },
-            "gloria": {
-                "name": "gloria",
-                "host": "gloria.caltech.edu",
-                "protocol": "https",
-                "port": 443,
-                "username": "knolan",
-                "password": self.kowalski_password,
-                "timeout": 6000,
-            },
-        }
+    def connect_to_kowalski(self, instances=None):
+        """
+        instances: penquins instances configuration, kowalski and gloria if None
+        """
+        if instances is None:
+            instances = {
+                "kowalski": {
+                    "name": "kowalski",
+                    "host": "kowalski.caltech.edu",
+                    "protocol": "https",
+                    "port": 443,
+                    "username": "knolan",
+                    "password": self.kowalski_password,
+                    "timeout": 6000,
+                },
+                "gloria": {
+                    "name": "gloria",
+                    "host": "gloria.caltech.edu",
+                    "protocol": "https",
+                    "port": 443,
+                    "username": "knolan",
+                    "password": self.kowalski_password,
+                    "timeout": 6000,
+                },
+            }
         self.kowalski = Kowalski(instances=instances)
 
+    def get_machines(self, catalog, machine=None):
+        """
+        instances to send the cone searches on the catalog to
+        """
+        if machine is not None:
+            return [machine]
+        machines = [
+            name
+            for name in self.kowalski.instances
+            if self.kowalski.instance_has_catalog(catalog, name)
+        ]
+        if len(machines) == 0:
+            raise MyException(f"No Kowalski instance has the catalog {catalog}")
+        return machines
+
+    def query_chunk(self, query, machine):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.kowalski.single_query((query, machine))[machine]
+                if response.get("status") == "success":
+                    return response
+                error = response.get("message")
+            except Exception as e:
+                error = e
+            if attempt < self.max_retries:
+                time.sleep(2**attempt)
+        raise MyException(f"Cone search on {machine} failed: {error}")
+
     def kowalski_catalog_conesearch(
-        self, df, catalog, projection, machine, add_to_df=True
+        self, df, catalog, projection, machine=None, add_to_df=True, radius=3
     ):
-        ra_list = df["candidate.ra"].values
-        dec_list = df["candidate.dec"].values
-        obj_ids = df["objectId"].values
+        """
+        cone searches of radius (arcsec) around all the alerts, chunk_size alerts
+        per query, spread over the instances that have the catalog (or only machine)
+        """
+        ra_list = df["candidate.ra"].values.astype(float)
+        dec_list = df["candidate.dec"].values.astype(float)
 
+        # the coordinates are keyed by their row, objectIds can repeat across alerts
         queries = [
             {
                 "query_type": "cone_search",
                 "query": {
                     "object_coordinates": {
-                        "cone_search_radius": 3,
+                        "cone_search_radius": radius,
                         "cone_search_unit": "arcsec",
-                        "radec": {object_name: [ra, dec]},
+                        "radec": {
+                            str(i): [ra_list[i], dec_list[i]]
+                            for i in range(start, min(start + self.chunk_size, len(df)))
+                        },
                     },
                     "catalogs": {catalog: {"filter": {}, "projection": projection}},
                 },
                 "kwargs": {"filter_first": False},
             }
-            for object_name, ra, dec in zip(obj_ids, ra_list, dec_list)
+            for start in range(0, len(df), self.chunk_size)
         ]
-        responses = self.kowalski.query(
-            queries=queries, name=machine, use_batch_query=True, max_n_threads=4
-        )
-        data = [x.get("data", []).get(catalog, []) for x in responses.get(machine, {})]
-        match = [True if v else False for d in data for k, v in d.items()]
+
+        # round robin over the instances, each with its own pool of threads
+        machines = self.get_machines(catalog, machine)
+        executors = {
+            name: ThreadPoolExecutor(
+                max_workers=(
+                    self.max_n_threads.get(name, 4)
+                    if isinstance(self.max_n_threads, dict)
+                    else self.max_n_threads
+                )
+            )
+            for name in machines
+        }
+        try:
+            futures = [
+                executors[machines[i % len(machines)]].submit(
+                    self.query_chunk, query, machines[i % len(machines)]
+                )
+                for i, query in enumerate(queries)
+            ]
+            responses = [future.result() for future in futures]
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        # back to the rows of the dataframe
+        data = [[] for _ in range(len(df))]
+        match = np.zeros(len(df), dtype=bool)
+        for response in responses:
+            matches = response.get("data", {}).get(catalog, {})
+            if len(matches) == 0:
+                continue
+            rows = np.fromiter(
+                map(int, matches.keys()), dtype=np.int64, count=len(matches)
+            )
+            counts = np.fromiter(
+                map(len, matches.values()), dtype=np.int64, count=len(matches)
+            )
+            match[rows] = counts > 0
+            for row, documents in zip(
+                rows[counts > 0], (v for v in matches.values() if v)
+            ):
+                data[row] = documents
         if add_to_df:
-            add_class_to_df(df, f"{catalog}_classification", obj_ids, match)
+            df[f"{catalog}_classification"] = match
         return data, df
 
 
+# local crossmatch against exported reference catalogs, instead of one query per alert
+
+
+class LocalCatalogClassifications:
+    def __init__(self, catalogs, radius=3.0):
+        """
+        catalogs: dict of catalog name -> ReferenceCatalog, or path to a parquet/feather/csv
+        export of the catalog with "ra" and "dec" columns (in degrees)
+        radius: crossmatch radius, in arcsec
+        """
+        # requires the root of the repository in the PYTHONPATH
+        from frigate.utils.crossmatch import ReferenceCatalog
+
+        self.radius = radius
+        self.catalogs = {
+            name: (
+                catalog
+                if isinstance(catalog, ReferenceCatalog)
+                else ReferenceCatalog.from_file(catalog, name)
+            )
+            for name, catalog in catalogs.items()
+        }
+
+    def get_catalog_classes(self, df, catalog, radius=None, add_to_df=True):
+        """
+        same column as CatalogClassifications.kowalski_catalog_conesearch:
+        whether each alert has a source of the catalog within radius
+        """
+        from frigate.utils.crossmatch import crossmatch
+
+        ra, dec = get_coordinates(df)
+        matches = crossmatch(
+            self.catalogs[catalog], ra, dec, radius or self.radius, how="nearest"
+        )
+        if add_to_df:
+            df[f"{catalog}_classification"] = matches["match"].values
+        return matches, df
+
+    def get_simbad_classes(
+        self, df, catalog="simbad", type_column="otype", radius=None, add_to_df=True
+    ):
+        """
+        same column as SimbadClassifications.get_classifications: the list of the
+        types of all the sources within radius, "[]" if there is none
+        """
+        ra, dec = get_coordinates(df)
+        reference = self.catalogs[catalog]
+        positions, sources, _ = reference.within(ra, dec, radius or self.radius)
+        types = reference.columns[type_column][sources]
+        # matches are sorted by alert, the ones of alert i are in [starts[i], starts[i + 1])
+        starts = np.searchsorted(positions, np.arange(len(df) + 1))
+        simbad_results = [
+            str(types[start:stop].tolist())
+            for start, stop in zip(starts[:-1], starts[1:])
+        ]
+        if add_to_df:
+            df["simbad_classification"] = simbad_results
+        return simbad_results, df
+
+
 # check against catalog of Fritz classifications
 
 
@@ -248,16 +696,11 @@ class FritzClassifications:
 
     def get_fritz_classes(self, df, add_to_df=True):
         fritz_classification_catalog = pd.read_csv("../example_data/frigateclasses.csv")
-        obj_ids = df["objectId"].values
-        fritz_dict = dict(
-            zip(
-                fritz_classification_catalog["obj_id"],
-                fritz_classification_catalog["type"],
-            )
-        )
-        match = [fritz_dict.get(obj_id, None) for obj_id in obj_ids]
+        obj_ids = fritz_classification_catalog["obj_id"].values
+        types = fritz_classification_catalog["type"].values
+        match = map_classes(df, obj_ids, types).tolist()
         if add_to_df:
-            add_class_to_df(df, "fritz_catalog_classification", obj_ids, match)
+            add_class_to_df(df, "fritz_catalog_classification", obj_ids, types)
         return match, df
 
 
@@ -265,25 +708,25 @@ class FritzClassifications:
 
 
 class AcaiClassifications:
-    def __init__(self):
-        pass
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.classes = {
+            "H": "classifications.acai_h",
+            "V": "classifications.acai_v",
+            "O": "classifications.acai_o",
+            "N": "classifications.acai_n",
+            "B": "classifications.acai_b",
+        }
 
     def get_acai_classes(self, df, add_to_df=True):
-        def determine_acai(row):
-            conditions = {
-                "H": row["classifications.acai_h"] > 0.8,
-                "V": row["classifications.acai_v"] > 0.8,
-                "O": row["classifications.acai_o"] > 0.8,
-                "N": row["classifications.acai_n"] > 0.8,
-                "B": row["classifications.acai_b"] > 0.8,
-            }
-            true_conditions = [key for key, value in conditions.items() if value]
-            if len(true_conditions) == 1:
-                return true_conditions[0]
-            else:
-                return "ambiguous"
-
-        acai = df.apply(determine_acai, axis=1).tolist()
+        # the class whose score is above the threshold, ambiguous if none or several are
+        above = (
+            df[list(self.classes.values())].to_numpy(dtype=np.float64) > self.threshold
+        )
+        labels = np.array(list(self.classes.keys()), dtype=object)
+        acai = np.where(
+            above.sum(axis=1) == 1, labels[above.argmax(axis=1)], "ambiguous"
+        ).tolist()
 
         if add_to_df:
             add_class_to_df(df, "acai_classification", df["objectId"].values, acai)
@@ -296,11 +739,8 @@ class AcaiClassifications:
 
 class FilterClassifications:
     def __init__(self):
-        pass
-
-    def get_filter_classes(self, df, add_to_df=True):
         # Create a dictionary of the classes of objects different filters should look for
-        class_dict = {
+        self.class_dict = {
             "SNe": [1, 3, 9, 11, 13, 1174, 1176, 1178, 1179, 1180, 1182, 107],
             "GRB": [8, 1160],
             "CV": [105],
@@ -309,15 +749,33 @@ class FilterClassifications:
             "None": [],
         }
 
-        def determine_class(row):
-            passed_filters = row["filters"]
-            classes = []
-            for class_name, values in class_dict.items():
-                if any(item in passed_filters for item in values):
-                    classes.append(class_name)
-            return ", ".join(classes) if classes else None
-
-        filter_class = df.apply(determine_class, axis=1).tolist()
+    def get_filter_classes(self, df, add_to_df=True, filters_column="filters"):
+        # one bit per class, a filter sets the bits of the classes it looks for
+        filter_bits = {}
+        for bit, values in enumerate(self.class_dict.values()):
+            for value in values:
+                filter_bits[value] = filter_bits.get(value, 0) | (1 << bit)
+
+        # one row per (alert, passed filter)
+        passed = pd.Series(df[filters_column].values).explode()
+        bits = passed.map(filter_bits).fillna(0).to_numpy(dtype=np.int64)
+        masks = np.zeros(len(df), dtype=np.int64)
+        np.bitwise_or.at(masks, passed.index.to_numpy(), bits)
+
+        # a label per distinct combination of classes
+        class_names = list(self.class_dict.keys())
+        combinations, inverse = np.unique(masks, return_inverse=True)
+        labels = np.array(
+            [
+                ", ".join(
+                    name for bit, name in enumerate(class_names) if mask & (1 << bit)
+                )
+                or None
+                for mask in combinations
+            ],
+            dtype=object,
+        )
+        filter_class = labels[inverse.reshape(-1)].tolist()
 
         if add_to_df:
             add_class_to_df(
@@ -0,0 +1,164 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class SimilarityIndex:
+    """
+    approximate nearest neighbors over the feature vectors of the alerts (the
+    scaled / PCA vectors of prep_TSNE), to find the alerts that look like a given
+    one. Inverted file index: the vectors are clustered with k-means, stored
+    grouped by cluster, and a query only scans the n_probe clusters closest to it.
+    Saved as a directory of .npy files (memory mapped when loaded) and the ids
+    """
+
+    def __init__(self, centroids, vectors, offsets, ids, n_probe=8):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.offsets = offsets
+        self.ids = ids
+        self.n_probe = n_probe
+        self._rows = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, vectors, ids, n_lists=None, n_probe=8, sample_size=100_000, seed=0):
+        """
+        vectors: one row per alert, ids: dataframe with the objectId/candid of each row
+        n_lists: number of clusters, about sqrt(number of alerts) if None
+        """
+        from sklearn.cluster import MiniBatchKMeans
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+        # the clusters are trained on a sample, all the vectors are then assigned
+        rng = np.random.default_rng(seed)
+        sample = vectors
+        if len(vectors) > sample_size:
+            sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_lists, random_state=seed, n_init=1, batch_size=4096
+        ).fit(sample)
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        return cls.from_centroids(centroids, vectors, ids, n_probe)
+
+    @classmethod
+    def from_centroids(cls, centroids, vectors, ids, n_probe=8, batch_size=65536):
+        lists = np.concatenate(
+            [
+                _nearest_centroids(vectors[i : i + batch_size], centroids, 1)[:, 0]
+                for i in range(0, len(vectors), batch_size)
+            ]
+            or [np.empty(0, dtype=np.int64)]
+        )
+        order = np.argsort(lists, kind="stable")
+        offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+        return cls(
+            centroids,
+            vectors[order],
+            offsets,
+            ids.iloc[order].reset_index(drop=True),
+            n_probe,
+        )
+
+    @classmethod
+    def merge(cls, indexes, n_lists=None, n_probe=8, seed=0):
+        """
+        one index over the alerts of several indexes (e.g. one per night), whose
+        vectors must come from the same scaler / PCA (see tSNE.save_model)
+        """
+        dimensions = {index.vectors.shape[1] for index in indexes}
+        if len(dimensions) > 1:
+            raise ValueError(f"Vectors of different dimensions: {dimensions}")
+        vectors = np.concatenate([np.asarray(index.vectors) for index in indexes])
+        ids = pd.concat([index.ids for index in indexes], ignore_index=True)
+        return cls.build(vectors, ids, n_lists=n_lists, n_probe=n_probe, seed=seed)
+
+    def query(self, vectors, k=10, n_probe=None):
+        """
+        the k alerts closest to each vector (one row per query vector and neighbor,
+        closest first), with their euclidean distances
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        probes = _nearest_centroids(vectors, self.centroids, n_probe)
+        frames = []
+        for i, (vector, lists) in enumerate(zip(vectors, probes)):
+            rows = np.concatenate(
+                [np.arange(self.offsets[j], self.offsets[j + 1]) for j in lists]
+            )
+            distances = np.sqrt(
+                np.maximum(((self.vectors[rows] - vector) ** 2).sum(axis=1), 0)
+            )
+            top = np.arange(len(rows))
+            if len(rows) > k:
+                top = np.argpartition(distances, k)[:k]
+            top = top[np.argsort(distances[top])]
+            frames.append(
+                self.ids.iloc[rows[top]].assign(
+                    query=i, rank=np.arange(len(top)), distance=distances[top]
+                )
+            )
+        return pd.concat(frames, ignore_index=True)
+
+    def vector_of(self, candid):
+        if self._rows is None:
+            self._rows = pd.Series(
+                np.arange(len(self.ids)), index=self.ids["candid"].values
+            )
+        return np.asarray(self.vectors[self._rows[candid]])
+
+    def similar_alerts(self, candid, k=10, n_probe=None):
+        """
+        the k alerts of the index that look the most like the alert candid
+        """
+        similar = self.query(self.vector_of(candid), k=k + 1, n_probe=n_probe)
+        similar = similar[similar["candid"] != candid].head(k)
+        return similar.drop(columns=["query"]).assign(rank=np.arange(len(similar)))
+
+    def save(self, directory):
+        # written next to the directory, then moved in place
+        from frigate.utils.files import atomic_path
+
+        with atomic_path(directory) as tmp_directory:
+            os.makedirs(tmp_directory)
+            np.save(os.path.join(tmp_directory, "centroids.npy"), self.centroids)
+            np.save(
+                os.path.join(tmp_directory, "vectors.npy"), np.asarray(self.vectors)
+            )
+            np.save(os.path.join(tmp_directory, "offsets.npy"), self.offsets)
+            self.ids.to_parquet(os.path.join(tmp_directory, "ids.parquet"), index=False)
+            with open(os.path.join(tmp_directory, "index.json"), "w") as f:
+                json.dump({"n_probe": self.n_probe, "nb_alerts": len(self)}, f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "index.json")) as f:
+            parameters = json.load(f)
+        return cls(
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "offsets.npy")),
+            pd.read_parquet(os.path.join(directory, "ids.parquet")),
+            parameters["n_probe"],
+        )
+
+
+def _nearest_centroids(vectors, centroids, n):
+    # indexes of the n centroids closest to each vector
+    distances = (
+        (vectors**2).sum(axis=1)[:, None]
+        - 2 * vectors @ centroids.T
+        + (centroids**2).sum(axis=1)[None, :]
+    )
+    if n >= len(centroids):
+        return np.argsort(distances, axis=1)
+    nearest = np.argpartition(distances, n - 1, axis=1)[:, :n]
+    order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
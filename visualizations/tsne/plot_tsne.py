@@ -4,28 +4,97 @@ import pandas as pd
 import numpy as np
 
 
+def plot_points(
+    ax,
+    df,
+    hue,
+    palette,
+    raster=False,
+    legend="full",
+    alpha=0.7,
+    width=800,
+    height=500,
+    vmin=None,
+    vmax=None,
+):
+    """
+    scatter of the t-SNE map colored by hue, or with raster=True a raster of it,
+    whose time to plot depends on the number of pixels (width x height) rather
+    than of alerts. A pixel takes the color of the hue category drawn on top (the
+    categories in the order they are plotted), or with palette a colormap, the
+    mean of hue over the alerts in it (weighted by their weight, if any).
+    The raster needs the visualizations directory in the PYTHONPATH
+    """
+    if not raster:
+        sns.scatterplot(
+            x="tsne-2d-one",
+            y="tsne-2d-two",
+            hue=hue,
+            palette=palette,
+            data=df,
+            legend=legend,
+            alpha=alpha,
+            ax=ax,
+        )
+        return
+    from raster import category_raster, draw_categories, draw_values, mean_raster
+
+    x = df["tsne-2d-one"].to_numpy(np.float64)
+    y = df["tsne-2d-two"].to_numpy(np.float64)
+    values = df[hue]
+    if isinstance(palette, str):
+        weights = df["weight"] if "weight" in df.columns else None
+        means, extent = mean_raster(x, y, values, width, height, weights=weights)
+        draw_values(ax, means, extent, cmap=palette, vmin=vmin, vmax=vmax)
+        return
+    # same order of the categories as seaborn
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        order = list(values.cat.remove_unused_categories().cat.categories)
+    elif pd.api.types.is_numeric_dtype(values):
+        order = sorted(values.dropna().unique())
+    else:
+        order = list(values.dropna().unique())
+    codes = pd.Categorical(values, categories=order).codes
+    categories, extent = category_raster(x, y, codes, len(order), width, height)
+    colors = [palette[i % len(palette)] for i in range(len(order))]
+    draw_categories(ax, categories, extent, colors, labels=order if legend else None)
+
+
 class TsnePlotter:
     def __init__(self, df):
         self.df = df
 
-    def plot_filtered(self):
-        df = self.df.copy()
-        # shift around df to plot filtered on top of unfiltered
-        tsne_filtered = df[df["filtered_bool"] == 1]
-        tsne_unfiltered = df[df["filtered_bool"] == 0]
-        tsne_plotordered = pd.concat([tsne_unfiltered, tsne_filtered])
-
+    def plot_filtered(self, raster=False, overlay=0):
+        """
+        raster: draw the map as a raster (see plot_points), with a random subset
+        of at most overlay filtered alerts scattered on top
+        """
+        df = self.df
         custom_palette = ["#d8dcd6", "#3357FF"]
         plt.figure(figsize=(16, 10))
-        sns.scatterplot(
-            x="tsne-2d-one",
-            y="tsne-2d-two",
-            hue="filtered_bool",
-            palette=custom_palette,
-            data=tsne_plotordered,
-            legend="full",
-            alpha=0.7,
-        )
+        ax = plt.gca()
+        if raster:
+            # the filtered alerts are drawn on top of the unfiltered ones
+            plot_points(ax, df, "filtered_bool", custom_palette, raster=True)
+            if overlay:
+                from raster import overlay_points
+
+                tsne_filtered = df[df["filtered_bool"] == 1]
+                overlay_points(
+                    ax,
+                    tsne_filtered["tsne-2d-one"],
+                    tsne_filtered["tsne-2d-two"],
+                    max_points=overlay,
+                    color=custom_palette[1],
+                    s=10,
+                    alpha=0.7,
+                )
+        else:
+            # shift around df to plot filtered on top of unfiltered
+            tsne_filtered = df[df["filtered_bool"] == 1]
+            tsne_unfiltered = df[df["filtered_bool"] == 0]
+            tsne_plotordered = pd.concat([tsne_unfiltered, tsne_filtered])
+            plot_points(ax, tsne_plotordered, "filtered_bool", custom_palette)
         plt.legend(title="Filtered", title_fontsize="18", fontsize="15")
         plt.xlabel("t-SNE Dimension 1", fontsize=18)
         plt.ylabel("t-SNE Dimension 2", fontsize=18)
@@ -112,6 +181,7 @@ class TsnePlotter_featurecolor:
         remove_error_values=True,
         use_colorbar=True,
         simplify_fritz=False,
+        raster=False,
     ):
         df = self.df.copy()
 
@@ -164,18 +234,23 @@ class TsnePlotter_featurecolor:
 
         plt.figure(figsize=(16, 10))
         ax = plt.gca()  # Get the current axes
-        sns.scatterplot(
-            x="tsne-2d-one",
-            y="tsne-2d-two",
-            hue=parameter,
-            palette=assign_palette,
-            data=df,
-            legend=assign_legend,
-            alpha=0.7,
-            ax=ax,
-        )
         if use_colorbar:
             norm = plt.Normalize(df[parameter].min(), df[parameter].max())
+            plot_points(
+                ax,
+                df,
+                parameter,
+                assign_palette,
+                raster=raster,
+                legend=assign_legend,
+                vmin=norm.vmin,
+                vmax=norm.vmax,
+            )
+        else:
+            plot_points(
+                ax, df, parameter, assign_palette, raster=raster, legend=assign_legend
+            )
+        if use_colorbar:
             sm = plt.cm.ScalarMappable(cmap="viridis", norm=norm)
             sm.set_array([])
             cbar = plt.colorbar(sm, ax=ax)
@@ -253,6 +328,7 @@ class TsnePlotter_simbad:
         parameter,
         reorder=True,
         mapping_dict="Default",
+        raster=False,
     ):
         df = self.df.copy()
 
@@ -313,15 +389,8 @@ class TsnePlotter_simbad:
 
         plt.figure(figsize=(16, 10))
         ax = plt.gca()  # Get the current axes
-        sns.scatterplot(
-            x="tsne-2d-one",
-            y="tsne-2d-two",
-            hue=parameter,
-            palette=assign_palette,
-            data=df,
-            legend=assign_legend,
-            alpha=0.7,
-            ax=ax,
+        plot_points(
+            ax, df, parameter, assign_palette, raster=raster, legend=assign_legend
         )
 
         plt.legend(
@@ -338,48 +407,126 @@ class TsnePlotter_simbad:
 
 
 class Tsne_subset:
-    def __init__(self, df):
+    """
+    selections of alerts in the t-SNE map: circle, box, polygon (e.g. from a lasso)
+    and k nearest neighbors, from a KD-tree over the coordinates, built once. The
+    select_* methods return sorted row positions, get_* the matching rows of df
+    """
+
+    def __init__(self, df, x="tsne-2d-one", y="tsne-2d-two"):
         self.df = df
+        self.x = x
+        self.y = y
+        self._tree = None
+        # row positions of the points of the tree
+        self._rows = None
+
+    @property
+    def tree(self):
+        from scipy.spatial import cKDTree
+
+        if self._tree is None:
+            points = np.column_stack(
+                [
+                    self.df[self.x].to_numpy(np.float64),
+                    self.df[self.y].to_numpy(np.float64),
+                ]
+            ).reshape(-1, 2)
+            # alerts without (finite) coordinates aren't on the map
+            self._rows = np.flatnonzero(np.isfinite(points).all(axis=1))
+            self._tree = cKDTree(points[self._rows])
+        return self._tree
+
+    def _ball(self, center, radius):
+        # indices in the tree of the points within radius of center
+        return np.asarray(
+            self.tree.query_ball_point(center, radius, return_sorted=False),
+            dtype=np.int64,
+        )
 
-    def get_circled_alerts(self, center, radius):
-        df = self.df.copy()
-        x_values = df["tsne-2d-one"]
-        y_values = df["tsne-2d-two"]
-        x, y = center[0], center[1]
-        distances = np.sqrt((x_values - x) ** 2 + (y_values - y) ** 2)
-        indices = np.where(distances < radius)
-        subset = df.iloc[indices]
+    def select_circle(self, center, radius):
+        indices = self._ball(center, radius)
+        # strictly inside, as before
+        distances = np.hypot(*(self.tree.data[indices] - np.asarray(center)).T)
+        return np.sort(self._rows[indices[distances < radius]])
+
+    def _select_box(self, x_min, x_max, y_min, y_max):
+        center = ((x_min + x_max) / 2, (y_min + y_max) / 2)
+        # the circle around the box, then the box
+        indices = self._ball(center, np.hypot(x_max - x_min, y_max - y_min) / 2)
+        points = self.tree.data[indices]
+        inside = (
+            (points[:, 0] >= x_min)
+            & (points[:, 0] <= x_max)
+            & (points[:, 1] >= y_min)
+            & (points[:, 1] <= y_max)
+        )
+        return indices[inside]
+
+    def select_box(self, x_min, x_max, y_min, y_max):
+        return np.sort(self._rows[self._select_box(x_min, x_max, y_min, y_max)])
+
+    def select_polygon(self, vertices):
+        from matplotlib.path import Path
+
+        vertices = np.asarray(vertices, dtype=np.float64)
+        (x_min, y_min), (x_max, y_max) = vertices.min(axis=0), vertices.max(axis=0)
+        indices = self._select_box(x_min, x_max, y_min, y_max)
+        if len(indices) == 0:
+            return self._rows[indices]
+        inside = Path(vertices).contains_points(self.tree.data[indices])
+        return np.sort(self._rows[indices[inside]])
+
+    def select_nearest(self, point, k=10):
+        """
+        rows of the k alerts closest to point, closest first, and their distances
+        """
+        k = min(k, self.tree.n)
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        distances, indices = self.tree.query(point, k=k)
+        return self._rows[np.atleast_1d(indices)], np.atleast_1d(distances)
+
+    def get_rows(self, rows):
+        subset = self.df.iloc[rows]
         print(f"Number of alerts selected: {len(subset)}")
         return subset
 
+    def get_circled_alerts(self, center, radius):
+        return self.get_rows(self.select_circle(center, radius))
+
+    def get_boxed_alerts(self, x_min, x_max, y_min, y_max):
+        return self.get_rows(self.select_box(x_min, x_max, y_min, y_max))
+
+    def get_polygon_alerts(self, vertices):
+        return self.get_rows(self.select_polygon(vertices))
+
+    def get_nearest_alerts(self, point, k=10):
+        rows, distances = self.select_nearest(point, k)
+        return self.get_rows(rows).assign(tsne_distance=distances)
+
     def plot_selection(
         self,
         center,
         radius,
         filtered_only=True,
+        raster=False,
     ):
-        df = self.df.copy()
+        df = self.df
 
         if filtered_only:
             df = df[df["filtered_bool"] == 1]
             custom_palette = ["#3357FF"]
         else:
-            # shift around df to plot filtered on top of unfiltered
-            tsne_filtered = df[df["filtered_bool"] == 1]
-            tsne_unfiltered = df[df["filtered_bool"] == 0]
-            df = pd.concat([tsne_unfiltered, tsne_filtered])
+            if not raster:
+                # shift around df to plot filtered on top of unfiltered
+                tsne_filtered = df[df["filtered_bool"] == 1]
+                tsne_unfiltered = df[df["filtered_bool"] == 0]
+                df = pd.concat([tsne_unfiltered, tsne_filtered])
             custom_palette = ["#d8dcd6", "#3357FF"]
 
         plt.figure(figsize=(16, 10))
-        sns.scatterplot(
-            x="tsne-2d-one",
-            y="tsne-2d-two",
-            hue="filtered_bool",
-            palette=custom_palette,
-            data=df,
-            legend="full",
-            alpha=0.7,
-        )
+        plot_points(plt.gca(), df, "filtered_bool", custom_palette, raster=raster)
 
         # Plot a circle
         circle = plt.Circle(center, radius, color="red", fill=False, linewidth=2)
@@ -0,0 +1,151 @@
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+from queue import Empty
+
+import numpy as np
+from tsne_utils import (
+    EMBEDDING_BACKENDS,
+    alert_preprocessor,
+    get_embedding_backend,
+    prep_TSNE,
+)
+
+
+def load_benchmark_data(args, nb_rows):
+    """
+    PCA components of alerts if alerts_path is given, clusters of points otherwise
+    """
+    if args.alerts_path:
+        df = alert_preprocessor(path=args.alerts_path, drb_cut=0).preprocess_data()
+        data = prep_TSNE(df, use_PCA=True, pca_ncomp=args.dimensions).prep_data()
+        rng = np.random.default_rng(args.seed)
+        return data[rng.integers(0, len(data), nb_rows)]
+    from sklearn.datasets import make_blobs
+
+    data, _ = make_blobs(
+        n_samples=nb_rows,
+        n_features=args.dimensions,
+        centers=20,
+        random_state=args.seed,
+    )
+    return data.astype(np.float32)
+
+
+def run_backend(args, backend, nb_rows, queue):
+    """
+    fit (and transform new points) in a child process, to measure its peak memory
+    (data included)
+    """
+    try:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        data = load_benchmark_data(args, nb_rows + args.nb_new)
+        model = get_embedding_backend(
+            backend,
+            perplexity=args.perplexity,
+            max_iter=args.max_iter,
+            n_jobs=args.n_jobs,
+        )
+        start = time.perf_counter()
+        model.fit_transform(data[:nb_rows])
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        model.transform(data[nb_rows:])
+        transform_time = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        queue.put(
+            {
+                "fit_s": round(fit_time, 3),
+                "transform_s": round(transform_time, 3),
+                # ru_maxrss is in KB on linux
+                "peak_mb": round((peak - baseline) / 1024, 1),
+            }
+        )
+    except ImportError as e:
+        queue.put({"error": f"not installed ({e.name})"})
+    except Exception as e:
+        queue.put({"error": str(e)})
+
+
+def wait_for_result(process, queue, poll=1.0):
+    """
+    result the child put in the queue, or an error if it died without one (e.g.
+    killed when running out of memory) instead of waiting forever
+    """
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Empty:
+            if not process.is_alive():
+                # what it put in the queue right before exiting may still be in transit
+                try:
+                    return queue.get(timeout=poll)
+                except Empty:
+                    return {"error": f"process exited with code {process.exitcode}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the embedding backends.")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=list(EMBEDDING_BACKENDS),
+        help="Backends to benchmark",
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[1000, 5000, 20000],
+        help="Number of points of the reference maps",
+    )
+    parser.add_argument(
+        "--nb_new", type=int, default=1000, help="Number of points to transform"
+    )
+    parser.add_argument(
+        "--alerts_path",
+        type=str,
+        default=None,
+        help="Alerts to sample the points from (clusters of random points if not "
+        "given)",
+    )
+    parser.add_argument(
+        "--dimensions", type=int, default=40, help="Dimensions (PCA components)"
+    )
+    parser.add_argument("--perplexity", type=float, default=30, help="Perplexity")
+    parser.add_argument(
+        "--max_iter", type=int, default=1000, help="Number of iterations"
+    )
+    parser.add_argument(
+        "--n_jobs", type=int, default=8, help="Number of jobs to run in parallel"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--results_path",
+        type=str,
+        default=None,
+        help="File to append the results to (JSON lines)",
+    )
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    for nb_rows in args.sizes:
+        for backend in args.backends:
+            queue = context.Queue()
+            process = context.Process(
+                target=run_backend, args=(args, backend, nb_rows, queue)
+            )
+            process.start()
+            result = wait_for_result(process, queue)
+            process.join()
+            result = {"backend": backend, "nb_rows": nb_rows, **result}
+            print(json.dumps(result))
+            if args.results_path:
+                with open(args.results_path, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,14 @@
 import argparse
-from tsne_utils import alert_preprocessor, prep_TSNE, tSNE
+import os
+from tsne_utils import (
+    EmbeddingCache,
+    alert_preprocessor,
+    embedding_frame,
+    prep_TSNE,
+    save_embedding,
+    streaming_prep_TSNE,
+    tSNE,
+)
 
 
 def main():
@@ -55,9 +64,101 @@ def main():
     parser.add_argument(
         "--save_path", type=str, default="default", help="Path to save t-SNE results"
     )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="sklearn",
+        choices=["sklearn", "opentsne", "umap"],
+        help="Embedding backend (opentsne and umap need openTSNE / umap-learn "
+        "installed). With --reference_model, opentsne and umap optimize the new "
+        "alerts into the map, while sklearn only interpolates them: each is placed "
+        "at the distance-weighted mean of its 10 nearest reference alerts",
+    )
+    parser.add_argument(
+        "--save_model",
+        type=str,
+        default=None,
+        help="Path to save the map (and its scaler/PCA), to add other nights to it",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Stream the alerts (alerts_path can be a directory of nights) to fit "
+        "the scaler and PCA, and only embed a stratified subsample of them",
+    )
+    parser.add_argument(
+        "--sample_fraction",
+        type=float,
+        default=0.1,
+        help="With --streaming, fraction of the alerts that neither passed a filter "
+        "nor were saved to keep (in [0, 1])",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=65536,
+        help="With --streaming, number of alerts per batch",
+    )
+    parser.add_argument(
+        "--reference_model",
+        type=str,
+        default=None,
+        help="Path of a map saved with --save_model, to embed the alerts into it "
+        "instead of computing a new one",
+    )
+    parser.add_argument(
+        "--similarity_index",
+        type=str,
+        default=None,
+        help="Directory to save an index of the alerts (of their PCA / scaled "
+        "features) to search for similar alerts in",
+    )
+    parser.add_argument(
+        "--cache_directory",
+        type=str,
+        default="../example_data/embeddings",
+        help="Directory of the embeddings already computed, loaded instead of "
+        "recomputed if the alerts and parameters are the same (empty to disable, not "
+        "loaded with --save_model or --similarity_index)",
+    )
 
     args = parser.parse_args()
 
+    # the embedding only depends on the alerts and these parameters
+    parameters = {
+        key: value
+        for key, value in vars(args).items()
+        if key
+        not in [
+            "alerts_path",
+            "n_jobs",
+            "save_path",
+            "save_model",
+            "similarity_index",
+            "cache_directory",
+        ]
+    }
+    if args.reference_model:
+        # the projected alerts are saved on their own, never over the map
+        if os.path.abspath(args.save_path) == os.path.abspath(args.reference_model):
+            raise ValueError(
+                f"--save_path {args.save_path} would overwrite the reference map"
+            )
+        parameters["reference_model"] = EmbeddingCache.dataset_version(
+            args.reference_model
+        )
+    cache = EmbeddingCache(args.cache_directory)
+    key = cache.key(args.alerts_path, parameters) if args.cache_directory else None
+    # the model and the similarity index are built along the embedding, a cached
+    # embedding doesn't come with them
+    if key is not None and not (args.save_model or args.similarity_index):
+        embedding = cache.load(key)
+        if embedding is not None:
+            print(f"loaded cached embedding {cache.path(key)}")
+            if args.save_path and args.save_path != "default":
+                save_embedding(embedding, args.save_path, parameters)
+            return embedding
+
     preprocessor = alert_preprocessor(
         path=args.alerts_path,
         drb_cut=args.drb_cut,
@@ -65,23 +166,68 @@ def main():
         custom_columns=args.custom_columns,
         remove_instrumental=args.remove_instrumental,
     )
-    df = preprocessor.preprocess_data()
-    print("loaded data")
+    reference = tSNE.load_model(args.reference_model) if args.reference_model else {}
+    if args.streaming:
+        prep = streaming_prep_TSNE(
+            args.alerts_path,
+            preprocessor,
+            use_PCA=args.use_PCA,
+            pca_ncomp=args.pca_components,
+            sample_fraction=args.sample_fraction,
+            batch_size=args.batch_size,
+            scaler=reference.get("scaler"),
+            pca=reference.get("pca"),
+            columns=reference.get("columns"),
+        )
+        data, meta = prep.prep_data()
+        print(f"streamed data : kept {len(meta)} alerts")
+    else:
+        df = preprocessor.preprocess_data()
+        print("loaded data")
+        meta = df[[c for c in ["objectId", "candid", "ra", "dec"] if c in df.columns]]
 
-    prep = prep_TSNE(df, use_PCA=args.use_PCA, pca_ncomp=args.pca_components)
-    data = prep.prep_data()
+        prep = prep_TSNE(
+            df,
+            use_PCA=args.use_PCA,
+            pca_ncomp=args.pca_components,
+            scaler=reference.get("scaler"),
+            pca=reference.get("pca"),
+            columns=reference.get("columns"),
+        )
+        data = prep.prep_data()
     print("prepared data : doing tsne")
 
+    if args.similarity_index:
+        from alert_similarity import SimilarityIndex
+
+        SimilarityIndex.build(data, meta).save(args.similarity_index)
+        print(f"saved similarity index {args.similarity_index}")
+
     tsne = tSNE(
         data,
         perplexity=args.perplexity,
         max_iter=args.max_iter,
         method=args.method,
         n_jobs=args.n_jobs,
-        save_path=args.save_path,
+        # the cache has the results, unless they're saved somewhere else
+        save_path=None
+        if key is not None and args.save_path == "default"
+        else args.save_path,
+        backend=reference.get("backend", args.backend),
+        meta=meta,
     )
-    tsne.get_tsne()
+    if args.reference_model:
+        tsne.model = reference["model"]
+        tsne_results = tsne.transform(data, save_path=tsne.save_path)
+    else:
+        tsne_results = tsne.get_tsne()
+    if args.save_model:
+        tsne.save_model(args.save_model, prep)
+    embedding = embedding_frame(tsne_results, meta)
+    if key is not None:
+        print(f"saved embedding {cache.save(key, embedding, parameters)}")
     print("done tsne")
+    return embedding
 
 
 if __name__ == "__main__":
@@ -1,13 +1,96 @@
 import pandas as pd
 import numpy as np
+import hashlib
+import json
+import os
 import pickle
-from astropy.coordinates import SkyCoord
-import astropy.units as u
+import pyarrow as pa
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
 from datetime import datetime
 
+# north galactic pole (J2000)
+NGP_RA = 192.85948
+NGP_DEC = 27.12825
+
+# filters that aren't in use or test filters
+REMOVED_FILTERS = [
+    20,
+    55,
+    63,
+    64,
+    65,
+    66,
+    67,
+    68,
+    69,
+    70,
+    71,
+    74,
+    75,
+    76,
+    79,
+    81,
+    89,
+    90,
+    100,
+    102,
+    103,
+    106,
+    1159,
+    1162,
+    1163,
+    1164,
+    1168,
+    1181,
+]
+
+
+def galactic_latitude(ra, dec):
+    """
+    galactic latitude (degrees) of equatorial coordinates (degrees), from the
+    rotation to the galactic frame, without building astropy coordinates
+    """
+    ra, dec = np.radians(ra), np.radians(dec)
+    ngp_ra, ngp_dec = np.radians(NGP_RA), np.radians(NGP_DEC)
+    sin_b = np.sin(dec) * np.sin(ngp_dec) + np.cos(dec) * np.cos(ngp_dec) * np.cos(
+        ra - ngp_ra
+    )
+    return np.degrees(np.arcsin(np.clip(sin_b, -1, 1)))
+
+
+# labels, not used for training
+TRAINING_DROP_COLUMNS = [
+    "objectId",
+    "candid",
+    "fid",
+    "passed_filters",
+    "fritz_classification",
+    "simbad_classification",
+    "scope_classification",
+    "sdss_match",
+    "filtered_bool",
+    "number_filtered",
+    "class",
+    "acai",
+    "catnorth",
+    "gaia",
+    "ra",
+    "dec",
+]
+
+# kept along with the subsampled alerts of streaming_prep_TSNE, to label the plots
+META_COLUMNS = [
+    "objectId",
+    "candid",
+    "candidate.jd",
+    "candidate.ra",
+    "candidate.dec",
+    "passed_filters",
+    "groups",
+]
+
 
 class alert_preprocessor:
     def __init__(
@@ -39,59 +122,54 @@ class alert_preprocessor:
         """
         if arr.size == 0:
             return arr
-        remove_values = {
-            20,
-            55,
-            63,
-            64,
-            65,
-            66,
-            67,
-            68,
-            69,
-            70,
-            71,
-            74,
-            75,
-            76,
-            79,
-            81,
-            89,
-            90,
-            100,
-            102,
-            103,
-            106,
-            1159,
-            1162,
-            1163,
-            1164,
-            1168,
-            1181,
-        }
-        mask = np.vectorize(lambda x: x not in remove_values)(arr)
-        return arr[mask]
+        return arr[~np.isin(arr, REMOVED_FILTERS)]
 
-    def parameter_modifications(self, df):
-        # add age parameter
-        df["age"] = df["candidate.jd"] - df["candidate.jdstarthist"]
-        df["lastobs"] = df["candidate.jd"] - df["candidate.jdendhist"]
-        # use ra and dec to get galactic latitude
-        ra = df["candidate.ra"]
-        dec = df["candidate.dec"]
-        coords = SkyCoord(
-            ra=ra.values * u.degree, dec=dec.values * u.degree, frame="icrs"
+    def remove_filters_column(self, passed_filters):
+        """
+        remove_filters on all the alerts at once: one np.isin over the flattened
+        filters, then the lists are rebuilt from the new offsets
+        """
+        lists = pa.array(passed_filters.values, from_pandas=True)
+        if not pa.types.is_list(lists.type) and not pa.types.is_large_list(lists.type):
+            return passed_filters.apply(self.remove_filters)
+        values = lists.flatten().to_numpy(zero_copy_only=False)
+        rows = lists.value_parent_indices().to_numpy(zero_copy_only=False)
+        keep = ~np.isin(values, REMOVED_FILTERS)
+        counts = np.bincount(rows[keep], minlength=len(lists))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+        filtered = pa.ListArray.from_arrays(
+            pa.array(offsets), pa.array(values[keep]), mask=lists.is_null()
         )
-        galactic_coords = coords.galactic
-        galactic_latitudes = galactic_coords.b.deg
-        df["galactic_latitude"] = galactic_latitudes
-        # parameter reformatting
-        df["candidate.isdiffpos"] = df["candidate.isdiffpos"].map({"f": 0, "t": 1})
-        if self.edit_filters:
-            df["filtered_bool"] = df["passed_filters"].apply(
-                lambda x: 0 if len(x) == 0 else 1
+        return pd.Series(
+            filtered.to_pandas(), index=passed_filters.index, name=passed_filters.name
+        )
+
+    def parameter_modifications(self, df):
+        """
+        derived columns, all computed from the numpy columns and added at once
+        """
+        jd = df["candidate.jd"].to_numpy(dtype=np.float64)
+        isdiffpos = df["candidate.isdiffpos"].to_numpy()
+        derived = {
+            # add age parameter
+            "age": jd - df["candidate.jdstarthist"].to_numpy(dtype=np.float64),
+            "lastobs": jd - df["candidate.jdendhist"].to_numpy(dtype=np.float64),
+            # parameter reformatting
+            "candidate.isdiffpos": np.select(
+                [isdiffpos == "f", isdiffpos == "t"], [0.0, 1.0], default=np.nan
+            ),
+        }
+        # use ra and dec to get galactic latitude, unless the data already has it
+        if "galactic_latitude" not in df.columns:
+            derived["galactic_latitude"] = galactic_latitude(
+                df["candidate.ra"].to_numpy(dtype=np.float64),
+                df["candidate.dec"].to_numpy(dtype=np.float64),
             )
-        return df
+        if self.edit_filters:
+            derived["filtered_bool"] = (
+                df["passed_filters"].str.len().fillna(0).to_numpy() > 0
+            ).astype(int)
+        return df.assign(**derived)
 
     def edit_columns(self, df, custom_columns=False, remove_instrumental=True):
         """
@@ -164,11 +242,18 @@ class alert_preprocessor:
         return df
 
     def preprocess_data(self):
-        df = self.load_data()
+        return self.preprocess_batch(self.load_data())
+
+    def preprocess_batch(self, df):
+        """
+        preprocess loaded alerts, the whole file or a batch of it
+        """
         if self.edit_filters:
+            df = df.assign(
+                passed_filters=self.remove_filters_column(df["passed_filters"])
+            )
             if self.filtered_only:
-                df = df[df["filtered_bool"] == 1]
-            df["passed_filters"] = df["passed_filters"].apply(self.remove_filters)
+                df = df[df["passed_filters"].str.len().fillna(0) > 0]
         df = df[df["candidate.drb"] > self.drb_cut]  # cut likely bogus alerts
         df = self.parameter_modifications(df)
         df = self.edit_columns(
@@ -180,44 +265,39 @@ class alert_preprocessor:
 
 
 class prep_TSNE:
-    def __init__(self, df, use_PCA=True, pca_ncomp=40):
+    def __init__(
+        self, df, use_PCA=True, pca_ncomp=40, scaler=None, pca=None, columns=None
+    ):
+        """
+        scaler, pca, columns: fitted on a reference map (see tSNE.save_model), to
+        prepare new alerts the same way instead of fitting them again
+        """
         self.df = df
         self.use_PCA = use_PCA
         self.pca_ncomp = pca_ncomp
+        self.scaler = scaler
+        self.pca = pca
+        self.columns = columns
 
     def drop_for_training(self):
         """
         drop labels for training
         """
-        self.df = self.df.drop(
-            columns=[
-                "objectId",
-                "candid",
-                "fid",
-                "passed_filters",
-                "fritz_classification",
-                "simbad_classification",
-                "scope_classification",
-                "sdss_match",
-                "filtered_bool",
-                "number_filtered",
-                "class",
-                "acai",
-                "catnorth",
-                "gaia",
-                "ra",
-                "dec",
-            ],
-            errors="ignore",
-        )
+        self.df = self.df.drop(columns=TRAINING_DROP_COLUMNS, errors="ignore")
         return self.df
 
     def normalize_data(self):
         """
         normalize the data with z-score transformation
         """
-        scaler = StandardScaler()
-        data_scaled = scaler.fit_transform(self.df)
+        if self.columns is not None:
+            self.df = self.df[self.columns]
+        self.columns = list(self.df.columns)
+        if self.scaler is None:
+            self.scaler = StandardScaler()
+            data_scaled = self.scaler.fit_transform(self.df)
+        else:
+            data_scaled = self.scaler.transform(self.df)
         self.df = pd.DataFrame(data_scaled, columns=self.df.columns)
         return self.df
 
@@ -225,23 +305,379 @@ class prep_TSNE:
         """
         perform PCA transformation
         """
-        pca = PCA(n_components=self.pca_ncomp)
-        pca_result = pca.fit_transform(self.df)
+        if self.pca is not None:
+            return self.pca.transform(self.df)
+        self.pca = PCA(n_components=self.pca_ncomp)
+        pca_result = self.pca.fit_transform(self.df)
         print(
-            f"Cumulative explained variation for {self.pca_ncomp} principal components: {np.sum(pca.explained_variance_ratio_)}"
+            f"Cumulative explained variation for {self.pca_ncomp} principal "
+            f"components: {np.sum(self.pca.explained_variance_ratio_)}"
         )
         return pca_result
 
     def prep_data(self):
         self.df = self.drop_for_training()
         self.df = self.normalize_data()
-        if self.use_PCA:
+        if self.use_PCA or self.pca is not None:
             data = self.get_pca()
         else:
             data = self.df
         return data
 
 
+class streaming_prep_TSNE:
+    """
+    prep_TSNE for datasets too large to hold in memory (e.g. many nights): record
+    batches are streamed from the files to fit the scaler and an IncrementalPCA,
+    and only a stratified subsample is kept: all the filtered/saved alerts, and a
+    fraction of the others, each weighted by the inverse of its sampling rate
+    """
+
+    def __init__(
+        self,
+        paths,
+        preprocessor,
+        use_PCA=True,
+        pca_ncomp=40,
+        sample_fraction=0.1,
+        batch_size=65536,
+        seed=0,
+        scaler=None,
+        pca=None,
+        columns=None,
+    ):
+        """
+        paths: files or directories of datasets saved by frigate
+        preprocessor: alert_preprocessor applied to each batch
+        use_PCA: if False (and no pca is given), the scaled features are embedded
+        sample_fraction: in [0, 1], 0 to only keep the filtered/saved alerts
+        scaler, pca, columns: fitted on a reference map (see tSNE.save_model)
+        """
+        # requires the root of the repository in the PYTHONPATH
+        from frigate.utils.datasets import list_datasets
+
+        if not 0 <= sample_fraction <= 1:
+            raise ValueError(
+                f"Invalid sample_fraction: {sample_fraction}, must be in [0, 1]"
+            )
+        self.paths = list_datasets([paths] if isinstance(paths, str) else paths)
+        self.preprocessor = preprocessor
+        self.use_PCA = use_PCA
+        self.pca_ncomp = pca_ncomp
+        self.sample_fraction = sample_fraction
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.scaler = scaler
+        self.pca = pca
+        self.columns = columns
+        self.meta = None
+
+    def iter_batches(self):
+        """
+        (features as float32, raw alerts, whether they are always kept) of each
+        batch of the datasets
+        """
+        from frigate.utils.datasets import iter_record_batches
+
+        for path in self.paths:
+            for batch in iter_record_batches(path, batch_size=self.batch_size):
+                raw = batch.to_pandas()
+                df = self.preprocessor.preprocess_batch(raw)
+                # after the preprocessing, which may have removed some filters
+                kept = self.strata(df)
+                df = df.drop(columns=TRAINING_DROP_COLUMNS, errors="ignore")
+                if self.columns is None:
+                    self.columns = list(df.select_dtypes("number").columns)
+                features = df.reindex(columns=self.columns).to_numpy(dtype=np.float32)
+                yield features, raw.loc[df.index], kept
+
+    def strata(self, df):
+        """
+        whether each (preprocessed) alert passed a filter or was saved, so it is
+        always kept
+        """
+        kept = np.zeros(len(df), dtype=bool)
+        for column in ["passed_filters", "groups"]:
+            if column in df.columns:
+                kept |= df[column].str.len().fillna(0).to_numpy() > 0
+        return kept
+
+    def scale(self, features):
+        # missing values end up at the mean
+        return np.nan_to_num(self.scaler.transform(features)).astype(np.float32)
+
+    def prep_data(self):
+        """
+        PCA components (or scaled features, without PCA) of the subsampled alerts,
+        and their meta columns with a weight
+        """
+        from sklearn.decomposition import IncrementalPCA
+
+        # first pass: scaler, and subsample
+        fit_scaler = self.scaler is None
+        if fit_scaler:
+            self.scaler = StandardScaler()
+        # with a fraction of 0, only the alerts that are always kept are sampled
+        weight = 1 / self.sample_fraction if self.sample_fraction > 0 else 1.0
+        samples, metas = [], []
+        for features, raw, always in self.iter_batches():
+            if len(features) == 0:
+                continue
+            if fit_scaler:
+                self.scaler.partial_fit(features)
+            sampled = always | (self.rng.random(len(raw)) < self.sample_fraction)
+            samples.append(features[sampled])
+            meta = raw.loc[sampled, [c for c in META_COLUMNS if c in raw.columns]]
+            metas.append(
+                meta.assign(
+                    weight=np.where(always[sampled], 1.0, weight),
+                    filtered_or_saved=always[sampled],
+                )
+            )
+
+        self.meta = pd.concat(metas, ignore_index=True)
+        if self.pca is not None:
+            return self.pca.transform(self.scale(np.concatenate(samples))), self.meta
+        if not self.use_PCA:
+            return self.scale(np.concatenate(samples)), self.meta
+
+        # second pass: PCA, fitted on batches of at least pca_ncomp alerts
+        self.pca = IncrementalPCA(n_components=self.pca_ncomp)
+        pending = []
+        for features, _, _ in self.iter_batches():
+            pending.append(features)
+            if sum(len(f) for f in pending) >= max(self.pca_ncomp, self.batch_size):
+                self.pca.partial_fit(self.scale(np.concatenate(pending)))
+                pending = []
+        remaining = sum(len(f) for f in pending)
+        # a last batch smaller than pca_ncomp can't be fitted, it is left out
+        if remaining >= self.pca_ncomp or not hasattr(self.pca, "components_"):
+            self.pca.partial_fit(self.scale(np.concatenate(pending)))
+        print(
+            f"Cumulative explained variation for {self.pca_ncomp} principal "
+            f"components: {np.sum(self.pca.explained_variance_ratio_)}"
+        )
+
+        data = self.pca.transform(self.scale(np.concatenate(samples)))
+        return data.astype(np.float32), self.meta
+
+
+# embedding backends: fit_transform() a reference map, transform() new alerts into it
+
+
+class SklearnEmbedding:
+    """
+    scikit-learn t-SNE (Barnes-Hut or exact). It has no transform: new points are
+    placed at the distance-weighted mean of their nearest reference points
+    """
+
+    def __init__(self, perplexity=60, max_iter=2000, method="barnes_hut", n_jobs=8):
+        self.perplexity = perplexity
+        self.max_iter = max_iter
+        self.method = method
+        self.n_jobs = n_jobs
+        self.reference = None
+        self.embedding = None
+        self.neighbors = None
+
+    def fit_transform(self, data):
+        tsne = TSNE(
+            n_components=2,
+            verbose=0,
+            perplexity=self.perplexity,
+            max_iter=self.max_iter,
+            method=self.method,
+            n_jobs=self.n_jobs,
+        )
+        self.reference = np.asarray(data, dtype=np.float32)
+        self.embedding = tsne.fit_transform(data)
+        self.neighbors = None
+        return self.embedding
+
+    def transform(self, data, n_neighbors=10):
+        from sklearn.neighbors import NearestNeighbors
+
+        if self.neighbors is None:
+            self.neighbors = NearestNeighbors(n_jobs=self.n_jobs).fit(self.reference)
+        distances, indexes = self.neighbors.kneighbors(
+            np.asarray(data, dtype=np.float32), n_neighbors=n_neighbors
+        )
+        weights = 1 / np.maximum(distances, 1e-12)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum("ij,ijk->ik", weights, self.embedding[indexes])
+
+    def __getstate__(self):
+        # the neighbors index is rebuilt when needed
+        return {**self.__dict__, "neighbors": None}
+
+
+class OpenTSNEEmbedding:
+    """
+    openTSNE's FFT-accelerated t-SNE (FIt-SNE), which scales to millions of points
+    and optimizes new points into the reference map (pip install openTSNE)
+    """
+
+    def __init__(self, perplexity=60, max_iter=750, n_jobs=8):
+        self.perplexity = perplexity
+        self.max_iter = max_iter
+        self.n_jobs = n_jobs
+        self.embedding = None
+
+    def fit_transform(self, data):
+        from openTSNE import TSNE as OpenTSNE
+
+        tsne = OpenTSNE(
+            n_components=2,
+            perplexity=self.perplexity,
+            n_iter=self.max_iter,
+            negative_gradient_method="fft",
+            n_jobs=self.n_jobs,
+        )
+        self.embedding = tsne.fit(np.asarray(data, dtype=np.float64))
+        return np.asarray(self.embedding)
+
+    def transform(self, data):
+        return np.asarray(self.embedding.transform(np.asarray(data, dtype=np.float64)))
+
+
+class UMAPEmbedding:
+    """
+    UMAP (pip install umap-learn), whose transform() embeds new points
+    """
+
+    def __init__(self, n_neighbors=30, min_dist=0.1, max_iter=None, n_jobs=8):
+        self.n_neighbors = n_neighbors
+        self.min_dist = min_dist
+        self.max_iter = max_iter
+        self.n_jobs = n_jobs
+        self.model = None
+
+    def fit_transform(self, data):
+        from umap import UMAP
+
+        self.model = UMAP(
+            n_components=2,
+            n_neighbors=self.n_neighbors,
+            min_dist=self.min_dist,
+            n_epochs=self.max_iter,
+            n_jobs=self.n_jobs,
+        )
+        return self.model.fit_transform(data)
+
+    def transform(self, data):
+        return self.model.transform(data)
+
+
+EMBEDDING_BACKENDS = {
+    "sklearn": SklearnEmbedding,
+    "opentsne": OpenTSNEEmbedding,
+    "umap": UMAPEmbedding,
+}
+
+
+def get_embedding_backend(backend, **kwargs):
+    """
+    an embedding backend, with the arguments it accepts among kwargs
+    """
+    import inspect
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {backend}, must be one of {list(EMBEDDING_BACKENDS)}"
+        )
+    backend_class = EMBEDDING_BACKENDS[backend]
+    parameters = inspect.signature(backend_class.__init__).parameters
+    return backend_class(**{k: v for k, v in kwargs.items() if k in parameters})
+
+
+class EmbeddingCache:
+    """
+    embeddings saved as parquet, with the ids and positions of the alerts, named
+    after a hash of the datasets they were computed from (path, size and
+    modification time of each file) and of the parameters used to compute them,
+    so that the same run is loaded instead of recomputed
+    """
+
+    def __init__(self, directory="../example_data/embeddings"):
+        self.directory = directory
+
+    @staticmethod
+    def dataset_version(paths):
+        files = []
+        for path in [paths] if isinstance(paths, str) else paths:
+            if os.path.isdir(path):
+                files.extend(
+                    os.path.join(path, name)
+                    for name in sorted(os.listdir(path))
+                    if name.endswith((".parquet", ".feather", ".csv"))
+                )
+            else:
+                files.append(path)
+        versions = []
+        for path in files:
+            stat = os.stat(path)
+            versions.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+        return versions
+
+    def key(self, paths, parameters):
+        content = json.dumps(
+            {"datasets": self.dataset_version(paths), "parameters": parameters},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+    def path(self, key):
+        return os.path.join(self.directory, f"tsne_{key}.parquet")
+
+    def load(self, key):
+        if not self.directory or not os.path.exists(self.path(key)):
+            return None
+        return pd.read_parquet(self.path(key))
+
+    def save(self, key, embedding, parameters=None):
+        if not self.directory:
+            return None
+        save_embedding(embedding, self.path(key), parameters)
+        return self.path(key)
+
+
+def embedding_frame(tsne_results, meta=None):
+    """
+    the embedding with the ids and positions of the alerts (meta, row-aligned)
+    """
+    frame = pd.DataFrame({"tsne_x": tsne_results[:, 0], "tsne_y": tsne_results[:, 1]})
+    if meta is not None:
+        meta = meta.rename(columns=lambda column: column.removeprefix("candidate."))
+        frame = pd.concat([meta.reset_index(drop=True), frame], axis=1)
+    return frame
+
+
+def save_embedding(embedding, path, parameters=None):
+    """
+    embedding frame as parquet or arrow (feather), with the parameters in its metadata
+    """
+    table = pa.Table.from_pandas(embedding, preserve_index=False)
+    if parameters is not None:
+        table = table.replace_schema_metadata(
+            {
+                **(table.schema.metadata or {}),
+                b"tsne_parameters": json.dumps(parameters, default=str).encode(),
+            }
+        )
+    from frigate.utils.files import atomic_path
+
+    with atomic_path(path) as tmp_path:
+        if path.endswith((".feather", ".arrow")):
+            import pyarrow.feather as feather
+
+            feather.write_feather(table, tmp_path)
+        else:
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, tmp_path)
+
+
 class tSNE:
     def __init__(
         self,
@@ -251,30 +687,79 @@ class tSNE:
         method="barnes_hut",
         n_jobs=8,
         save_path="default",
+        backend="sklearn",
+        meta=None,
     ):
+        """
+        meta: ids and positions of the alerts (rows of pca_result), saved with the embedding
+        """
         self.pca_result = pca_result
         self.perplexity = perplexity
         self.max_iter = max_iter
         self.method = method
         self.n_jobs = n_jobs
         self.save_path = save_path
-
-    def get_tsne(self):
-        tsne = TSNE(
-            n_components=2,
-            verbose=0,
-            perplexity=self.perplexity,
-            max_iter=self.max_iter,
-            method=self.method,
-            n_jobs=self.n_jobs,
+        self.backend = backend
+        self.meta = meta
+        self.model = get_embedding_backend(
+            backend,
+            perplexity=perplexity,
+            max_iter=max_iter,
+            method=method,
+            n_jobs=n_jobs,
         )
-        tsne_results = tsne.fit_transform(self.pca_result)
-        if self.save_path:
-            if self.save_path == "default":
+
+    def save_results(self, tsne_results, save_path=None):
+        """
+        save_path: where to save the results, save_path of the map by default
+        """
+        save_path = save_path or self.save_path
+        if save_path:
+            if save_path == "default":
                 time = datetime.now()
-                tsne_save_path = f"../example_data/tsne_results_{time}.pkl"
+                tsne_save_path = f"../example_data/tsne_results_{time}.parquet"
+            else:
+                tsne_save_path = save_path
+            if tsne_save_path.endswith(".pkl"):
+                with open(tsne_save_path, "wb") as f:
+                    pickle.dump(tsne_results, f)
             else:
-                tsne_save_path = self.save_path
-            with open(tsne_save_path, "wb") as f:
-                pickle.dump(tsne_results, f)
+                save_embedding(embedding_frame(tsne_results, self.meta), tsne_save_path)
+
+    def get_tsne(self):
+        tsne_results = self.model.fit_transform(self.pca_result)
+        self.save_results(tsne_results)
         return tsne_results
+
+    def transform(self, data, save_path=None):
+        """
+        embed new alerts (prepared like the reference ones) into the reference map
+
+        save_path: where to save the projected alerts, not saved by default (the
+        save_path of the map holds the results of the reference alerts)
+        """
+        tsne_results = self.model.transform(data)
+        if save_path:
+            self.save_results(tsne_results, save_path)
+        return tsne_results
+
+    def save_model(self, path, prep=None):
+        """
+        save the map (and the scaler/PCA of prep), to add other nights to it later
+        """
+        with open(path, "wb") as f:
+            pickle.dump(
+                {
+                    "backend": self.backend,
+                    "model": self.model,
+                    "scaler": getattr(prep, "scaler", None),
+                    "pca": getattr(prep, "pca", None),
+                    "columns": getattr(prep, "columns", None),
+                },
+                f,
+            )
+
+    @staticmethod
+    def load_model(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)